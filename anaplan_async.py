@@ -0,0 +1,258 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:        17 Oct 2026
+# @author:        Quinlan Eddy
+# Description:    asyncio client for token management and Anaplan API operations
+# ===============================================================================
+
+
+import time
+import asyncio
+import logging
+import contextlib
+import urllib.parse
+import aiohttp
+import anaplan_oauth
+import endpoints
+import errors
+import retry
+import json_stream
+import metrics
+import rate_limiter
+import records
+import sinks
+import token_provider
+import transport
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+
+# ===  Async Anaplan client  ===
+# Drives many concurrent API calls from one event loop. At most `max_concurrency` requests
+# are in flight at any time. Access tokens come from the same (thread-safe) token provider as
+# the threaded code; the provider is only called off the event loop when a refresh is needed.
+# Use as `async with AsyncAnaplanClient() as client:`
+class AsyncAnaplanClient:
+    def __init__(self, provider=token_provider.default_provider, integration_uri="https://api.anaplan.com/2/0",
+                 max_concurrency=50):
+        self.provider = provider
+        self.integration_uri = integration_uri.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session = None
+
+    async def __aenter__(self):
+        # Connection pool and timeouts follow the `transport` block of `settings.json`
+        settings = transport.get_settings()
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=settings["poolMaxsize"])
+        timeout = aiohttp.ClientTimeout(sock_connect=settings["connectTimeout"], sock_read=settings["readTimeout"])
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+        self._session = None
+
+    # Current access token; a refresh runs in a worker thread so the loop is never blocked
+    async def get_token(self):
+        token = self.provider.current_token()
+        if token is None:
+            token = await asyncio.to_thread(self.provider.get_token)
+        return token
+
+    # Issue an authenticated request and return `(status, body)`, where `body` is the decoded
+    # JSON payload (or text for non-JSON responses)
+    async def request(self, method, uri, headers=None, idempotent=None, **kwargs):
+        async with self._response(method, uri, {'Accept': 'application/json', **(headers or {})},
+                                  idempotent=idempotent, **kwargs) as res:
+            if res.content_type == 'application/json':
+                body = await res.json()
+            else:
+                body = await res.text()
+            return res.status, body
+
+    # Every call goes through here: yields the response once its headers have arrived, for
+    # the caller to read (or stream) the body. Each attempt waits for the endpoint family's
+    # rate limit, goes to the selected regional endpoint and its circuit breaker, and holds a
+    # concurrency slot only while the request is in flight (not while backing off). On
+    # `401 Unauthorized` the token is refreshed once and the request replayed. Transient
+    # failures are retried with the same policy as the threaded transport. `auth=False`
+    # sends no access token (OAuth service calls)
+    @contextlib.asynccontextmanager
+    async def _response(self, method, uri, headers=None, idempotent=None, auth=True, **kwargs):
+        policy = transport.get_retry_policy()
+        data = kwargs.get('data')
+        sent = len(data) if isinstance(data, (bytes, str)) else 0
+        attempt = 0
+
+        while True:
+            attempt += 1
+
+            delay = rate_limiter.reserve(uri)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            async with self._semaphore:
+                token = await self.get_token() if auth else None
+                target = endpoints.resolve(uri)
+                breaker = retry.get_breaker(urllib.parse.urlsplit(target).netloc)
+                breaker.before_request()
+
+                start = time.perf_counter()
+                metrics.IN_FLIGHT.inc()
+                try:
+                    res = await self._session.request(method, target, headers=self._headers(headers, token), **kwargs)
+                    if res.status == 401 and auth:
+                        metrics.observe_request(method, target, res.status, time.perf_counter() - start, sent=sent)
+                        res.release()
+                        logger.info(f'Access token rejected by {uri}, refreshing and replaying the request')
+                        token = await asyncio.to_thread(self.provider.refresh, token)
+                        start = time.perf_counter()
+                        res = await self._session.request(method, target, headers=self._headers(headers, token),
+                                                          **kwargs)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as err:
+                    metrics.IN_FLIGHT.dec()
+                    metrics.observe_request(method, target, "error", time.perf_counter() - start)
+                    breaker.record_failure()
+                    # Only a connection that was never established is safe to retry for any
+                    # method; a read timeout (`SocketTimeoutError`) may follow a request the
+                    # server has already acted on
+                    connect_failed = isinstance(err, (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError))
+                    if attempt >= policy.max_attempts or not (policy.is_idempotent(method, idempotent) or connect_failed):
+                        raise errors.AnaplanConnectionError(f'{err!r} on {method} {uri}') from err
+                    delay = policy.backoff(attempt)
+                    logger.warning(f'{err!r} on {method} {uri}; retrying in {delay:.1f} seconds (attempt {attempt})')
+                except BaseException:
+                    metrics.IN_FLIGHT.dec()
+                    breaker.release()
+                    raise
+                else:
+                    if res.status >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+
+                    if attempt < policy.max_attempts and policy.retry_on_status(method, res.status, idempotent):
+                        metrics.IN_FLIGHT.dec()
+                        metrics.observe_request(method, target, res.status, time.perf_counter() - start, sent=sent)
+                        res.release()
+                        delay = policy.backoff(attempt, retry_after=res.headers.get('Retry-After'))
+                        logger.warning(f'{res.status} on {method} {uri}; retrying in {delay:.1f} seconds (attempt {attempt})')
+                    else:
+                        try:
+                            yield res
+                        finally:
+                            metrics.IN_FLIGHT.dec()
+                            metrics.observe_request(method, target, res.status, time.perf_counter() - start,
+                                                    sent=sent, received=res.content_length or 0)
+                            res.release()
+                        return
+
+            # Back off without holding a concurrency slot
+            metrics.observe_retry(method, target)
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _headers(headers, token):
+        if token is None:
+            return headers
+        return {**(headers or {}), 'Authorization': 'Bearer ' + token}
+
+    # GET a JSON resource, raising `errors.AnaplanHTTPError` on an unfavorable status code
+    async def get_json(self, uri, **kwargs):
+        status, body = await self.request("GET", uri, **kwargs)
+        if status >= 400:
+            raise errors.AnaplanHTTPError(status=status, uri=uri, details=body)
+        return body
+
+    # Stream a GET response into `sink` (see `sinks.Sink`) in chunks and commit it once the
+    # whole body has arrived. Returns the number of bytes written
+    async def download(self, uri, sink, headers=None, chunk_size=sinks.CHUNK_SIZE):
+        total = 0
+        async with self._response("GET", uri, {'Accept': '*/*', **(headers or {})}) as res:
+            if res.status >= 400:
+                raise errors.AnaplanHTTPError(status=res.status, uri=uri, details=await res.text())
+            with sink:
+                async for chunk in res.content.iter_chunked(chunk_size):
+                    sink.write(chunk)
+                    total += len(chunk)
+        return total
+
+    # Async counterpart of `anaplan_ops.iter_records`: yield the objects of a listing endpoint
+    # as `records` types while the response is still arriving
+    async def iter_records(self, uri, record_type, members=None, chunk_size=65536):
+        key = records.LISTING_KEYS[record_type]
+
+        async with self._response("GET", uri, {'Accept': 'application/json'}) as res:
+            if res.status >= 400:
+                raise errors.AnaplanHTTPError(status=res.status, uri=uri, details=await res.text())
+
+            parser = json_stream.ItemParser(key)
+            if members is not None:
+                parser.members = members
+            async for chunk in res.content.iter_chunked(chunk_size):
+                for item in parser.feed(chunk):
+                    yield record_type.from_json(item)
+            for item in parser.close():
+                yield record_type.from_json(item)
+
+    # === Interface with the Anaplan OAuth service ===
+    # Async equivalent of `anaplan_oauth.anaplan_api` (no access token is sent)
+    async def anaplan_api(self, uri, body={}):
+        get_headers = {
+            'Content-Type': 'application/json',
+            'Accept': 'application/json',
+        }
+        async with self._response("POST", uri, get_headers, auth=False, json=body) as res:
+            if res.status >= 400:
+                raise errors.AnaplanHTTPError(status=res.status, uri=uri, details=await res.text())
+            return await res.json()
+
+    # === Get Workspaces ===
+    async def get_workspaces(self):
+        body = await self.get_json(f'{self.integration_uri}/workspaces')
+        logger.info("List of user workspaces received")
+        return body.get('workspaces', [])
+
+    # === Get Models ===
+    async def get_models(self, workspace_id):
+        body = await self.get_json(f'{self.integration_uri}/workspaces/{workspace_id}/models')
+        return body.get('models', [])
+
+
+# ===  Async refresh task  ===
+# Async counterpart of `anaplan_oauth.refresh_token_thread`: refreshes ahead of expiry until
+# `stop` is set. Run it with `asyncio.create_task(refresh_task(...))`
+async def refresh_task(provider=token_provider.default_provider, stop=None, lifetime_fraction=0.75, jitter=0.1, min_delay=30):
+    stop = stop or asyncio.Event()
+
+    while not stop.is_set():
+        delay = anaplan_oauth.next_refresh_delay(provider.expires_at, lifetime_fraction=lifetime_fraction,
+                                                 jitter=jitter, min_delay=min_delay)
+        logger.info(f'Next token refresh in {delay:.0f} seconds')
+
+        # Sleep until the refresh is due, or until stopped
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=delay)
+            break
+        except asyncio.TimeoutError:
+            pass
+
+        # A failed refresh is logged and retried after `min_delay` rather than ending the task
+        try:
+            await asyncio.to_thread(provider.refresh)
+        except errors.AnaplanError as err:
+            logger.error(f'{err} in async token refresh; retrying in {min_delay} seconds')
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=min_delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+# ===  Async Get Workspaces  ===
+# Async counterpart of `anaplan_ops.get_workspaces`: fetch the workspace list `counter`
+# times concurrently, bounded by the client's concurrency limit
+async def get_workspaces(client, counter):
+    return await asyncio.gather(*(client.get_workspaces() for _ in range(counter)))
@@ -1,21 +1,25 @@
 # ===============================================================================
 # Created:        2 Feb 2023
-# Updated:        30 Jan 2024
+# Updated:        17 Oct 2026
 # @author:        Quinlan Eddy
 # Description:    Module for Anaplan OAuth2 Authentication
 # ===============================================================================
 
 import sys
-import os
 import logging
-import requests
 import json
 import time
+import random
 import threading
-import apsw
-import apsw.ext
+import functools
+import types
+import concurrent.futures
 import jwt
 import globals
+import errors
+import transport
+import token_provider
+import token_store
 
 
 # Enable logger
@@ -25,26 +29,21 @@ logger = logging.getLogger(__name__)
 # Upon success, returns a Device ID and Verification URL
 def get_device_id(uri):
 
-    # Set Body
-    get_body = {
-        "client_id": globals.Auth.client_id,
-        "scope": "openid profile email offline_access"
-    }
-
     try:
         logger.info("Requesting Device ID and Verification URL")
         print("Requesting Device ID and Verification URL")
-        res = anaplan_api(uri=uri, body=get_body)
+        res = request_device_code(uri=uri, client_id=globals.Auth.client_id)
 
         # Set values
         globals.Auth.device_code = res['device_code']
+        globals.Auth.device_interval = int(res.get('interval', DEVICE_POLL_INTERVAL))
+        globals.Auth.device_expires_at = time.time() + int(res.get('expires_in', DEVICE_CODE_LIFETIME))
         logger.info("Device Code successfully received")
         print("Device Code successfully received")
 
-        # Pause for user authentication
+        # `get_tokens` polls until the user has authenticated, so no pause is needed here
         print('Please authenticate with Anaplan using this URL using an incognito browser: ',
               res['verification_uri_complete'])
-        input("Press Enter to continue...")
     except Exception as err:
         print(f'{err} in function "{sys._getframe().f_code.co_name}"')
         logging.error(f'{err} in function "{sys._getframe().f_code.co_name}"')
@@ -52,24 +51,21 @@ def get_device_id(uri):
 
 
 # ===  Step #2 - Device grant   ===
-# Response returns a `access_token` and `refresh_token`
+# Polls until the user has authenticated, then receives the `access_token` and `refresh_token`
 def get_tokens(uri, database):
 
-    # Set Body
-    get_body = {
-        "client_id": globals.Auth.client_id,
-        "device_code": globals.Auth.device_code,
-        "grant_type": "urn:ietf:params:oauth:grant-type:device_code"
-    }
-
     try:
-        logger.info("Requesting OAuth Access Token and Refresh Token")
-        print("Requesting OAuth Access Token and Refresh Token")
-        res = anaplan_api(uri=uri, body=get_body)
+        logger.info("Waiting for the user to authenticate")
+        print("Waiting for authentication in the browser...")
+        res = poll_device_tokens(uri=uri, client_id=globals.Auth.client_id, device_code=globals.Auth.device_code,
+                                 interval=globals.Auth.device_interval,
+                                 expires_in=globals.Auth.device_expires_at - time.time())
 
         # Set values in AuthToken Dataclass
-        globals.Auth.access_token = res['access_token']
-        globals.Auth.refresh_token = res['refresh_token']
+        token_provider.default_provider.set_tokens(
+            access_token=res['access_token'],
+            expires_at=token_expiry(res),
+            refresh_token=res['refresh_token'])
         logger.info("Access Token and Refresh Token received")
         print("Access Token and Refresh Token received")
 
@@ -81,72 +77,184 @@ def get_tokens(uri, database):
         logging.error(f'{err} in function "{sys._getframe().f_code.co_name}"')
         sys.exit(1)
 
-# ===  Step #3 - Device grant  ===
-# Response returns an updated `access_token` and `refresh_token`
-def refresh_tokens(uri, database, delay, rotatable_token):
 
-    # If the refresh_token is not available then read from from the token database
-    if globals.Auth.refresh_token == "none":
-        tokens = read_token_db(database)
+# ===  Device grant polling (RFC 8628)  ===
+# Defaults used when the device code response carries no `interval` / `expires_in`
+DEVICE_GRANT_TYPE = "urn:ietf:params:oauth:grant-type:device_code"
+DEVICE_POLL_INTERVAL = 5
+DEVICE_CODE_LIFETIME = 600
 
-        if tokens['client_id'] == "empty":
-            logger.warning("This client needs to be authorized by Anaplan. Please run this script again with the following arguments: python3 main.py -r -c <<enter Client ID>>. For more information, use the argument `-h`.")
-            print("This client needs to be authorized by Anaplan. Please run this script again with the following arguments: python3 main.py -r -c <<enter Client ID>>. For more information, use the argument `-h`.")
 
-            # Exit with return code 1
-            sys.exit(1)
+# Returns the device code response: `device_code`, `user_code`, `verification_uri(_complete)`,
+# `expires_in` and `interval`
+def request_device_code(uri, client_id, scope="openid profile email offline_access"):
+    return anaplan_api(uri=uri, body={"client_id": client_id, "scope": scope})
 
-        globals.Auth.client_id = tokens['client_id']
-        globals.Auth.refresh_token = tokens['refresh_token']
 
-    # As this is a daemon thread, keep looping until main thread ends
+# Polls the token endpoint every `interval` seconds until the user has approved the device,
+# and returns the token response. `authorization_pending` keeps polling, `slow_down` adds 5
+# seconds to the interval; a denied or expired code, or no approval within `expires_in`
+# seconds, raises `errors.DeviceAuthorizationError`. Setting `stop` (a `threading.Event`)
+# abandons the wait
+def poll_device_tokens(uri, client_id, device_code, interval=DEVICE_POLL_INTERVAL,
+                       expires_in=DEVICE_CODE_LIFETIME, stop=None):
+    get_headers = {
+        'Content-Type': 'application/json',
+        'Accept': 'application/json',
+    }
+    get_body = {
+        "client_id": client_id,
+        "device_code": device_code,
+        "grant_type": DEVICE_GRANT_TYPE
+    }
+    deadline = time.monotonic() + expires_in
+
     while True:
+        # Never poll more often than `interval`, including before the first poll
+        if stop is None:
+            time.sleep(interval)
+        elif stop.wait(interval):
+            raise errors.DeviceAuthorizationError(f'Device authorization for client {client_id} was cancelled')
+        if time.monotonic() >= deadline:
+            raise errors.DeviceAuthorizationError(f'Device code for client {client_id} expired before it was approved')
+
+        # Polling again is harmless, so transient failures may be retried
+        res = transport.post(uri, headers=get_headers, json=get_body, idempotent=True)
+        if res.status_code < 400:
+            return res.json()
+
+        error = _oauth_error(res)
+        if error == "authorization_pending":
+            continue
+        if error == "slow_down":
+            interval += 5
+            logger.info(f'Slowing device polling for client {client_id} to every {interval} seconds')
+            continue
+        if error in ("access_denied", "expired_token"):
+            raise errors.DeviceAuthorizationError(f'Device authorization for client {client_id} failed: {error}')
+        transport.raise_for_status(res)
+
+
+# The `error` code of an OAuth error response, if any
+def _oauth_error(res):
+    try:
+        return res.json().get("error")
+    except ValueError:
+        return None
+
+
+# ===  Register a device  ===
+# Runs the whole device grant for any client without touching `globals.Auth`: requests a
+# device code, hands it to `on_code(client_id, device)` to show the verification URL
+# (printed by default), polls until approved and persists the tokens.
+# Returns `{"access_token", "refresh_token", "expires_at"}`; raises on failure
+def register_device(device_uri, token_uri, database, client_id, region="", user_name="", on_code=None, stop=None):
+    device = request_device_code(uri=device_uri, client_id=client_id)
+    if on_code is None:
+        print(f'{client_id}: authenticate with Anaplan using this URL: {device["verification_uri_complete"]}')
+    else:
+        on_code(client_id, device)
+
+    res = poll_device_tokens(uri=token_uri, client_id=client_id, device_code=device['device_code'],
+                             interval=int(device.get('interval', DEVICE_POLL_INTERVAL)),
+                             expires_in=int(device.get('expires_in', DEVICE_CODE_LIFETIME)), stop=stop)
+    tokens = {
+        "access_token": res['access_token'],
+        "refresh_token": res['refresh_token'],
+        "expires_at": token_expiry(res)
+    }
+    write_tokens(database, client_id=client_id, region=region, user_name=user_name, **tokens)
+    return tokens
+
+
+# ===  Register many devices  ===
+# Registers `clients` (dictionaries with `client_id` and optional `region` and `user_name`)
+# concurrently, with at most `max_workers` pending device codes. Polls mostly wait, so many
+# workers are cheap. Returns one result per client with its latency and either the
+# `expires_at` of its new access token or the `error`
+def register_devices(device_uri, token_uri, database, clients, max_workers=32, on_code=None, stop=None):
+
+    def register_one(client):
+        result = {
+            "client_id": client["client_id"],
+            "region": client.get("region", ""),
+            "user_name": client.get("user_name", ""),
+            "error": None
+        }
+        start = time.perf_counter()
+        try:
+            res = register_device(device_uri, token_uri, database, client_id=result["client_id"],
+                                  region=result["region"], user_name=result["user_name"], on_code=on_code, stop=stop)
+            result["expires_at"] = res['expires_at']
+        except Exception as err:
+            result["error"] = err
+            logger.error(f'{err} while registering client {result["client_id"]}')
+        result["latency"] = time.perf_counter() - start
+        return result
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(register_one, clients))
+
+    failed = [result for result in results if result["error"] is not None]
+    logger.info(f'Registered {len(results) - len(failed)} of {len(results)} clients')
+    return results
+
+# ===  Step #3 - Device grant  ===
+# Response returns an updated `access_token` and `refresh_token`.
+# The refresh is coordinated through the token database so that only one process
+# refreshes at a time; the others pick up the freshly persisted tokens.
+# Raises `errors.AnaplanError` (or a subclass) on failure
+def refresh_tokens(uri, database, rotatable_token, lease_duration=30, wait_timeout=None):
+
+    # Always read the refresh_token from the token database, as another process may have rotated it
+    tokens = read_token_db(database, client_id=getattr(globals.Auth, 'client_id', None))
+
+    if tokens['client_id'] == "empty":
+        logger.warning("This client needs to be authorized by Anaplan. Please run this script again with the following arguments: python3 main.py -r -c <<enter Client ID>>. For more information, use the argument `-h`.")
+        raise errors.AuthorizationRequiredError("This client needs to be authorized by Anaplan. Please run this script again with the following arguments: python3 main.py -r -c <<enter Client ID>>. For more information, use the argument `-h`.")
+
+    globals.Auth.client_id = tokens['client_id']
+
+    def request_tokens(refresh_token):
         get_body = {
             "client_id": globals.Auth.client_id,
-            "refresh_token": globals.Auth.refresh_token,
+            "refresh_token": refresh_token,
             "grant_type": "refresh_token"
         }
-        try:
-            logger.info("Requesting new Token(s)")
-            print("Requesting new Token(s)")
-            res = anaplan_api(uri=uri, body=get_body)
+        logger.info("Requesting new Token(s)")
+        print("Requesting new Token(s)")
+        res = anaplan_api(uri=uri, body=get_body)
 
-            logger.info("Updated Access Token and Refresh Token received")
-            print("Updated Access Token and Refresh Token received")
+        # If the response does not contain a refresh_token key then handle the exception
+        if rotatable_token and 'refresh_token' not in res:
+            raise errors.AnaplanError("Check that `rotatableToken` is set properly in the `settings.json` file and corresponds to the Anaplan OAuth Client settings")
 
-            # Set new Access Token
-            globals.Auth.access_token = res['access_token']
+        return res
 
-            # Set values in AuthToken Dataclass
-            if rotatable_token:
+    try:
+        tokens = coordinated_refresh(database, client_id=globals.Auth.client_id, request_tokens=request_tokens,
+                                     rotatable_token=rotatable_token,
+                                     stale_access_token=getattr(globals.Auth, 'access_token', None) or tokens.get('access_token'),
+                                     lease_duration=lease_duration, wait_timeout=wait_timeout)
+
+        # Set new Access Token, its expiry and the Refresh Token in one update
+        token_provider.default_provider.set_tokens(
+            access_token=tokens['access_token'],
+            expires_at=tokens['expires_at'],
+            refresh_token=tokens['refresh_token'])
+
+        if rotatable_token:
+            logger.info("Updated Access Token and Refresh Token received")
+            print("Updated Access Token and Refresh Token received")
+        else:
+            logger.info("Updated Access Token received")
+            print("Updated Access Token received")
 
-                # If the response does not contain a refresh_token key then handle the exception
-                try:
-                    globals.Auth.refresh_token = res['refresh_token']
-                except KeyError:
-                    logger.info("Check that `rotatableToken` is set properly in the `settings.json` file and corresponds to the Anaplan OAuth Client settings")
-                    print("Check that `rotatableToken` is set properly in the `settings.json` file and corresponds to the Anaplan OAuth Client settings")
-                    sys.exit(1)
-                
-                logger.info("Updated Access Token and Refresh Token received")
-                print("Updated Access Token and Refresh Token received")
-
-                # Persist token values
-                write_token_db(database=database)
-            else:
-                logger.info("Updated Access Token received")
-                print("Updated Access Token received")
-
-            # If delay is set than continue to refresh the token
-            if delay > 0:
-                time.sleep(delay)
-            else:
-                break
+        return globals.Auth.expires_at
 
-        except Exception as err:
-            print(f'{err} in function "{sys._getframe().f_code.co_name}"')
-            logging.error(f'{err} in function "{sys._getframe().f_code.co_name}"')
-            sys.exit(1)
+    except Exception as err:
+        logging.error(f'{err} in function "{sys._getframe().f_code.co_name}"')
+        raise
 
 # ===  Step #1 - Authorization code grant   ===
 # Upon success, returns a Device ID and Verification URL
@@ -160,7 +268,7 @@ def get_auth_code(uri):
     }
     try:
         logger.info("Requesting Device ID and Verification URL")
-        res = requests.get(uri, params=get_params)
+        res = transport.get(uri, params=get_params)
 
         redirect = res.url
 
@@ -194,15 +302,17 @@ def get_auth_tokens(uri, database):
 
     try:
         logger.info("Requesting OAuth Access Token and Refresh Token")
-        res = requests.post(uri, headers=get_headers, json=get_body)
+        res = transport.post(uri, headers=get_headers, json=get_body)
         print (res.text)
 
         # Convert payload to dictionary for parsing
         j_res = json.loads(res.text)
 
         # Set values in globals Dataclass
-        globals.Auth.access_token = j_res['access_token']
-        globals.Auth.refresh_token = j_res['refresh_token']
+        token_provider.default_provider.set_tokens(
+            access_token=j_res['access_token'],
+            expires_at=token_expiry(j_res),
+            refresh_token=j_res['refresh_token'])
         logger.info("Access Token and Refresh Token received")
 
         # Persist token values
@@ -217,89 +327,177 @@ def get_auth_tokens(uri, database):
 
 # ===  Step #3 - Authorization code grant  ===
 # Response returns an updated `access_token` and `refresh_token`
-def refresh_auth_tokens(uri, database, delay):
-    # If the refresh_token is not available then read from `auth.json`
-    if globals.Auth.refresh_token == "none":
-        tokens = read_token_db(database)
+def refresh_auth_tokens(uri, database, lease_duration=30, wait_timeout=None):
+    # Always read the refresh_token from the token database, as another process may have rotated it
+    tokens = read_token_db(database, client_id=getattr(globals.Auth, 'client_id', None))
 
-        if tokens['client_id'] == "empty":
-            logger.warning("This client needs to be authorized by Anaplan. Please run this script again with the following arguments: python3 anaplan.py -r -c <<enter Client ID>>. For more information, use the argument `-h`.")
-            print("This client needs to be authorized by Anaplan. Please run this script again with the following arguments: python3 anaplan.py -r -c <<enter Client ID>>. For more information, use the argument `-h`.")
+    if tokens['client_id'] == "empty":
+        logger.warning("This client needs to be authorized by Anaplan. Please run this script again with the following arguments: python3 anaplan.py -r -c <<enter Client ID>>. For more information, use the argument `-h`.")
+        raise errors.AuthorizationRequiredError("This client needs to be authorized by Anaplan. Please run this script again with the following arguments: python3 anaplan.py -r -c <<enter Client ID>>. For more information, use the argument `-h`.")
 
-            # Exit with return code 1
-            sys.exit(1)
-
-        globals.Auth.client_id = tokens['client_id']
-        globals.Auth.refresh_token = tokens['refresh_token']
+    globals.Auth.client_id = tokens['client_id']
 
     get_headers = {
         'Content-Type': 'application/json',
         'Accept': '*/*',
     }
 
-    # As this is a daemon thread, keep looping until main thread ends
-    while True:
+    def request_tokens(refresh_token):
         get_body = {
             "client_id": globals.Auth.client_id,
             "client_secret": globals.Auth.secret, # required for authorization grant
-            "refresh_token": globals.Auth.refresh_token,
+            "refresh_token": refresh_token,
             "grant_type": "refresh_token"
         }
+        logger.info(
+            "Requesting a new OAuth Access Token and Refresh Token")
+        print("Requesting a new OAuth Access Token and Refresh Token")
+        res = transport.raise_for_status(transport.post(uri, headers=get_headers, json=get_body))
 
-        try:
-            logger.info(
-                "Requesting a new OAuth Access Token and Refresh Token")
-            print("Requesting a new OAuth Access Token and Refresh Token")
-            res = requests.post(uri, headers=get_headers, json=get_body)
+        # Convert payload to dictionary for parsing
+        return json.loads(res.text)
 
-            # Convert payload to dictionary for parsing
-            j_res = json.loads(res.text)
+    try:
+        tokens = coordinated_refresh(database, client_id=globals.Auth.client_id, request_tokens=request_tokens,
+                                     rotatable_token=True,
+                                     stale_access_token=getattr(globals.Auth, 'access_token', None) or tokens.get('access_token'),
+                                     lease_duration=lease_duration, wait_timeout=wait_timeout)
 
-            # Set values in globals Dataclass
-            globals.Auth.access_token = j_res['access_token']
-            globals.Auth.refresh_token = j_res['refresh_token']
-            logger.info("Updated Access Token and Refresh Token received")
+        # Set values in globals Dataclass
+        token_provider.default_provider.set_tokens(
+            access_token=tokens['access_token'],
+            expires_at=tokens['expires_at'],
+            refresh_token=tokens['refresh_token'])
+        logger.info("Updated Access Token and Refresh Token received")
 
-            # Persist token values
-            write_token_db(database)
+        return globals.Auth.expires_at
 
-            # If delay is set than continue to refresh the token
-            if delay > 0:
-                time.sleep(delay)
-            else:
-                break
-        except Exception as err:
-            print(f'{err} in function "{sys._getframe().f_code.co_name}"')
-            logging.error(f'{err} in function "{sys._getframe().f_code.co_name}"')
-            sys.exit(1)
+    except Exception as err:
+        logging.error(f'{err} in function "{sys._getframe().f_code.co_name}"')
+        raise
+
+
+
+# ===  Warm start  ===
+# Reuse the access token persisted by a previous run when it has at least `min_lifetime`
+# seconds left, so startup needs no call to the token endpoint. Returns `True` on success
+def load_cached_tokens(database, min_lifetime=300):
+    tokens = read_token_db(database, client_id=getattr(globals.Auth, 'client_id', None))
+
+    if tokens['client_id'] == "empty" or not tokens.get("access_token"):
+        return False
+    if tokens["expires_at"] - time.time() < min_lifetime:
+        logger.info("Cached Access Token expires too soon to be reused")
+        return False
+
+    globals.Auth.client_id = tokens['client_id']
+    token_provider.default_provider.set_tokens(
+        access_token=tokens['access_token'],
+        expires_at=tokens['expires_at'],
+        refresh_token=tokens['refresh_token'])
+
+    logger.info(f'Reusing cached Access Token valid for another {tokens["expires_at"] - time.time():.0f} seconds')
+    print("Reusing cached Access Token")
+    return True
+
+
+# ===  Token expiry  ===
+# Returns the absolute expiry (epoch seconds) of the access token in a token response.
+# Prefers `expires_in`, then the JWT `exp` claim, then falls back to `globals.Auth.token_ttl`
+def token_expiry(res):
+    if res.get('expires_in'):
+        return time.time() + int(res['expires_in'])
+
+    try:
+        claims = jwt.decode(res['access_token'], options={"verify_signature": False})
+        if 'exp' in claims:
+            return float(claims['exp'])
+    except (KeyError, jwt.exceptions.PyJWTError):
+        pass
+
+    return time.time() + int(globals.Auth.token_ttl)
+
+
+# ===  Refresh schedule  ===
+# Seconds to wait before refreshing a token that expires at `expires_at`.
+# Refreshes after `lifetime_fraction` of the remaining lifetime, pulled forward by up
+# to `jitter` (as a fraction) so that many clients do not refresh in lockstep
+def next_refresh_delay(expires_at, lifetime_fraction=0.75, jitter=0.1, min_delay=30, now=None):
+    if now is None:
+        now = time.time()
+
+    remaining = expires_at - now
+    if remaining <= 0:
+        return 0
+
+    delay = remaining * lifetime_fraction * (1 - random.uniform(0, jitter))
+
+    # Never busy-loop on short-lived tokens, but never wait past expiry either
+    return min(max(delay, min_delay), remaining)
 
 
-    
 # ===  Refresh token class  ===
 # Pass in values to be used with the refresh token function
-# Explicitly set the thread to be a subordinate daemon that will stop processing with main thread
+# Explicitly set the thread to be a subordinate daemon that will stop processing with main thread.
+# Refreshes are scheduled from the access token expiry rather than a fixed delay, and the
+# thread can be woken (`wake()`) or stopped (`stop()`) immediately. Refreshes go through the
+# token provider so they are collapsed with any refresh triggered by a worker thread
 class refresh_token_thread (threading.Thread):
     # Overriding the default `__init__`
-   def __init__(self, thread_id, name, delay, database, uri, rotatable_token):
-      print('Refresh Token', thread_id, uri)
+   def __init__(self, thread_id, name, provider=token_provider.default_provider, lifetime_fraction=0.75, jitter=0.1, min_delay=30):
+      print('Refresh Token', thread_id)
       threading.Thread.__init__(self)
       self.thread_id = thread_id
       self.name = name
-      self.delay = delay
-      self.database = database
-      self.uri = uri
-      self.rotatable_token = rotatable_token
+      self.provider = provider
+      self.lifetime_fraction = lifetime_fraction
+      self.jitter = jitter
+      self.min_delay = min_delay
       self.daemon = True
+      self._wake = threading.Event()
+      self._stopped = threading.Event()
 
    # Overriding the default subfunction `run()`
    def run(self):
       # Initiate the thread
       print("Starting " + self.name)
-      refresh_tokens(uri=self.uri, delay=self.delay, database=self.database, rotatable_token=self.rotatable_token)
+
+      # As this is a daemon thread, keep looping until main thread ends or `stop()` is called
+      while not self._stopped.is_set():
+         delay = next_refresh_delay(self.provider.expires_at, lifetime_fraction=self.lifetime_fraction, jitter=self.jitter, min_delay=self.min_delay)
+         logger.info(f'Next token refresh in {delay:.0f} seconds')
+
+         # Sleep until the refresh is due, or until woken / stopped
+         if delay > 0:
+            self._wake.wait(delay)
+            self._wake.clear()
+         if self._stopped.is_set():
+            break
+
+         # A failed refresh is logged and retried after `min_delay` rather than ending the thread
+         try:
+            self.provider.refresh()
+         except errors.AnaplanError as err:
+            logger.error(f'{err} in thread "{self.name}"; retrying in {self.min_delay} seconds')
+            print(f'Token refresh failed: {err}')
+            self._wake.wait(self.min_delay)
+            self._wake.clear()
+
       print("Exiting " + self.name)
 
+   # Refresh now instead of waiting for the schedule
+   def wake(self):
+      self._wake.set()
+
+   # Stop the thread without waiting for the next scheduled refresh
+   def stop(self):
+      self._stopped.set()
+      self._wake.set()
+
 
 # === Interface with Anaplan REST API   ===
+# Raises `errors.AnaplanHTTPError` for unfavorable status codes (after any retries) and
+# `errors.AnaplanConnectionError` when Anaplan cannot be reached
 def anaplan_api(uri, body={}):
 
     # Set Headers
@@ -308,88 +506,254 @@ def anaplan_api(uri, body={}):
         'Accept': 'application/json',
     }
 
-    res = None
-
     try:
         # POST to the Anaplan REST API to receive OAuth values
-        res = requests.post(uri, headers=get_headers, json=body)
+        res = transport.post(uri, headers=get_headers, json=body)
 
         # Check for unfavorable status codes
-        res.raise_for_status()
+        transport.raise_for_status(res)
 
         # Return a converted payload to a dictionary for direct parsing
         return json.loads(res.text)
 
-    except requests.exceptions.HTTPError as err:
-        print(
-            f'{err} in function "{sys._getframe().f_code.co_name}" with the following details: {err.response.text} - check that `rotatableToken` is set properly in the `settings.json` file and corresponds to the Anaplan OAuth Client settings')
+    except errors.AnaplanHTTPError as err:
         logging.error(
-            f'{err} in function "{sys._getframe().f_code.co_name}" with the following details: {err.response.text} - check that `rotatableToken` is set properly in the `settings.json` file and corresponds to the Anaplan OAuth Client settings')
-        sys.exit(1)
-    except requests.exceptions.RequestException as err:
-        print(f'{err} in function "{sys._getframe().f_code.co_name}"')
+            f'{err} in function "{sys._getframe().f_code.co_name}" - check that `rotatableToken` is set properly in the `settings.json` file and corresponds to the Anaplan OAuth Client settings')
+        raise
+    except errors.AnaplanError as err:
         logging.error(f'{err} in function "{sys._getframe().f_code.co_name}"')
-        sys.exit(1)
-    except Exception as err:
-        print(f'{err} in function "{sys._getframe().f_code.co_name}"')
-        logging.error(f'{err} in function "{sys._getframe().f_code.co_name}"')
-        sys.exit(1)
+        raise
 
 
+# === Read a SQLite database ===
+# Reads the tokens for `client_id`, or for the most recently refreshed client when not set
+def read_token_db(database, client_id=None, region="", user_name=""):
 
-        # === Read a SQLite database ===
+    # Get values from the shared token store
+    row = token_store.get_store(database).read(client_id=client_id, region=region, user_name=user_name)
 
+    if row is None:
+        logger.warning("No tokens stored in the token database")
+        return {"client_id": "empty", "refresh_token": "empty"}
 
-# === Read a SQLite database ===
-def read_token_db(database):
+    return decode_row(row)
 
-    # Initialize variable
-    tokens = {}
 
-    # Check if SQLite database exists
-    if os.path.isfile(database):
-        # Create connection to the existing database
-        connection = apsw.Connection(
-            database, flags=apsw.SQLITE_OPEN_READONLY)
+# === Create or update a SQLite database ===
+def write_token_db(database, region="", user_name=""):
 
-        # Get values
-        for client_id, refresh_token in connection.execute("select client_id, refresh_token from anaplan"):
-            tokens = {"client_id": client_id, "refresh_token": jwt.decode(
-                refresh_token, client_id, algorithms=["HS256"])['refresh_token']}
+    # Upsert the encrypted tokens for this `client_id` in a single transaction
+    write_tokens(database, client_id=globals.Auth.client_id, region=region, user_name=user_name,
+                 refresh_token=globals.Auth.refresh_token,
+                 access_token=getattr(globals.Auth, 'access_token', None),
+                 expires_at=globals.Auth.expires_at)
 
-    else:
-        logger.warning("Database file does not exist")
-        tokens = {"client_id": "empty", "refresh_token": "empty"}
+    logger.info("Tokens updated")
 
-    return tokens
 
+# === Persist the tokens of any client ===
+def write_tokens(database, client_id, refresh_token, access_token=None, expires_at=0, region="", user_name=""):
+    token_store.get_store(database).write(
+        client_id=client_id,
+        refresh_token=encode_token(client_id, "refresh_token", refresh_token),
+        access_token=encode_token(client_id, "access_token", access_token) if access_token else None,
+        expires_at=expires_at,
+        region=region,
+        user_name=user_name)
 
-# === Create or update a SQLite database ===
-def write_token_db(database):
 
-    # Encode
-    encoded_token = jwt.encode(
-        payload={"refresh_token": globals.Auth.refresh_token}, 
-        key=globals.Auth.client_id, 
+# === Encrypt / decrypt stored tokens ===
+def encode_token(client_id, name, value):
+    return jwt.encode(
+        payload={name: value}, 
+        key=client_id, 
         algorithm="HS256")
-    values = (globals.Auth.client_id, encoded_token)
 
-    # Check if SQLite database exists
-    if os.path.isfile(database):
-        # Create connection to the existing database
-        connection = apsw.Connection(
-            database, flags=apsw.SQLITE_OPEN_READWRITE)
-        
-        # Pass to the SQL update statement the `client_id` and `refresh_token` stored in the values
-        connection.execute("update anaplan set client_id=$client_id, refresh_token=$refresh_token", values)
-    else:
-        # Create a new database
-        connection = apsw.Connection(database)
 
-        # Create the database to store the encrypted tokens. 
-        connection.execute("create table if not exists anaplan (client_id, refresh_token)")
+# Decoding is cached per client and encoded value, so a rotated token is decoded once
+@functools.lru_cache(maxsize=1024)
+def decode_token(client_id, name, encoded_token):
+    return jwt.decode(encoded_token, client_id, algorithms=["HS256"])[name]
 
-        # Pass to the SQL insert statement the `client_id` and `refresh_token` stored in the values
-        connection.execute("insert into anaplan values($client_id, $refresh_token)", values)
 
-    logger.info("Tokens updated")
+# Decrypt a row read from the token store
+def decode_row(row):
+    tokens = dict(row)
+    tokens["refresh_token"] = decode_token(row["client_id"], "refresh_token", row["refresh_token"])
+    if row.get("access_token"):
+        tokens["access_token"] = decode_token(row["client_id"], "access_token", row["access_token"])
+    return tokens
+
+
+# === Cross-process refresh coordination ===
+# Refreshes a client while holding its lease in the token database, so exactly one process
+# calls the token endpoint. `request_tokens(refresh_token)` performs the actual request and
+# returns the token response. The lease is renewed every `lease_duration / 3` seconds while
+# the request is in flight, however long its retries take; a lease whose holder died expires
+# after `lease_duration` seconds. If another process holds the lease, wait (up to
+# `wait_timeout` seconds, by default the longest a token request may take, see
+# `transport.max_request_time`) for it to persist a new access token and use that instead.
+# Returns `{"access_token", "refresh_token", "expires_at"}`
+def coordinated_refresh(database, client_id, request_tokens, rotatable_token, stale_access_token=None,
+                        region="", user_name="", lease_duration=30, wait_timeout=None, poll_interval=0.2):
+    store = token_store.get_store(database)
+    holder = token_store.lease_holder()
+    key = {"client_id": client_id, "region": region, "user_name": user_name}
+    if wait_timeout is None:
+        wait_timeout = lease_duration + transport.max_request_time()
+    deadline = time.time() + wait_timeout
+
+    # A stored access token other than the one being replaced, with life left, is fresh
+    def fresh_tokens():
+        row = store.read(**key)
+        if row is None:
+            raise errors.AuthorizationRequiredError(f'No tokens stored for client {client_id}')
+        tokens = decode_row(row)
+        if tokens.get("access_token") and tokens["access_token"] != stale_access_token \
+                and tokens["expires_at"] > time.time() + poll_interval:
+            return tokens, tokens
+        return None, tokens
+
+    # Keep the lease while the token request runs, so it cannot expire mid-refresh
+    def renew_lease(stop):
+        while not stop.wait(lease_duration / 3):
+            if not store.acquire_lease(holder=holder, duration=lease_duration, **key):
+                logger.warning(f'Lost the refresh lease for client {client_id} to another process')
+
+    while True:
+        if store.acquire_lease(holder=holder, duration=lease_duration, **key):
+            try:
+                # Another process may have refreshed while this one waited for the lease
+                fresh, stored = fresh_tokens()
+                if fresh is not None:
+                    logger.info(f'Using tokens refreshed by another process for client {client_id}')
+                    return fresh
+
+                stop = threading.Event()
+                heartbeat = threading.Thread(target=renew_lease, args=(stop,), name=f'Lease {client_id}', daemon=True)
+                heartbeat.start()
+                try:
+                    res = request_tokens(stored["refresh_token"])
+                finally:
+                    stop.set()
+                    heartbeat.join()
+
+                tokens = {
+                    "access_token": res['access_token'],
+                    "refresh_token": res['refresh_token'] if rotatable_token and 'refresh_token' in res else stored["refresh_token"],
+                    "expires_at": token_expiry(res)
+                }
+
+                # Persist before releasing the lease so waiting processes see the new tokens
+                write_tokens(database, client_id=client_id, region=region, user_name=user_name, **tokens)
+                return tokens
+            finally:
+                store.release_lease(holder=holder, **key)
+
+        fresh, _ = fresh_tokens()
+        if fresh is not None:
+            logger.info(f'Using tokens refreshed by another process for client {client_id}')
+            return fresh
+
+        if time.time() > deadline:
+            raise errors.AnaplanError(f'Timed out waiting for another process to refresh client {client_id}')
+        time.sleep(poll_interval)
+
+
+# === Refresh a stored client ===
+# Refreshes the tokens of any client in the token store without touching `globals.Auth`.
+# Returns `{"access_token", "refresh_token", "expires_at"}`; raises on failure
+def refresh_client(uri, database, client_id, rotatable_token, region="", user_name="", secret=None,
+                   lease_duration=30, wait_timeout=None):
+    tokens = read_token_db(database, client_id=client_id, region=region, user_name=user_name)
+    if tokens['client_id'] == "empty":
+        raise errors.AuthorizationRequiredError(f'No tokens stored for client {client_id}')
+
+    get_headers = {
+        'Content-Type': 'application/json',
+        'Accept': 'application/json',
+    }
+
+    def request_tokens(refresh_token):
+        get_body = {
+            "client_id": client_id,
+            "refresh_token": refresh_token,
+            "grant_type": "refresh_token"
+        }
+        if secret:
+            get_body["client_secret"] = secret
+
+        res = transport.raise_for_status(transport.post(uri, headers=get_headers, json=get_body))
+        return res.json()
+
+    # Replace the currently stored access token, unless another process beats us to it
+    return coordinated_refresh(database, client_id=client_id, request_tokens=request_tokens,
+                               rotatable_token=rotatable_token, stale_access_token=tokens.get("access_token"),
+                               region=region, user_name=user_name,
+                               lease_duration=lease_duration, wait_timeout=wait_timeout)
+
+
+# === Token provider for a stored client ===
+# Returns a `token_provider.TokenProvider` for any client in the token database, seeded with
+# its persisted access token (if still present) and refreshing through `refresh_client`.
+# Lets one process act for several clients, e.g. the two ends of a model-to-model pipe
+def client_provider(uri, database, client_id, rotatable_token, region="", user_name="", secret=None,
+                    lease_duration=30, wait_timeout=None):
+    state = types.SimpleNamespace(client_id=client_id, access_token=None, refresh_token=None, expires_at=0)
+    provider = token_provider.TokenProvider(state=state)
+
+    # Reuse a still-valid access token persisted by another process
+    tokens = read_token_db(database, client_id=client_id, region=region, user_name=user_name)
+    if tokens['client_id'] == "empty":
+        raise errors.AuthorizationRequiredError(f'No tokens stored for client {client_id}')
+    if tokens.get("access_token"):
+        provider.set_tokens(access_token=tokens["access_token"], expires_at=tokens["expires_at"])
+
+    def refresh():
+        res = refresh_client(uri, database, client_id=client_id, rotatable_token=rotatable_token, region=region,
+                             user_name=user_name, secret=secret, lease_duration=lease_duration, wait_timeout=wait_timeout)
+        provider.set_tokens(access_token=res['access_token'], expires_at=res['expires_at'],
+                            refresh_token=res['refresh_token'])
+
+    provider.configure(refresh=refresh)
+    return provider
+
+
+# === Refresh many stored clients ===
+# Refreshes `clients` (dictionaries with `client_id` and optional `region`, `user_name` and
+# `secret`; defaults to every client in the token store) with at most `max_workers` requests
+# in flight. Returns one result per client with its latency and either the new
+# `access_token` / `expires_at` or the `error`
+def refresh_clients(uri, database, rotatable_token, clients=None, max_workers=8):
+    if clients is None:
+        clients = token_store.get_store(database).read_all()
+
+    def refresh_one(client):
+        result = {
+            "client_id": client["client_id"],
+            "region": client.get("region", ""),
+            "user_name": client.get("user_name", ""),
+            "error": None
+        }
+        start = time.perf_counter()
+        try:
+            res = refresh_client(uri, database, client_id=result["client_id"], rotatable_token=rotatable_token,
+                                 region=result["region"], user_name=result["user_name"], secret=client.get("secret"))
+            result["access_token"] = res['access_token']
+            result["expires_at"] = res['expires_at']
+        except Exception as err:
+            result["error"] = err
+            logger.error(f'{err} while refreshing client {result["client_id"]}')
+        result["latency"] = time.perf_counter() - start
+        return result
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(refresh_one, clients))
+
+    failed = [result for result in results if result["error"] is not None]
+    latencies = sorted(result["latency"] for result in results)
+    if latencies:
+        logger.info(f'Refreshed {len(results) - len(failed)} of {len(results)} clients '
+                    f'(median {latencies[len(latencies) // 2]:.3f}s, max {latencies[-1]:.3f}s)')
+
+    return results
@@ -1,59 +1,207 @@
 # ===============================================================================
 # Created:        2 Feb 2023
-# Updated:        30 Jan 2024
+# Updated:        17 Oct 2026
 # @author:        Quinlan Eddy
 # Description:    A test module to get Workspaces using a loop to test multithreading
 # ===============================================================================
 
 
 import logging
-import requests
 import time
+import random
 import threading
-import globals
+import urllib.parse
+import concurrent.futures
+import columnar
+import errors
+import json_stream
+import records
+import sinks
+import token_provider
+import transport
 
 
 # ===  Configure Get Workspace threading  ===
 # Pass in parameters used in looping through retrieving workspaces
 class get_workspaces_thread (threading.Thread):
    # Overriding the default `__init__`
-   def __init__(self, thread_id, name, delay, counter):
+   def __init__(self, thread_id, name, delay, counter, integration_uri="https://api.anaplan.com/2/0"):
       print('Getting Workspaces - Thread', thread_id)
       threading.Thread.__init__(self)
       self.thread_id = thread_id
       self.name = name
       self.delay = delay
       self.counter = counter
+      self.integration_uri = integration_uri
       self.daemon = False
 
    # Overriding the default subfunction `run()`
    def run(self):
       # Initiate the thread
       print("Starting " + self.name)
-      get_workspaces(self.name, self.counter, self.delay)
+      get_workspaces(self.name, self.counter, self.delay, integration_uri=self.integration_uri)
       print("Exiting " + self.name)
 
 
 # ===  Get Workspaces class  ===
 # Pass in values to be used with the get Workspaces function
 # This is only to demonstrate repeatedly calling an API endpoint 
-# based upon the counter value
-def get_workspaces(threadName, counter, delay):
+# based upon the counter value. The access token is requested from the
+# token provider on every call so a refreshed token is picked up immediately.
+# The response is streamed into `sink_factory()` (by default an atomic write of
+# `workspaces.json`), so the body is never held in memory as a whole
+def get_workspaces(threadName, counter, delay, provider=token_provider.default_provider,
+                   sink_factory=lambda: sinks.FileSink('workspaces.json'), integration_uri="https://api.anaplan.com/2/0"):
     get_headers = {
         'Content-Type': 'application/json',
-        'Accept': '*/*',
-        'Authorization': 'Bearer ' + globals.Auth.access_token
+        'Accept': '*/*'
     }
 
     while counter:
-        res = requests.get(
-            'https://api.anaplan.com/2/0/workspaces', headers=get_headers)
+        res = provider.get(
+            f'{integration_uri.rstrip("/")}/workspaces', headers=get_headers, stream=True)
+
+        # Check for unfavorable status codes (transient ones have already been retried)
+        transport.raise_for_status(res)
         logging.info("List of user workspaces received")
 
         # Write output to file
-        with open('workspaces.json', 'wb') as f:
-            f.write(res.text.encode('utf-8'))
+        sinks.stream_response(res, sink_factory())
 
         time.sleep(delay)
         print("%s: %s" % (threadName, time.ctime(time.time())))
         counter -= 1
+
+
+# ===  Stream a metadata listing  ===
+# Yield the objects of a listing endpoint (workspaces, models, lists, line items, list
+# items, ...) one at a time as `records` types, parsing the response incrementally so that
+# memory stays flat however many items the listing holds. `members` receives the other
+# top-level members of the response, such as `meta`
+def iter_records(uri, record_type, provider=token_provider.default_provider, members=None):
+    res = provider.get(uri, headers={'Accept': 'application/json'}, stream=True)
+    transport.raise_for_status(res)
+    return json_stream.iter_response(res, records.LISTING_KEYS[record_type], record_type=record_type, members=members)
+
+
+# ===  Stream a paginated listing  ===
+# Same as `iter_records`, following the `meta.paging` block of each page (`next` link, or
+# `offset` + `currentPageSize` against `totalSize`) until the listing is exhausted.
+# `page_size` sets the `limit` query parameter; by default the server decides
+def iter_listing(uri, record_type, provider=token_provider.default_provider, page_size=None):
+    offset = 0
+    page_uri = _page_uri(uri, page_size, offset)
+
+    while page_uri:
+        members = {}
+        count = 0
+        for record in iter_records(page_uri, record_type, provider=provider, members=members):
+            count += 1
+            yield record
+
+        paging = members.get("meta", {}).get("paging", {})
+        offset = paging.get("offset", offset) + paging.get("currentPageSize", count)
+        if paging.get("next"):
+            page_uri = paging["next"]
+        elif count and offset < paging.get("totalSize", 0):
+            page_uri = _page_uri(uri, page_size, offset)
+        else:
+            page_uri = None
+
+
+def _page_uri(uri, page_size, offset):
+    params = {}
+    if page_size:
+        params["limit"] = page_size
+    if offset:
+        params["offset"] = offset
+    if not params:
+        return uri
+    return f'{uri}{"&" if "?" in uri else "?"}{urllib.parse.urlencode(params)}'
+
+
+# ===  Stream an export as columnar batches  ===
+# Yield the rows of an export file (`.../models/{modelId}/files/{exportId}`, once the export
+# has run) as `columnar.ColumnBatch`es of `batch_size` rows. Chunks are downloaded one ahead
+# of the parser and never written to disk, so memory holds about two chunks and one batch
+# however large the export is. `types` and the other options are those of
+# `columnar.BatchParser`, e.g. `types={"Revenue": "float"}`
+def iter_export_batches(file_uri, provider=token_provider.default_provider, batch_size=columnar.BATCH_SIZE,
+                        types=None, **kwargs):
+    res = transport.raise_for_status(provider.get(f'{file_uri}/chunks', headers={'Accept': 'application/json'}))
+    chunk_ids = [chunk["id"] for chunk in res.json().get("chunks", [])]
+    parser = columnar.BatchParser(batch_size=batch_size, types=types, **kwargs)
+
+    def fetch(chunk_id):
+        return transport.raise_for_status(
+            provider.get(f'{file_uri}/chunks/{chunk_id}', headers={'Accept': 'application/octet-stream'})).content
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as downloads:
+        ahead = downloads.submit(fetch, chunk_ids[0]) if chunk_ids else None
+        for index in range(len(chunk_ids)):
+            data = ahead.result()
+            if index + 1 < len(chunk_ids):
+                ahead = downloads.submit(fetch, chunk_ids[index + 1])
+            yield from parser.feed(data)
+    yield from parser.close()
+    logging.info(f'Read {parser.rows} rows in {len(chunk_ids)} chunks from {file_uri}')
+
+
+# ===  Run an action  ===
+# Start a task for the import, export, process or action at `action_uri`
+# (e.g. `.../models/{modelId}/exports/{exportId}`) and return its task ID
+def run_action(action_uri, provider=token_provider.default_provider, locale="en_US"):
+    res = provider.post(f'{action_uri}/tasks', json={"localeName": locale},
+                        headers={'Content-Type': 'application/json', 'Accept': 'application/json'})
+    transport.raise_for_status(res)
+    task_id = res.json()["task"]["taskId"]
+    logging.info(f'Started task {task_id} for {action_uri}')
+    return task_id
+
+
+# ===  Adaptive task polling  ===
+# Decides how long to wait before the next task status poll. Polls start fast so short tasks
+# are seen to finish quickly, then back off by `factor` up to `max_interval`. Once the task
+# reports progress, the wait tracks half of the estimated time remaining instead (within the
+# same bounds), so long tasks are polled rarely but not long after they finish
+class PollSchedule:
+    def __init__(self, initial=0.5, factor=1.5, max_interval=15, jitter=0.1):
+        self.initial = initial
+        self.factor = factor
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.polls = 0
+        self._interval = initial
+        self._started = time.monotonic()
+
+    def next_delay(self, task=None):
+        self.polls += 1
+        delay = self._interval
+        self._interval = min(self.max_interval, self._interval * self.factor)
+
+        progress = (task or {}).get("progress")
+        if progress and 0 < progress < 1:
+            elapsed = time.monotonic() - self._started
+            delay = min(self.max_interval, max(self.initial, elapsed * (1 - progress) / progress / 2))
+
+        return delay * random.uniform(1 - self.jitter, 1)
+
+
+# ===  Wait for a task  ===
+# Poll the task until it is no longer running, spacing the polls with `schedule` (a fresh
+# `PollSchedule` by default). Returns the task status, or raises `errors.TaskFailedError`
+# if the task failed or was cancelled
+def wait_for_task(action_uri, task_id, provider=token_provider.default_provider, schedule=None):
+    task_uri = f'{action_uri}/tasks/{task_id}'
+    schedule = schedule or PollSchedule()
+
+    while True:
+        res = transport.raise_for_status(provider.get(task_uri, headers={'Accept': 'application/json'}))
+        task = res.json()["task"]
+        if task["taskState"] in ("COMPLETE", "CANCELLED"):
+            break
+        time.sleep(schedule.next_delay(task))
+
+    if task["taskState"] == "CANCELLED" or not task.get("result", {}).get("successful", False):
+        raise errors.TaskFailedError(task_uri, task)
+    return task
@@ -0,0 +1,205 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:        17 Oct 2026
+# @author:        Quinlan Eddy
+# Description:    Batched, concurrent bulk writes of list items and module cells
+# ===============================================================================
+
+
+import json
+import time
+import logging
+import threading
+import concurrent.futures
+import errors
+import token_provider
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+# Server limits per request (items or cells, and body size)
+MAX_ITEMS = 100000
+MAX_BYTES = 8 * 1024 * 1024
+
+
+# ===  Pack records into batches  ===
+# Yield `(offset, records)` batches from any iterable without materializing it. A batch is
+# closed before it would exceed `max_items` records or `max_bytes` of JSON, so payloads
+# stay under the server limits however large the individual records are
+def batches(records, max_items=MAX_ITEMS, max_bytes=MAX_BYTES):
+    return _pack(records, max_items, {"bytes": max_bytes})
+
+
+# `limits["bytes"]` is read for every record, so lowering it shrinks the batches that follow
+def _pack(records, max_items, limits):
+    batch = []
+    size = 2
+    offset = 0
+
+    for record in records:
+        record_size = len(json.dumps(record, separators=(",", ":")).encode("utf-8")) + 1
+        if batch and (len(batch) >= max_items or size + record_size > limits["bytes"]):
+            yield offset, batch
+            offset += len(batch)
+            batch = []
+            size = 2
+        batch.append(record)
+        size += record_size
+
+    if batch:
+        yield offset, batch
+
+
+# ===  Batch outcome  ===
+# `failures` holds the records the server rejected, as `(index, record, reason)` with the
+# index counted from the start of the input. A failure the server did not tie to a record
+# (no usable `requestIndex`) is kept as `(None, None, failure)` with the raw failure. When
+# the whole request failed, `error` is set and every record of the batch is listed in `failures`
+class BatchResult:
+    __slots__ = ("offset", "count", "written", "error", "failures", "elapsed")
+
+    def __init__(self, offset, count):
+        self.offset = offset
+        self.count = count
+        self.written = 0
+        self.error = None
+        self.failures = []
+        self.elapsed = 0.0
+
+
+class BulkWriteReport:
+    def __init__(self):
+        self.batches = []
+        self.elapsed = 0.0
+
+    @property
+    def records(self):
+        return sum(batch.count for batch in self.batches)
+
+    @property
+    def written(self):
+        return sum(batch.written for batch in self.batches)
+
+    @property
+    def failed_batches(self):
+        return [batch for batch in self.batches if batch.error is not None or batch.failures]
+
+    # Records to send again, e.g. `bulk_write.add_list_items(..., report.failed_records())`.
+    # Failures not tied to a record cannot be resent this way; see `unattributed_failures`
+    def failed_records(self):
+        for batch in sorted(self.failed_batches, key=lambda batch: batch.offset):
+            for index, record, _ in batch.failures:
+                if index is not None:
+                    yield record
+
+    # Raw failures the server reported without a usable `requestIndex`, as `(offset, failure)`
+    # with the offset of the batch they came from
+    def unattributed_failures(self):
+        return [(batch.offset, reason) for batch in sorted(self.failed_batches, key=lambda batch: batch.offset)
+                for index, _, reason in batch.failures if index is None]
+
+
+# ===  Bulk write  ===
+# Sends `records` to `uri` in batches (see `batches`), with at most `max_workers` requests in
+# flight and at most `2 * max_workers` batches held in memory. `wrap(batch)` builds the JSON
+# body, `count(response)` extracts the number of records written. A batch rejected with
+# `413 Payload Too Large` is split in half and resent, and the byte limit is lowered for
+# the batches that follow. Failed batches do not stop the others; see `BulkWriteReport`
+def write(uri, records, method="POST", wrap=lambda batch: batch, count=lambda body: 0,
+          provider=token_provider.default_provider, max_workers=4, max_items=MAX_ITEMS, max_bytes=MAX_BYTES,
+          idempotent=None):
+    report = BulkWriteReport()
+    limits = {"bytes": max_bytes}
+    lock = threading.Lock()
+    window = threading.BoundedSemaphore(2 * max_workers)
+    start = time.perf_counter()
+
+    def send(offset, batch):
+        result = BatchResult(offset, len(batch))
+        batch_start = time.perf_counter()
+        try:
+            res = provider.request(method, uri, json=wrap(batch), idempotent=idempotent,
+                                   headers={'Content-Type': 'application/json', 'Accept': 'application/json'})
+            if res.status_code == 413 and len(batch) > 1:
+                # Too large for the server: halve it, and aim lower from now on
+                with lock:
+                    limits["bytes"] = max(1024, limits["bytes"] // 2)
+                logger.warning(f'Batch of {len(batch)} records at offset {offset} too large; splitting it')
+                half = len(batch) // 2
+                results = [send(offset, batch[:half]), send(offset + half, batch[half:])]
+                return _merge(offset, results)
+
+            if res.status_code >= 400:
+                raise errors.AnaplanHTTPError(status=res.status_code, uri=uri, details=res.text)
+
+            body = res.json() if res.content else {}
+            result.written = count(body)
+            for failure in body.get("failures", []):
+                index = failure.get("requestIndex")
+                if isinstance(index, int) and 0 <= index < len(batch):
+                    result.failures.append((offset + index, batch[index], failure.get("failureMessageDetails") or failure))
+                else:
+                    logger.warning(f'Failure without a record index writing the batch at offset {offset}: {failure}')
+                    result.failures.append((None, None, failure))
+        except errors.AnaplanError as err:
+            result.error = err
+            result.failures = [(offset + index, record, str(err)) for index, record in enumerate(batch)]
+            logger.error(f'{err} writing {len(batch)} records at offset {offset}')
+
+        result.elapsed = time.perf_counter() - batch_start
+        return result
+
+    def send_batch(offset, batch):
+        try:
+            return send(offset, batch)
+        finally:
+            window.release()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for offset, batch in _pack(records, max_items, limits):
+            window.acquire()
+            futures.append(executor.submit(send_batch, offset, batch))
+        report.batches = [future.result() for future in futures]
+
+    report.elapsed = time.perf_counter() - start
+    logger.info(f'Wrote {report.written} of {report.records} records to {uri} in {len(report.batches)} batches '
+                f'in {report.elapsed:.1f}s ({len(report.failed_batches)} batches with failures)')
+    return report
+
+
+def _merge(offset, results):
+    merged = BatchResult(offset, sum(result.count for result in results))
+    merged.written = sum(result.written for result in results)
+    merged.failures = [failure for result in results for failure in result.failures]
+    merged.error = next((result.error for result in results if result.error is not None), None)
+    merged.elapsed = sum(result.elapsed for result in results)
+    return merged
+
+
+def _model_uri(integration_uri, workspace_id, model_id):
+    return f'{integration_uri.rstrip("/")}/workspaces/{workspace_id}/models/{model_id}'
+
+
+# ===  List items  ===
+# `items` are dictionaries such as `{"name": "SKU-1", "code": "S1", "parent": "Hardware",
+# "properties": {...}}`
+def add_list_items(workspace_id, model_id, list_id, items, integration_uri="https://api.anaplan.com/2/0", **kwargs):
+    return write(f'{_model_uri(integration_uri, workspace_id, model_id)}/lists/{list_id}/items?action=add', items,
+                 wrap=lambda batch: {"items": batch}, count=lambda body: body.get("added", 0), **kwargs)
+
+
+def update_list_items(workspace_id, model_id, list_id, items, integration_uri="https://api.anaplan.com/2/0", **kwargs):
+    return write(f'{_model_uri(integration_uri, workspace_id, model_id)}/lists/{list_id}/items', items, method="PUT",
+                 wrap=lambda batch: {"items": batch}, count=lambda body: body.get("updated", 0), **kwargs)
+
+
+# ===  Module cells  ===
+# `cells` are dictionaries such as `{"lineItemId": "...", "dimensions": [{"dimensionId":
+# "...", "itemId": "..."}], "value": 42}`. Writing a cell twice sets the same value, so the
+# request is safe to retry
+def write_cells(workspace_id, model_id, module_id, cells, integration_uri="https://api.anaplan.com/2/0", **kwargs):
+    kwargs.setdefault("idempotent", True)
+    return write(f'{_model_uri(integration_uri, workspace_id, model_id)}/modules/{module_id}/data', cells,
+                 count=lambda body: body.get("numberOfCellsChanged", 0), **kwargs)
@@ -0,0 +1,254 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:        17 Oct 2026
+# @author:        Quinlan Eddy
+# Description:    Streaming CSV parsing into typed columnar batches
+# ===============================================================================
+
+
+import io
+import csv
+import math
+import array
+import codecs
+import logging
+
+# NumPy is optional; without it numeric columns stay `array.array`s
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 65536
+
+# Column types: 64-bit integers, doubles, plain strings, and dictionary-encoded strings
+# for dimension columns (list items, time periods, versions)
+INT = "int"
+FLOAT = "float"
+STR = "str"
+DIM = "dim"
+
+
+# ===  Dictionary-encoded column  ===
+# Each value is stored as an index (`codes`) into `dictionary`. The dictionary is shared by
+# every batch of the export and only grows, so codes compare and group the same way across
+# batches, e.g. `numpy.bincount(column.codes)` counts the rows of each item
+class DictColumn:
+    __slots__ = ("codes", "dictionary")
+
+    def __init__(self, codes, dictionary):
+        self.codes = codes
+        self.dictionary = dictionary
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        return self.dictionary[self.codes[index]]
+
+    def __iter__(self):
+        dictionary = self.dictionary
+        return (dictionary[code] for code in self.codes)
+
+    def __repr__(self):
+        return f'DictColumn({len(self.codes)} values, {len(self.dictionary)} distinct)'
+
+
+# ===  Column batch  ===
+# Up to `batch_size` consecutive rows of the export, starting at row `offset` (not counting
+# the header), held as one typed column per field: `array.array("q")` / `array.array("d")`
+# (NumPy arrays when available) for numbers, `DictColumn` for dimensions, lists for strings
+class ColumnBatch:
+    __slots__ = ("offset", "names", "columns")
+
+    def __init__(self, offset, names, columns):
+        self.offset = offset
+        self.names = names
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns[self.names[0]]) if self.names else 0
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __repr__(self):
+        return f'ColumnBatch(offset={self.offset}, rows={len(self)}, columns={self.names})'
+
+
+# ===  Batch builder  ===
+# Push parser: feed it the CSV in chunks of bytes and it returns the batches completed so
+# far; `close()` returns the last, partial batch. Only the current batch of raw rows is held
+# in memory. Column types come from `types` (`{"Amount": "float", ...}`); columns not listed
+# are inferred from the data: integers, then floats, otherwise dimensions. Values with a
+# leading zero (`0010`) are codes, not numbers. Blank numeric cells read as `NaN` (a blank in
+# an integer column makes it a float column).
+# Inferred types are per batch: a type only widens (int -> float -> dim) when a later batch
+# does not fit it, and batches already returned keep the narrower type, so the same column
+# can come back as `array("q")` in one batch and `DictColumn` in the next. Check `types` (the
+# type of each column so far) before combining batches, or pass `types` for every column
+# whose batches must agree
+class BatchParser:
+    def __init__(self, batch_size=BATCH_SIZE, types=None, names=None, encoding="utf-8-sig", use_numpy=None,
+                 **fmtparams):
+        if use_numpy and numpy is None:
+            raise ImportError("use_numpy=True requires numpy")
+        self.batch_size = batch_size
+        self.types = dict(types or {})
+        self.declared = set(self.types)
+        self.names = list(names) if names is not None else None
+        self.use_numpy = numpy is not None if use_numpy is None else use_numpy
+        self.fmtparams = fmtparams
+        self.quotechar = fmtparams.get("quotechar", '"')
+        self.dictionaries = {}
+        self.rows = 0
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._carry = ""
+        self._batch = []
+
+    def feed(self, chunk):
+        text = self._carry + self._decoder.decode(chunk)
+        end = self._record_end(text)
+        self._carry = text[end:]
+        return self._read(text[:end])
+
+    def close(self):
+        text = self._carry + self._decoder.decode(b"", final=True)
+        self._carry = ""
+        if text.count(self.quotechar) % 2:
+            raise ValueError("CSV ends inside a quoted field")
+        batches = self._read(text)
+        if self._batch:
+            batches.append(self._build())
+        return batches
+
+    # End of the last complete record in `text`: the last newline preceded by an even number
+    # of quote characters (a newline inside a quoted field does not end the record)
+    def _record_end(self, text):
+        quotes = text.count(self.quotechar)
+        end = len(text)
+        while True:
+            newline = text.rfind("\n", 0, end)
+            if newline < 0:
+                return 0
+            quotes -= text.count(self.quotechar, newline + 1, end)
+            if quotes % 2 == 0:
+                return newline + 1
+            end = newline
+
+    def _read(self, text):
+        if not text:
+            return []
+        batch = self._batch
+        batch.extend(row for row in csv.reader(io.StringIO(text, newline=""), **self.fmtparams) if row)
+        if self.names is None and batch:
+            self.names = batch.pop(0)
+
+        batches = []
+        while len(self._batch) >= self.batch_size:
+            batches.append(self._build())
+        return batches
+
+    def _build(self):
+        rows, self._batch = self._batch[:self.batch_size], self._batch[self.batch_size:]
+        offset = self.rows
+        self.rows += len(rows)
+
+        width = len(self.names)
+        for index, row in enumerate(rows):
+            if len(row) != width:
+                raise ValueError(f'Row {offset + index + 1} has {len(row)} fields, expected {width}')
+
+        columns = {}
+        for name, values in zip(self.names, zip(*rows)):
+            if name not in self.declared:
+                kind = _infer(values, self.types.get(name, INT))
+                if name not in self.types:
+                    logger.debug(f'Column {name!r} read as {kind}')
+                elif kind != self.types[name]:
+                    logger.warning(f'Column {name!r} widened from {self.types[name]} to {kind} at row {offset + 1}; '
+                                   f'earlier batches keep {self.types[name]}')
+                self.types[name] = kind
+            columns[name] = self._column(name, self.types[name], values, offset)
+        return ColumnBatch(offset, self.names, columns)
+
+    def _column(self, name, kind, values, offset):
+        if kind == DIM:
+            return self._encode(name, values)
+        if kind == STR:
+            return list(values)
+        if kind not in (INT, FLOAT):
+            raise ValueError(f'Unknown column type {kind!r} for {name!r}')
+
+        try:
+            column = array.array("q", map(int, values)) if kind == INT else array.array("d", map(_float, values))
+        except (ValueError, OverflowError) as err:
+            raise ValueError(f'Column {name!r} in rows {offset + 1}-{offset + len(values)}: {err}; '
+                             f'pass its type in `types`') from err
+
+        if self.use_numpy:
+            return numpy.frombuffer(column, dtype=numpy.int64 if kind == INT else numpy.float64)
+        return column
+
+    def _encode(self, name, values):
+        dictionary = self.dictionaries.setdefault(name, ([], {}))
+        items, codes_by_value = dictionary
+        codes = array.array("i")
+        append = codes.append
+        for value in values:
+            code = codes_by_value.get(value)
+            if code is None:
+                code = codes_by_value[value] = len(items)
+                items.append(value)
+            append(code)
+        if self.use_numpy:
+            codes = numpy.frombuffer(codes, dtype=numpy.intc)
+        return DictColumn(codes, items)
+
+
+def _float(value):
+    return float(value) if value else math.nan
+
+
+# Narrowest type, no narrower than `start`, that holds every value
+def _infer(values, start=INT):
+    if start == INT and all(_is_int(value) for value in values):
+        return INT
+    if start in (INT, FLOAT) and all(_is_float(value) for value in values):
+        return FLOAT
+    return DIM
+
+
+def _is_int(value):
+    try:
+        return -1 << 63 <= int(value) < 1 << 63 and not _is_code(value)
+    except ValueError:
+        return False
+
+
+def _is_float(value):
+    try:
+        _float(value)
+    except ValueError:
+        return False
+    return not _is_code(value)
+
+
+# Identifiers such as `0010` would lose their leading zeros as numbers
+def _is_code(value):
+    digits = value.strip().lstrip("+-")
+    return len(digits) > 1 and digits[0] == "0" and digits[1].isdigit()
+
+
+# ===  Stream batches  ===
+# Yield `ColumnBatch`es from an iterable of byte chunks, e.g. a downloaded export read with
+# `iter(functools.partial(f.read, 1 << 20), b"")`; see `BatchParser` for the options
+def iter_batches(chunks, batch_size=BATCH_SIZE, types=None, **kwargs):
+    parser = BatchParser(batch_size=batch_size, types=types, **kwargs)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
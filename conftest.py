@@ -0,0 +1,110 @@
+"""
+shared fakes and fixtures for the test cases
+"""
+
+import json
+import threading
+import pytest
+import transport
+
+
+class FakeResponse:
+    # `body` is returned by `json()` and sent as JSON unless raw `content` is given.
+    # `iter_content` streams `chunks` when given (an exception among them is raised when it
+    # is reached), otherwise the content in pieces of 10 bytes
+    def __init__(self, body=None, status_code=200, url="", content=None, chunks=None, headers=None):
+        self.body = body
+        self.status_code = status_code
+        self.url = url
+        self.content = content if content is not None else b"" if body is None else json.dumps(body).encode("utf-8")
+        self.chunks = chunks
+        self.headers = headers or {}
+        self.closed = False
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", "replace")
+
+    def json(self):
+        return self.body
+
+    def iter_content(self, chunk_size=None):
+        chunks = self.chunks
+        if chunks is None:
+            chunks = [self.content[i:i + 10] for i in range(0, len(self.content), 10)]
+        for chunk in chunks:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class FakeModel:
+    # One model's files and actions. `get` serves the export `chunks` and `put` keeps uploaded
+    # chunks in `received` (their content types in `content_types`); every task completes
+    # straight away. Each chunk ID in `fail_chunks` fails once with `500`. `calls` lists the
+    # GET and POST requests as `(method, uri, json)`
+    def __init__(self, chunks=(), fail_chunks=()):
+        self.chunks = list(chunks)
+        self.fail_chunks = set(fail_chunks)
+        self.received = {}
+        self.content_types = {}
+        self.fetched = []
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get(self, uri, **kwargs):
+        with self.lock:
+            self.calls.append(("GET", uri, None))
+        if uri.endswith("/chunks"):
+            return FakeResponse({"chunks": [{"id": str(i)} for i in range(len(self.chunks))]}, url=uri)
+        if "/tasks/" in uri:
+            return FakeResponse({"task": {"taskId": "t1", "taskState": "COMPLETE", "result": {"successful": True}}},
+                                url=uri)
+
+        chunk_id = int(uri.rsplit("/", 1)[1])
+        with self.lock:
+            if self._fails(chunk_id):
+                return FakeResponse(status_code=500, url=uri)
+            self.fetched.append(chunk_id)
+        return FakeResponse(content=self.chunks[chunk_id], url=uri)
+
+    def post(self, uri, json=None, **kwargs):
+        with self.lock:
+            self.calls.append(("POST", uri, json))
+        return FakeResponse({"task": {"taskId": "t1"}}, url=uri)
+
+    def put(self, uri, data=None, headers=None, **kwargs):
+        chunk_id = int(uri.rsplit("/", 1)[1])
+        with self.lock:
+            if self._fails(chunk_id):
+                return FakeResponse(status_code=500, url=uri)
+            self.received[chunk_id] = data
+            self.content_types[chunk_id] = (headers or {}).get("Content-Type")
+        return FakeResponse(url=uri)
+
+    def _fails(self, chunk_id):
+        if chunk_id not in self.fail_chunks:
+            return False
+        self.fail_chunks.discard(chunk_id)
+        return True
+
+
+@pytest.fixture
+def make_response():
+    return FakeResponse
+
+
+@pytest.fixture
+def fake_model():
+    return FakeModel
+
+
+# Puts the transport (and the endpoints, breakers, rate limits and response cache it
+# configures) back to its defaults after the test, whether or not the test passed
+@pytest.fixture
+def reset_transport():
+    yield
+    transport.configure()
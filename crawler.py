@@ -0,0 +1,116 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Parallel crawler building an inventory of a tenant's metadata
+# ===============================================================================
+
+
+import time
+import logging
+import threading
+import concurrent.futures
+import anaplan_ops
+import records
+import token_provider
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+# Object listings fetched for every model, by inventory key
+MODEL_OBJECTS = {
+    "modules": records.Module,
+    "lists": records.List,
+    "imports": records.Import,
+    "exports": records.Export,
+    "processes": records.Process,
+}
+
+
+# ===  Tenant inventory  ===
+# `objects` maps each model ID to its listings, e.g. `objects[model_id]["imports"]`.
+# Listings that failed are recorded in `errors` as `(uri, error)` and left out of `objects`
+class Inventory:
+    def __init__(self):
+        self.workspaces = []
+        self.models = []
+        self.objects = {}
+        self.errors = []
+        self.requests = 0
+        self.elapsed = 0.0
+
+    def to_dict(self):
+        return {
+            "workspaces": [workspace.to_dict() for workspace in self.workspaces],
+            "models": [model.to_dict() for model in self.models],
+            "objects": {model_id: {name: [record.to_dict() for record in listing] for name, listing in listings.items()}
+                        for model_id, listings in self.objects.items()},
+            "errors": [{"uri": uri, "error": str(error)} for uri, error in self.errors],
+        }
+
+
+# ===  Crawl a tenant  ===
+# Lists the workspaces, then fans out over the models of every workspace and the object
+# listings of every model (see `MODEL_OBJECTS`) with at most `max_workers` listings in flight.
+# Each listing follows pagination. A failed listing is recorded in `Inventory.errors`
+# and does not stop the crawl. When `model_filter` is given, only the models for which
+# `model_filter(model)` is true have their objects listed
+def crawl(integration_uri="https://api.anaplan.com/2/0", provider=token_provider.default_provider,
+          max_workers=8, page_size=None, objects=MODEL_OBJECTS, model_filter=None):
+    integration_uri = integration_uri.rstrip("/")
+    inventory = Inventory()
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def listing(uri, record_type):
+        try:
+            return list(anaplan_ops.iter_listing(uri, record_type, provider=provider, page_size=page_size))
+        except Exception as err:
+            logger.error(f'{err} while crawling {uri}')
+            with lock:
+                inventory.errors.append((uri, err))
+            return None
+        finally:
+            with lock:
+                inventory.requests += 1
+
+    def crawl_workspace(workspace):
+        models = listing(f'{integration_uri}/workspaces/{workspace.id}/models', records.Model)
+        return workspace, models or []
+
+    def crawl_model(model, name, record_type):
+        uri = f'{integration_uri}/workspaces/{model.workspace_id}/models/{model.id}/{name}'
+        return model, name, listing(uri, record_type)
+
+    inventory.workspaces = listing(f'{integration_uri}/workspaces', records.Workspace) or []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(crawl_workspace, workspace) for workspace in inventory.workspaces}
+
+        # Model listings are submitted as soon as their workspace's models are known, so the
+        # pool stays busy instead of waiting for every workspace first
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if isinstance(result[0], records.Workspace):
+                    _, models = result
+                    for model in models:
+                        # Listings report the model's current workspace; fall back to the parent
+                        model.workspace_id = model.workspace_id or result[0].id
+                        inventory.models.append(model)
+                        if model_filter is not None and not model_filter(model):
+                            continue
+                        inventory.objects[model.id] = {}
+                        pending |= {executor.submit(crawl_model, model, name, record_type)
+                                    for name, record_type in objects.items()}
+                else:
+                    model, name, listed = result
+                    if listed is not None:
+                        inventory.objects[model.id][name] = listed
+
+    inventory.elapsed = time.perf_counter() - start
+    logger.info(f'Crawled {len(inventory.workspaces)} workspaces and {len(inventory.models)} models with '
+                f'{inventory.requests} listings in {inventory.elapsed:.1f}s ({len(inventory.errors)} errors)')
+    return inventory
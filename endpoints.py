@@ -0,0 +1,205 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:        17 Oct 2026
+# @author:        Quinlan Eddy
+# Description:    Latency-aware selection of regional endpoints, with failover
+# ===============================================================================
+
+
+import time
+import logging
+import threading
+import urllib.parse
+import concurrent.futures
+import requests
+import retry
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+
+# === Endpoint selection defaults ===
+# Overridden by the `endpointSelection` block in `settings.json`
+DEFAULT_SETTINGS = {
+    "probeInterval": 60,   # Seconds between latency probes of a service's candidates (0 disables probing)
+    "probeTimeout": 2,     # Seconds before a probe counts as failed
+    "smoothing": 0.3,      # Weight of the newest probe in the moving average latency
+    "switchMargin": 0.2    # How much faster (as a fraction) a candidate must be to replace the selected one
+}
+
+
+# === Probe a candidate ===
+# Round trip of a `HEAD` request to `uri` in seconds, or `None` when the endpoint is
+# unreachable or answers with a server error. Any other status (`401`, `404`, ...) still
+# shows the endpoint is up
+def probe_latency(uri, timeout):
+    start = time.perf_counter()
+    try:
+        res = requests.head(uri, timeout=timeout, allow_redirects=False)
+        res.close()
+    except requests.exceptions.RequestException as err:
+        logger.warning(f'Probe of {uri} failed: {err}')
+        return None
+    if res.status_code >= 500:
+        logger.warning(f'Probe of {uri} returned {res.status_code}')
+        return None
+    return time.perf_counter() - start
+
+
+# === Candidate endpoints of one service ===
+# `candidates` are interchangeable base URIs for the service (e.g. the OAuth service in
+# several regions), the first being the primary. Requests go to the selected candidate: the
+# fastest healthy one by moving average probe latency. A candidate is unhealthy when its
+# last probe failed or its circuit breaker (see `retry.CircuitBreaker`) is open, which moves
+# traffic to the next best candidate straight away. To avoid flapping between candidates of
+# similar latency, a healthy selection is only replaced by one at least `switchMargin`
+# faster. Candidates are probed in the background every `probeInterval` seconds, on demand
+class ServiceEndpoints:
+    def __init__(self, service, candidates, settings=None, probe=probe_latency):
+        self.service = service
+        self.candidates = [uri.rstrip("/") for uri in candidates]
+        self.settings = {**DEFAULT_SETTINGS, **(settings or {})}
+        self.probe_function = probe
+        self.latency = {uri: None for uri in self.candidates}
+        self.healthy = {uri: True for uri in self.candidates}
+        self.selected = self.candidates[0]
+        self.last_probe = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self):
+        return self.candidates[0]
+
+    # The base URI requests should use now
+    def current(self):
+        self._probe_if_due()
+        with self._lock:
+            selected = self._choose()
+            if selected != self.selected:
+                logger.warning(f'Switching {self.service} from {self.selected} to {selected} '
+                               f'({self._describe(self.selected)} -> {self._describe(selected)})')
+                self.selected = selected
+            return selected
+
+    def _available(self, uri):
+        return self.healthy[uri] and retry.get_breaker(urllib.parse.urlsplit(uri).netloc).state != "open"
+
+    def _choose(self):
+        available = [uri for uri in self.candidates if self._available(uri)]
+        if not available:
+            return self.selected
+
+        # Probed candidates by latency, then unprobed ones in configured order
+        best = min(available, key=lambda uri: (self.latency[uri] is None, self.latency[uri] or 0,
+                                              self.candidates.index(uri)))
+        if self.selected not in available:
+            return best
+
+        current, fastest = self.latency[self.selected], self.latency[best]
+        if fastest is not None and (current is None or fastest < current * (1 - self.settings["switchMargin"])):
+            return best
+        return self.selected
+
+    def _describe(self, uri):
+        if not self._available(uri):
+            return "unhealthy"
+        return f'{self.latency[uri] * 1000:.0f} ms' if self.latency[uri] is not None else "not probed"
+
+    # Probe every candidate concurrently and fold the results into the moving averages
+    def probe(self):
+        timeout = self.settings["probeTimeout"]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(self.candidates)) as executor:
+            results = list(executor.map(lambda uri: self.probe_function(uri, timeout), self.candidates))
+
+        smoothing = self.settings["smoothing"]
+        with self._lock:
+            for uri, latency in zip(self.candidates, results):
+                self.healthy[uri] = latency is not None
+                if latency is not None:
+                    previous = self.latency[uri]
+                    self.latency[uri] = latency if previous is None else smoothing * latency + (1 - smoothing) * previous
+            self.last_probe = time.monotonic()
+            self._probing = False
+
+    def _probe_if_due(self):
+        interval = self.settings["probeInterval"]
+        with self._lock:
+            if not interval or self._probing or \
+                    (self.last_probe is not None and time.monotonic() - self.last_probe < interval):
+                return
+            self._probing = True
+
+        def run():
+            try:
+                self.probe()
+            except Exception as err:
+                logger.error(f'{err} while probing {self.service} endpoints')
+                with self._lock:
+                    self.last_probe = time.monotonic()
+                    self._probing = False
+
+        threading.Thread(target=run, name=f'Probe {self.service}', daemon=True).start()
+
+    def status(self):
+        with self._lock:
+            return {"selected": self.selected,
+                    "candidates": {uri: {"latency": self.latency[uri], "healthy": self._available(uri)}
+                                   for uri in self.candidates}}
+
+
+# === Endpoint registry ===
+# Services with more than one candidate URI in the `uris` block of `settings.json`
+_lock = threading.Lock()
+_services = []
+
+
+# A `uris` entry may be one URI or a list of candidates; `settings` is left untouched.
+# Requests to any candidate of the service are routed to the selected one (see `resolve`)
+def configure(settings=None):
+    settings = settings or {}
+    options = {**DEFAULT_SETTINGS, **settings.get("endpointSelection", {})}
+    services = []
+
+    for service, value in settings.get("uris", {}).items():
+        candidates = [value] if isinstance(value, str) else list(value)
+        if len(candidates) > 1:
+            services.append(ServiceEndpoints(service, candidates, options))
+
+    with _lock:
+        _services[:] = services
+
+    if services:
+        logger.info(f'Endpoint selection configured for {", ".join(service.service for service in services)}')
+
+
+# The `uris` block with each service reduced to its primary (first) URI, for code that
+# builds request URIs; `resolve` then routes them to the selected candidate
+def primary_uris(settings):
+    return {service: value if isinstance(value, str) else value[0]
+            for service, value in (settings or {}).get("uris", {}).items()}
+
+
+def get_service(name):
+    with _lock:
+        return next((service for service in _services if service.service == name), None)
+
+
+# Rewrite `uri` to the selected candidate of its service; other URIs are returned unchanged
+def resolve(uri):
+    with _lock:
+        services = list(_services)
+
+    for service in services:
+        for candidate in service.candidates:
+            if uri.startswith(candidate) and uri[len(candidate):len(candidate) + 1] in ("", "/", "?"):
+                return service.current() + uri[len(candidate):]
+    return uri
+
+
+# Selected endpoint, latency and health of every candidate, by service
+def status():
+    with _lock:
+        services = list(_services)
+    return {service.service: service.status() for service in services}
@@ -0,0 +1,63 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:        17 Oct 2026
+# @author:        Quinlan Eddy
+# Description:    Exceptions raised by the Anaplan OAuth and API modules
+# ===============================================================================
+
+
+# ===  Base exception  ===
+class AnaplanError(Exception):
+    pass
+
+
+# ===  Unfavorable status code  ===
+# Raised once retries (if any) are exhausted
+class AnaplanHTTPError(AnaplanError):
+    def __init__(self, status, uri, details=None):
+        super().__init__(f'{status} Error for url: {uri} with the following details: {details}')
+        self.status = status
+        self.uri = uri
+        self.details = details
+
+
+# ===  Connection failure or timeout  ===
+class AnaplanConnectionError(AnaplanError):
+    pass
+
+
+# ===  Circuit breaker open  ===
+# Requests to `host` are failing fast until `retry_at` (epoch seconds)
+class CircuitOpenError(AnaplanError):
+    def __init__(self, host, retry_at):
+        super().__init__(f'Circuit open for {host}; requests are suspended until {retry_at:.0f}')
+        self.host = host
+        self.retry_at = retry_at
+
+
+# ===  Client not registered  ===
+# The client has no tokens in the token database and must be registered first
+class AuthorizationRequiredError(AnaplanError):
+    pass
+
+
+# ===  Action task failed  ===
+# An import, export, process or action task finished unsuccessfully (or was cancelled).
+# `task` holds the task status returned by the API
+class TaskFailedError(AnaplanError):
+    def __init__(self, uri, task):
+        super().__init__(f'Task at {uri} ended in state {task.get("taskState")} with the following result: {task.get("result")}')
+        self.uri = uri
+        self.task = task
+
+
+# ===  Metadata lookup failed  ===
+# No object, or more than one, matches the name in the local metadata index
+class MetadataLookupError(AnaplanError):
+    pass
+
+
+# ===  Device authorization failed  ===
+# The user denied the device, or the device code expired before it was approved
+class DeviceAuthorizationError(AnaplanError):
+    pass
@@ -0,0 +1,354 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:        17 Oct 2026
+# @author:        Quinlan Eddy
+# Description:    Parallel chunked file transfers to and from Anaplan models
+# ===============================================================================
+
+
+import os
+import json
+import gzip
+import mmap
+import hashlib
+import time
+import logging
+import threading
+import concurrent.futures
+import anaplan_ops
+import errors
+import sinks
+import token_provider
+import transport
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+# ===  Chunk reader  ===
+# Return the bytes of `path` in `[offset, offset + length)` through a memory map, so only the
+# pages of that range are read and the file is never copied into memory as a whole
+def read_chunk(path, offset, length):
+    if length == 0:
+        return b""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return mapped[offset:offset + length]
+
+
+# Runs in a worker process: read and gzip one chunk. Only the compressed chunk travels back
+# to the parent
+def compress_chunk(path, offset, length, level=6):
+    return gzip.compress(read_chunk(path, offset, length), compresslevel=level)
+
+
+# ===  Chunk layout  ===
+# `(chunk_id, offset, length)` for every chunk of a file of `size` bytes. An empty file is
+# uploaded as one empty chunk
+def chunk_layout(size, chunk_size):
+    if size == 0:
+        return [(0, 0, 0)]
+    return [(index, offset, min(chunk_size, size - offset)) for index, offset in enumerate(range(0, size, chunk_size))]
+
+
+# ===  Transfer report  ===
+class TransferResult:
+    def __init__(self, file_id, size, chunks):
+        self.file_id = file_id
+        self.size = size
+        self.chunks = chunks
+        self.bytes_sent = 0
+        self.retries = 0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, bytes_sent=0, retries=0):
+        with self._lock:
+            self.bytes_sent += bytes_sent
+            self.retries += retries
+
+    @property
+    def throughput(self):
+        return self.size / MB / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return (f'TransferResult(file_id={self.file_id!r}, size={self.size}, chunks={self.chunks}, '
+                f'bytes_sent={self.bytes_sent}, retries={self.retries}, throughput={self.throughput:.1f} MB/s)')
+
+
+# ===  Chunk requests  ===
+# Shared by uploads, downloads and model-to-model pipes. Each chunk is retried up to
+# `chunk_retries` times after the transport's own retries give up; retries are counted on
+# `result` (a `TransferResult`) when given
+def file_uri(integration_uri, workspace_id, model_id, file_id):
+    return f'{integration_uri.rstrip("/")}/workspaces/{workspace_id}/models/{model_id}/files/{file_id}'
+
+
+def list_chunks(provider, uri):
+    res = transport.raise_for_status(provider.get(f'{uri}/chunks', headers={'Accept': 'application/json'}))
+    return [int(chunk["id"]) for chunk in res.json().get("chunks", [])]
+
+
+def get_chunk(provider, uri, chunk_id, chunk_retries=2, result=None):
+    return get_chunk_response(provider, uri, chunk_id, chunk_retries=chunk_retries, result=result).content
+
+
+def get_chunk_response(provider, uri, chunk_id, chunk_retries=2, result=None):
+    return _with_retries(lambda: transport.raise_for_status(
+        provider.get(f'{uri}/chunks/{chunk_id}', headers={'Accept': 'application/octet-stream'})),
+        f'downloading chunk {chunk_id} of {uri}', chunk_retries, result)
+
+
+def put_chunk(provider, uri, chunk_id, data, compressed=False, chunk_retries=2, result=None):
+    headers = {'Content-Type': 'application/x-gzip' if compressed else 'application/octet-stream'}
+    _with_retries(lambda: transport.raise_for_status(provider.put(f'{uri}/chunks/{chunk_id}', data=data, headers=headers)),
+                  f'uploading chunk {chunk_id} of {uri}', chunk_retries, result)
+    if result is not None:
+        result.add(bytes_sent=len(data))
+
+
+# An unknown chunk count (-1) lets the upload finish with an explicit `complete` call
+def begin_upload(provider, uri):
+    transport.raise_for_status(provider.post(uri, json={"chunkCount": -1}, headers={'Content-Type': 'application/json'}))
+
+
+def complete_upload(provider, uri, file_id, chunk_count):
+    transport.raise_for_status(provider.post(f'{uri}/complete', json={"id": file_id, "chunkCount": chunk_count},
+                                             headers={'Content-Type': 'application/json'}))
+
+
+def _with_retries(function, what, chunk_retries, result):
+    for attempt in range(chunk_retries + 1):
+        try:
+            return function()
+        except errors.AnaplanError as err:
+            if attempt == chunk_retries:
+                raise
+            logger.warning(f'{err} {what}; retrying (attempt {attempt + 1})')
+            if result is not None:
+                result.add(retries=1)
+
+
+# Wait for every chunk, raising the first failure straight away: chunks not started yet are
+# cancelled rather than transferred for a file that can no longer complete
+def wait_for_chunks(executor, futures):
+    try:
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+    except BaseException:
+        executor.shutdown(cancel_futures=True)
+        raise
+
+
+# ===  Upload a file  ===
+# Uploads `path` to the import data source `file_id` of a model in chunks of `chunk_size`
+# bytes, with at most `max_workers` chunks in flight. With `compress=True` chunks are gzipped
+# in a process pool of `compress_workers` processes (`0` compresses on the upload threads).
+# Each chunk is retried up to `chunk_retries` times after the transport's own retries give
+# up; the file is marked complete once every chunk has landed. Returns a `TransferResult`
+def upload_file(path, workspace_id, model_id, file_id, integration_uri="https://api.anaplan.com/2/0",
+                provider=token_provider.default_provider, chunk_size=10 * MB, max_workers=4,
+                compress=True, compress_workers=None, compress_level=6, chunk_retries=2):
+    uri = file_uri(integration_uri, workspace_id, model_id, file_id)
+    size = os.path.getsize(path)
+    chunks = chunk_layout(size, chunk_size)
+    result = TransferResult(file_id, size, len(chunks))
+    start = time.perf_counter()
+
+    begin_upload(provider, uri)
+
+    pool = None
+    if compress and compress_workers != 0:
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=compress_workers)
+
+    def upload_chunk(chunk):
+        chunk_id, offset, length = chunk
+        if not compress:
+            data = read_chunk(path, offset, length)
+        elif pool is not None:
+            data = pool.submit(compress_chunk, path, offset, length, compress_level).result()
+        else:
+            data = compress_chunk(path, offset, length, compress_level)
+        put_chunk(provider, uri, chunk_id, data, compressed=compress, chunk_retries=chunk_retries, result=result)
+
+    try:
+        # The pool never holds more than `max_workers` chunks, so memory stays bounded by
+        # `max_workers * chunk_size` whatever the file size
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            wait_for_chunks(executor, [executor.submit(upload_chunk, chunk) for chunk in chunks])
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    complete_upload(provider, uri, file_id, len(chunks))
+
+    result.elapsed = time.perf_counter() - start
+    logger.info(f'Uploaded {size / MB:.1f} MB to file {file_id} in {len(chunks)} chunks '
+                f'({result.bytes_sent / MB:.1f} MB sent) in {result.elapsed:.1f}s at {result.throughput:.1f} MB/s')
+    return result
+
+
+# ===  Download manifest  ===
+# Sidecar file recording which chunks of a download have landed in the partial output, so
+# an interrupted download resumes where it stopped. Saved atomically after every chunk.
+# `run` identifies the file being downloaded (see `run_fingerprint`): a partial file is only
+# reused for the same chunk list and the same run of the export
+class DownloadManifest:
+    def __init__(self, path, file_uri, chunks, slot, run=None):
+        self.path = path
+        self.file_uri = file_uri
+        self.chunks = chunks
+        self.slot = slot
+        self.run = run
+        self.done = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, file_uri, chunks, run=None):
+        try:
+            with open(path, "r") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get("fileUri") != file_uri or saved.get("chunks") != chunks or saved.get("run") != run:
+            return None
+        manifest = cls(path, file_uri, chunks, saved["slot"], run=run)
+        manifest.done = {int(chunk_id): length for chunk_id, length in saved["done"].items()}
+        return manifest
+
+    def complete(self, chunk_id, length):
+        with self._lock:
+            self.done[chunk_id] = length
+            self.save()
+
+    def save(self):
+        with sinks.FileSink(self.path) as sink:
+            sink.write(json.dumps({"fileUri": self.file_uri, "chunks": self.chunks, "slot": self.slot,
+                                   "run": self.run, "done": self.done}).encode("utf-8"))
+
+
+# Identifies one run of an export by its first chunk: length, digest and `ETag` (if sent).
+# A re-run export keeps its chunk IDs, so the chunk list alone cannot tell runs apart
+def run_fingerprint(res):
+    if res is None:
+        return None
+    return {"length": len(res.content), "sha256": hashlib.sha256(res.content).hexdigest(),
+            "etag": res.headers.get("ETag")}
+
+
+# ===  Download a file  ===
+# Downloads the model file `file_id` (for an export, the export ID) to `output`, fetching
+# up to `max_workers` chunks at once and writing each straight to its offset in a pre-sized
+# partial file (`output + ".part"`). Chunk offsets assume every chunk but the last is as
+# large as the first; should the server return other sizes, the file is reassembled in
+# order once at the end. Progress is recorded in `output + ".manifest"`; calling again after
+# a crash fetches the first chunk, to check the file is still the same run of the export, and
+# then only the missing chunks. The complete file replaces `output` atomically.
+# Returns a `TransferResult`
+def download_file(output, workspace_id, model_id, file_id, integration_uri="https://api.anaplan.com/2/0",
+                  provider=token_provider.default_provider, max_workers=4, chunk_retries=2):
+    uri = file_uri(integration_uri, workspace_id, model_id, file_id)
+    part_path = output + ".part"
+    manifest_path = output + ".manifest"
+    start = time.perf_counter()
+
+    chunk_ids = list_chunks(provider, uri)
+    result = TransferResult(file_id, 0, len(chunk_ids))
+    lock = threading.Lock()
+
+    def fetch(chunk_id):
+        return get_chunk(provider, uri, chunk_id, chunk_retries=chunk_retries, result=result)
+
+    first = get_chunk_response(provider, uri, chunk_ids[0], chunk_retries=chunk_retries, result=result) \
+        if chunk_ids else None
+    run = run_fingerprint(first)
+    first = first.content if first is not None else b""
+    result.add(bytes_sent=len(first))
+
+    manifest = DownloadManifest.load(manifest_path, uri, chunk_ids, run) if os.path.exists(part_path) else None
+    if manifest is not None:
+        logger.info(f'Resuming download of {file_id}: {len(manifest.done)} of {len(chunk_ids)} chunks already done')
+    else:
+        # The first chunk sets the slot size of every chunk in the partial file
+        manifest = DownloadManifest(manifest_path, uri, chunk_ids, max(len(first), 1), run=run)
+        with open(part_path, "wb") as f:
+            f.truncate(manifest.slot * len(chunk_ids))
+            f.write(first)
+        manifest.save()
+        if chunk_ids:
+            manifest.complete(chunk_ids[0], len(first))
+
+    oversized = {}
+    fd = os.open(part_path, os.O_WRONLY)
+
+    def download_chunk(index, chunk_id):
+        data = fetch(chunk_id)
+        if len(data) > manifest.slot:
+            # Does not fit its slot; kept aside and placed when the file is reassembled
+            with lock:
+                oversized[chunk_id] = data
+        else:
+            _write_at(fd, data, index * manifest.slot, lock)
+            # The chunk must be on disk before the manifest says so
+            os.fsync(fd)
+            manifest.complete(chunk_id, len(data))
+        result.add(bytes_sent=len(data))
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            wait_for_chunks(executor, [executor.submit(download_chunk, index, chunk_id)
+                                       for index, chunk_id in enumerate(chunk_ids) if chunk_id not in manifest.done])
+    finally:
+        os.close(fd)
+
+    lengths = [manifest.done.get(chunk_id, len(oversized.get(chunk_id, b""))) for chunk_id in chunk_ids]
+    result.size = sum(lengths)
+
+    if not oversized and all(length == manifest.slot for length in lengths[:-1]):
+        # Every chunk sits where it belongs: trim the unused tail of the last slot
+        with open(part_path, "r+b") as f:
+            f.truncate(result.size)
+        os.replace(part_path, output)
+    else:
+        with open(part_path, "rb") as part, sinks.FileSink(output) as sink:
+            for index, chunk_id in enumerate(chunk_ids):
+                if chunk_id in oversized:
+                    sink.write(oversized[chunk_id])
+                else:
+                    part.seek(index * manifest.slot)
+                    sink.write(part.read(lengths[index]))
+        os.remove(part_path)
+    os.remove(manifest_path)
+
+    result.elapsed = time.perf_counter() - start
+    logger.info(f'Downloaded {result.size / MB:.1f} MB of file {file_id} in {len(chunk_ids)} chunks '
+                f'in {result.elapsed:.1f}s at {result.throughput:.1f} MB/s')
+    return result
+
+
+# Write `data` at `offset` without moving a shared file position
+def _write_at(fd, data, offset, lock):
+    if hasattr(os, "pwrite"):
+        os.pwrite(fd, data, offset)
+    else:
+        with lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            os.write(fd, data)
+
+
+# ===  Run an export and download it  ===
+# Runs the export and downloads its file to `output`. If a previous call was interrupted
+# during the download, the export is not run again and the download resumes instead
+def export_and_download(output, workspace_id, model_id, export_id, integration_uri="https://api.anaplan.com/2/0",
+                        provider=token_provider.default_provider, max_workers=4):
+    model_uri = f'{integration_uri.rstrip("/")}/workspaces/{workspace_id}/models/{model_id}'
+
+    if not (os.path.exists(output + ".part") and os.path.exists(output + ".manifest")):
+        export_uri = f'{model_uri}/exports/{export_id}'
+        task_id = anaplan_ops.run_action(export_uri, provider=provider)
+        anaplan_ops.wait_for_task(export_uri, task_id, provider=provider)
+
+    return download_file(output, workspace_id, model_id, export_id, integration_uri=integration_uri,
+                         provider=provider, max_workers=max_workers)
@@ -1,6 +1,6 @@
 # ===============================================================================
 # Created:        3 Feb 2023
-# Updated:        30 Jan 2024
+# Updated:        17 Oct 2026
 # @author:        Quinlan Eddy
 # Description:    Data Factory to store temporary variables
 # ===============================================================================
@@ -17,4 +17,7 @@ class Auth:
     secret: str
     refresh_token: str = "none"  # Set default to `none`
     token_ttl: int = 2000 # Set default to 2000 seconds (33 minutes)
+    expires_at: float = 0 # Access token expiry (epoch seconds), `0` when unknown
+    device_interval: int = 5 # Seconds between device grant polls
+    device_expires_at: float = 0 # Device code expiry (epoch seconds)
         
@@ -0,0 +1,166 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:        17 Oct 2026
+# @author:        Quinlan Eddy
+# Description:    Incremental parsing of large JSON listing responses
+# ===============================================================================
+
+
+import json
+import codecs
+import logging
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+_decoder = json.JSONDecoder()
+
+
+# ===  Incremental listing parser  ===
+# Push parser for a JSON object holding one large array, such as `{"meta": {...},
+# "workspaces": [...]}`. Feed it the response in chunks of bytes (or str); each call returns
+# the array items completed so far, so only the unparsed tail is ever held in memory.
+# Other top-level members are decoded whole into `members`
+class ItemParser:
+    def __init__(self, key):
+        self.key = key
+        self.members = {}
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._state = "object"
+        self._name = None
+        self._closed = False
+
+    def feed(self, chunk):
+        self._buffer = self._buffer[self._pos:] + (self._utf8.decode(chunk) if isinstance(chunk, bytes) else chunk)
+        self._pos = 0
+        return self._parse()
+
+    # Signal the end of the stream; raises `ValueError` if the document is incomplete
+    def close(self):
+        self._buffer = self._buffer[self._pos:] + self._utf8.decode(b"", final=True)
+        self._pos = 0
+        self._closed = True
+        items = self._parse()
+        if self._state != "done":
+            raise ValueError(f'JSON stream ended before the listing was complete (state "{self._state}")')
+        return items
+
+    def _parse(self):
+        items = []
+
+        while self._state != "done":
+            char = self._peek()
+            if not char:
+                break
+
+            if self._state == "object":
+                self._consume("{")
+                self._state = "first_member"
+            elif self._state == "first_member":
+                if char == "}":
+                    self._pos += 1
+                    self._state = "done"
+                else:
+                    self._state = "member"
+            elif self._state == "member":
+                found, self._name = self._value()
+                if not found:
+                    break
+                self._state = "colon"
+            elif self._state == "colon":
+                self._consume(":")
+                self._state = "array_open" if self._name == self.key else "member_value"
+            elif self._state == "array_open":
+                if char == "[":
+                    self._pos += 1
+                    self._state = "first_item"
+                else:
+                    self._state = "member_value"
+            elif self._state == "first_item":
+                if char == "]":
+                    self._pos += 1
+                    self._state = "after_member"
+                else:
+                    self._state = "item"
+            elif self._state == "item":
+                found, item = self._value()
+                if not found:
+                    break
+                items.append(item)
+                self._state = "after_item"
+            elif self._state == "after_item":
+                self._consume(",]")
+                self._state = "item" if char == "," else "after_member"
+            elif self._state == "member_value":
+                found, value = self._value()
+                if not found:
+                    break
+                self.members[self._name] = value
+                self._state = "after_member"
+            elif self._state == "after_member":
+                self._consume(",}")
+                self._state = "member" if char == "," else "done"
+
+        return items
+
+    # Next significant character, or "" when more data is needed
+    def _peek(self):
+        while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+            self._pos += 1
+        if self._pos < len(self._buffer):
+            return self._buffer[self._pos]
+        return ""
+
+    def _consume(self, expected):
+        char = self._buffer[self._pos]
+        if char not in expected:
+            raise ValueError(f'Unexpected "{char}" in JSON stream, expected one of "{expected}"')
+        self._pos += 1
+
+    # Decode one complete value; returns `(False, None)` when it continues in the next chunk
+    def _value(self):
+        try:
+            value, end = _decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            if self._closed:
+                raise
+            return False, None
+        # A number that reaches the end of the buffer, or is only followed by more number
+        # characters (`1.` before `5`, `2e` before `3`), may continue in the next chunk
+        if not self._closed and not isinstance(value, (dict, list, str)) and \
+                all(char in _NUMBER_CHARS for char in self._buffer[end:]):
+            return False, None
+        self._pos = end
+        return True, value
+
+
+# ===  Stream array items  ===
+# Yield the items of the array stored under the top-level `key` of a JSON object, one at a
+# time, e.g. `iter_items(res.iter_content(65536), "workspaces")`. Other top-level members
+# (`meta`, `status`, ...) are stored in `members` when a dict is given; members that follow
+# the array are only available once iteration has finished
+def iter_items(chunks, key, members=None):
+    parser = ItemParser(key)
+    if members is not None:
+        parser.members = members
+
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+# ===  Stream records from a response  ===
+# Same as `iter_items`, reading a streamed `requests` response (`stream=True`) and converting
+# each item with `record_type.from_json` when given (see `records`). The response is closed
+# when iteration ends
+def iter_response(res, key, record_type=None, members=None, chunk_size=65536):
+    try:
+        for item in iter_items(res.iter_content(chunk_size=chunk_size), key, members=members):
+            yield record_type.from_json(item) if record_type is not None else item
+    finally:
+        res.close()
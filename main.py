@@ -1,18 +1,29 @@
 # ===============================================================================
 # Created:        2 Feb 2023
-# Updated:        30 Jan 2024
+# Updated:        17 Oct 2026
 # @author:        Quinlan Eddy
 # Description:    Main module for invocation of Anaplan operations
 # ===============================================================================
 
 import sys
 import logging
+import functools
 
 import utils
 import anaplan_oauth
 import globals
 import anaplan_ops
+import crawler
+import metadata_index
+import sinks
+import metrics
+import endpoints
+import transport
+import token_provider
+import token_broker
+import errors
 import threading
+import json
 
 
 def main():
@@ -25,8 +36,18 @@ def main():
 
         # Get configurations & set variables
         settings = utils.read_configuration_settings()
-        oauth_service_uri = settings["uris"]["oauthService"]
-        auth_code_uri = settings["uris"]["authenticationCode"]
+
+        # Share one pooled HTTP transport across every thread. Requests to a service with
+        # several candidate URIs in `uris` go to its fastest healthy one, so request URIs are
+        # built from the primary URI of each service
+        transport.configure(settings)
+        uris = endpoints.primary_uris(settings)
+
+        # Start the metrics exporters configured in the `metrics` block
+        metrics.configure(settings)
+
+        oauth_service_uri = uris["oauthService"]
+        auth_code_uri = uris["authenticationCode"]
         database = settings["database"]
         rotatable_token = settings["rotatableToken"]
 
@@ -36,11 +57,53 @@ def main():
 
         # Set the client_id and token_ttl from the CLI arguments
         globals.Auth.client_id = args.client_id
-        if args.token_ttl == "":
+        # `token_ttl` is only used when the token response carries no expiry
+        if args.token_ttl:
                 globals.Auth.token_ttl = int(args.token_ttl)
         globals.Auth.authorization_code = args.code
         globals.Auth.secret = args.secret
 
+        # Worker threads get their access token from the shared token provider, which
+        # refreshes through the grant flow in use. Refreshes are coordinated with other
+        # processes sharing the token database through a lease
+        lease_settings = settings.get("refreshLease", {})
+        lease = {"lease_duration": lease_settings.get("duration", 30), "wait_timeout": lease_settings.get("waitTimeout")}
+        if args.auth_flow:
+                refresh = functools.partial(anaplan_oauth.refresh_auth_tokens, uri=f'{oauth_service_uri}/token', database=database, **lease)
+        else:
+                refresh = functools.partial(anaplan_oauth.refresh_tokens, uri=f'{oauth_service_uri}/token', database=database, rotatable_token=rotatable_token, **lease)
+        token_provider.default_provider.configure(refresh=refresh)
+
+        # A cached access_token with at least this many seconds left is reused at startup
+        min_startup_lifetime = settings.get("tokenRefresh", {}).get("minStartupLifetime", 300)
+
+        # Refresh every stored client concurrently and report the outcome per client
+        if args.refresh_all:
+                batch_settings = settings.get("batchRefresh", {})
+                results = anaplan_oauth.refresh_clients(uri=f'{oauth_service_uri}/token', database=database, rotatable_token=rotatable_token,
+                                                        max_workers=batch_settings.get("maxWorkers", 8))
+                for result in results:
+                        status = "OK" if result["error"] is None else f'FAILED ({result["error"]})'
+                        print(f'{result["client_id"]} {result["region"]} {result["user_name"]}: {status} in {result["latency"]:.3f}s')
+
+                # Exit with return code 1 if any client failed
+                sys.exit(1 if any(result["error"] is not None for result in results) else 0)
+
+        # Register every client listed in a JSON file concurrently, e.g. for a fleet rollout
+        if args.register_clients:
+                with open(args.register_clients, "r") as clients_file:
+                        clients = json.load(clients_file)
+                registration_settings = settings.get("deviceRegistration", {})
+                results = anaplan_oauth.register_devices(device_uri=f'{oauth_service_uri}/device/code', token_uri=f'{oauth_service_uri}/token',
+                                                         database=database, clients=clients,
+                                                         max_workers=registration_settings.get("maxWorkers", 32))
+                for result in results:
+                        status = "OK" if result["error"] is None else f'FAILED ({result["error"]})'
+                        print(f'{result["client_id"]} {result["region"]} {result["user_name"]}: {status} in {result["latency"]:.1f}s')
+
+                # Exit with return code 1 if any client failed
+                sys.exit(1 if any(result["error"] is not None for result in results) else 0)
+
         if not args.auth_flow:
                 # DEVICE AUTHORIZATION CODE GRANT FLOW
                 # If register flag is set, then request the user to authenticate with Anaplan to create device code
@@ -49,10 +112,19 @@ def main():
                         anaplan_oauth.get_device_id(uri=f'{oauth_service_uri}/device/code')
                         anaplan_oauth.get_tokens(uri=f'{oauth_service_uri}/token', database=database)
                 
+                elif anaplan_oauth.load_cached_tokens(database=database, min_lifetime=min_startup_lifetime):
+                        logger.info('Skipping device registration and reusing the cached access_token')
+
                 else:
                         print('Skipping device registration and refreshing the access_token')
                         logger.info('Skipping device registration and refreshing the access_token')
-                        anaplan_oauth.refresh_tokens(uri=f'{oauth_service_uri}/token', database=database, delay=0, rotatable_token=rotatable_token)
+                        try:
+                                anaplan_oauth.refresh_tokens(uri=f'{oauth_service_uri}/token', database=database, rotatable_token=rotatable_token, **lease)
+                        except errors.AnaplanError as err:
+                                print(err)
+
+                                # Exit with return code 1
+                                sys.exit(1)
 
         else:
                 # AUTHORIZATION CODE FLOW
@@ -62,9 +134,17 @@ def main():
                 elif args.code and args.secret:
                         logger.info ('Getting an authorization token using Authorization Code Flow')
                         anaplan_oauth.get_auth_tokens(uri=f'{oauth_service_uri}/token', database=database)
+                elif args.secret and anaplan_oauth.load_cached_tokens(database=database, min_lifetime=min_startup_lifetime):
+                        logger.info('Reusing the cached access_token')
                 elif args.secret:
                         logger.info('Skipping device registration and refreshing the access_token')
-                        anaplan_oauth.refresh_auth_tokens(uri=f'{oauth_service_uri}/token', database=database, delay=0)
+                        try:
+                                anaplan_oauth.refresh_auth_tokens(uri=f'{oauth_service_uri}/token', database=database, **lease)
+                        except errors.AnaplanError as err:
+                                print(err)
+
+                                # Exit with return code 1
+                                sys.exit(1)
                 else:
                         print ("""For Authentication code provide:
 Step 1: Client ID (optional Secret) required to fetch code
@@ -74,7 +154,7 @@ Step 3: Secret must be supplied to refresh tokens
                         logger.info ('Invalid Authorization Code request')
                         sys.exit(0)
 
-                t2_get_workspaces = anaplan_ops.get_workspaces_thread(2, name="Get Workspaces", counter=3, delay=10)
+                t2_get_workspaces = anaplan_ops.get_workspaces_thread(2, name="Get Workspaces", counter=3, delay=10, integration_uri=uris["integrationApi"])
                 t2_get_workspaces.start()
 
                 # Exit with return code 0
@@ -82,8 +162,68 @@ Step 3: Secret must be supplied to refresh tokens
 
 
         # Configure multithreading 
-        t1_refresh_token = anaplan_oauth.refresh_token_thread(1, name="Refresh Token", delay=5, uri=f'{oauth_service_uri}/token', database=database, rotatable_token=settings["rotatableToken"])
-        t2_get_workspaces = anaplan_ops.get_workspaces_thread(2, name="Get Workspaces", counter=3, delay=10)
+        refresh_settings = settings.get("tokenRefresh", {})
+        t1_refresh_token = anaplan_oauth.refresh_token_thread(1, name="Refresh Token",
+                                                              lifetime_fraction=refresh_settings.get("lifetimeFraction", 0.75),
+                                                              jitter=refresh_settings.get("jitter", 0.1),
+                                                              min_delay=refresh_settings.get("minDelay", 30))
+
+        # BROKER MODE
+        # Keep the token warm and serve it to local jobs until interrupted
+        if args.broker:
+                t1_refresh_token.start()
+                broker = token_broker.TokenBroker(socket_path=settings.get("broker", {}).get("socket", "./anaplan-token.sock"),
+                                                  uri=f'{oauth_service_uri}/token', database=database,
+                                                  rotatable_token=rotatable_token, **lease)
+                try:
+                        broker.serve_forever()
+                except KeyboardInterrupt:
+                        logger.info('Token broker stopped')
+                        print('Token broker stopped')
+
+                # Exit with return code 0
+                sys.exit(0)
+
+        # CRAWL MODE
+        # Build an inventory of every workspace and model while the token is kept warm
+        if args.crawl:
+                t1_refresh_token.start()
+                crawler_settings = settings.get("crawler", {})
+                inventory = crawler.crawl(integration_uri=uris["integrationApi"],
+                                          max_workers=crawler_settings.get("maxWorkers", 8),
+                                          page_size=crawler_settings.get("pageSize"))
+                with sinks.FileSink('inventory.json') as sink:
+                        sink.write(json.dumps(inventory.to_dict(), indent=2).encode('utf-8'))
+                t1_refresh_token.stop()
+                print(f'Crawled {len(inventory.workspaces)} workspaces and {len(inventory.models)} models in {inventory.elapsed:.1f}s '
+                      f'({len(inventory.errors)} errors); inventory written to inventory.json')
+
+                # Exit with return code 1 if any listing failed
+                sys.exit(1 if inventory.errors else 0)
+
+        # SYNC THE METADATA INDEX
+        # Only models saved since the last sync are listed again unless `--full` is given
+        if args.sync_index:
+                t1_refresh_token.start()
+                crawler_settings = settings.get("crawler", {})
+                index = metadata_index.get_index(settings.get("metadataIndex", {}).get("database", "metadata.db3"))
+                try:
+                        result = index.sync(integration_uri=uris["integrationApi"],
+                                            max_workers=crawler_settings.get("maxWorkers", 8),
+                                            page_size=crawler_settings.get("pageSize"), full=args.full)
+                except errors.AnaplanError as err:
+                        print(err)
+
+                        # Exit with return code 1
+                        sys.exit(1)
+                finally:
+                        t1_refresh_token.stop()
+                print(f'Metadata index: {result["synced"]} models synced, {result["skipped"]} unchanged, {len(result["errors"])} errors')
+
+                # Exit with return code 1 if any listing failed
+                sys.exit(1 if result["errors"] else 0)
+
+        t2_get_workspaces = anaplan_ops.get_workspaces_thread(2, name="Get Workspaces", counter=3, delay=10, integration_uri=uris["integrationApi"])
 
         # Start new Threads
         t1_refresh_token.start()
@@ -0,0 +1,205 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:        17 Oct 2026
+# @author:        Quinlan Eddy
+# Description:    Local SQLite index of workspace, model and action metadata
+# ===============================================================================
+
+
+import os
+import time
+import logging
+import threading
+import crawler
+import errors
+import token_provider
+import token_store
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+# Schema version stored in `pragma user_version`
+SCHEMA_VERSION = 1
+
+# Object kinds kept in the index (see `crawler.MODEL_OBJECTS`)
+KINDS = tuple(crawler.MODEL_OBJECTS)
+# Singular of each kind, for lookup errors ("No process named ...")
+SINGULAR = {"modules": "module", "lists": "list", "imports": "import", "exports": "export", "processes": "process"}
+
+
+# ===  Change signal  ===
+# A model whose signature is unchanged since the last sync has not been saved since, so its
+# objects need not be listed again. Models without any signal are always re-listed
+def model_signature(model):
+    if model.last_saved_serial is None and model.last_modified is None:
+        return None
+    return f'{model.last_saved_serial}:{model.last_modified}'
+
+
+# ===  Metadata index  ===
+# Resolves workspace, model, module, list, import, export and process names to IDs without
+# calling the API. `sync()` populates the index from the API; lookups accept either a name
+# or an ID and raise `errors.MetadataLookupError` when nothing (or more than one object)
+# matches
+class MetadataIndex(token_store.Database):
+    def _migrate(self):
+        version = self._connection.execute("pragma user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+
+        def migrate(connection):
+            # Another process may have migrated while this one waited for the write lock
+            if connection.execute("pragma user_version").fetchone()[0] >= SCHEMA_VERSION:
+                return
+
+            connection.execute("""
+                create table if not exists workspaces (
+                    id text primary key,
+                    name text not null,
+                    synced_at real not null
+                )""")
+            connection.execute("create index if not exists workspaces_name on workspaces (name)")
+            connection.execute("""
+                create table if not exists models (
+                    id text primary key,
+                    workspace_id text not null,
+                    name text not null,
+                    signature text,
+                    synced_at real not null
+                )""")
+            connection.execute("create index if not exists models_name on models (name)")
+            connection.execute("create index if not exists models_workspace_id on models (workspace_id)")
+            connection.execute("""
+                create table if not exists objects (
+                    model_id text not null,
+                    kind text not null,
+                    id text not null,
+                    name text not null,
+                    primary key (model_id, kind, id)
+                )""")
+            connection.execute("create index if not exists objects_name on objects (model_id, kind, name)")
+            connection.execute(f"pragma user_version={SCHEMA_VERSION}")
+
+        self.transaction(migrate)
+
+    # === Incremental sync ===
+    # Re-lists the workspaces and models, then lists the objects of new models and of models
+    # whose change signal moved (see `model_signature`); unchanged models keep their indexed
+    # objects. Workspaces and models that disappeared are dropped. A model whose listings
+    # failed keeps its previous objects and is listed again on the next sync.
+    # Returns `{"synced", "skipped", "errors"}`
+    def sync(self, integration_uri="https://api.anaplan.com/2/0", provider=token_provider.default_provider,
+             max_workers=8, page_size=None, full=False):
+        integration_uri = integration_uri.rstrip("/")
+        with self._lock:
+            signatures = dict(self.connection.execute("select id, signature from models").fetchall())
+
+        def changed(model):
+            signature = model_signature(model)
+            return full or signature is None or signatures.get(model.id) != signature
+
+        inventory = crawler.crawl(integration_uri=integration_uri, provider=provider, max_workers=max_workers,
+                                  page_size=page_size, model_filter=changed)
+        failed = {uri: err for uri, err in inventory.errors}
+        if f'{integration_uri}/workspaces' in failed:
+            raise failed[f'{integration_uri}/workspaces']
+
+        now = time.time()
+
+        def write(connection):
+            workspace_ids = {workspace.id for workspace in inventory.workspaces}
+            for (workspace_id,) in connection.execute("select id from workspaces").fetchall():
+                if workspace_id not in workspace_ids:
+                    connection.execute("delete from workspaces where id=$id", {"id": workspace_id})
+            connection.executemany("insert or replace into workspaces (id, name, synced_at) values ($id, $name, $now)",
+                                   [{"id": w.id, "name": w.name, "now": now} for w in inventory.workspaces])
+
+            # Only prune the models of workspaces that are gone or whose model listing succeeded
+            listed = {w.id for w in inventory.workspaces if f'{integration_uri}/workspaces/{w.id}/models' not in failed}
+            model_ids = {model.id for model in inventory.models}
+            for model_id, workspace_id in connection.execute("select id, workspace_id from models").fetchall():
+                if model_id not in model_ids and (workspace_id in listed or workspace_id not in workspace_ids):
+                    connection.execute("delete from objects where model_id=$id", {"id": model_id})
+                    connection.execute("delete from models where id=$id", {"id": model_id})
+
+            for model in inventory.models:
+                connection.execute("""
+                    insert into models (id, workspace_id, name, signature, synced_at)
+                    values ($id, $workspace_id, $name, null, $now)
+                    on conflict (id) do update set
+                        workspace_id=excluded.workspace_id, name=excluded.name, synced_at=excluded.synced_at""",
+                    {"id": model.id, "workspace_id": model.workspace_id, "name": model.name, "now": now})
+
+                listings = inventory.objects.get(model.id)
+                if listings is None:
+                    continue
+
+                for kind, listing in listings.items():
+                    connection.execute("delete from objects where model_id=$model_id and kind=$kind",
+                                       {"model_id": model.id, "kind": kind})
+                    connection.executemany("""
+                        insert into objects (model_id, kind, id, name) values ($model_id, $kind, $id, $name)""",
+                        [{"model_id": model.id, "kind": kind, "id": record.id, "name": record.name} for record in listing])
+
+                # The signature is only recorded once every listing of the model succeeded
+                complete = all(kind in listings for kind in KINDS)
+                connection.execute("update models set signature=$signature where id=$id",
+                                   {"id": model.id, "signature": model_signature(model) if complete else None})
+
+        self.transaction(write)
+
+        synced = len(inventory.objects)
+        result = {"synced": synced, "skipped": len(inventory.models) - synced, "errors": inventory.errors}
+        logger.info(f'Metadata index synced {synced} models, {result["skipped"]} unchanged ({len(inventory.errors)} errors)')
+        return result
+
+    # === Lookups ===
+    def workspace_id(self, name):
+        return self._lookup("workspace", "select id from workspaces where name=$name or id=$name", {"name": name})
+
+    # Returns `(workspace_id, model_id)`; pass `workspace` when model names repeat across workspaces
+    def model_id(self, name, workspace=None):
+        query = "select workspace_id, id from models where (name=$name or id=$name)"
+        values = {"name": name}
+        if workspace is not None:
+            query += " and workspace_id=$workspace_id"
+            values["workspace_id"] = self.workspace_id(workspace)
+        return self._lookup("model", query, values, row=True)
+
+    # `kind` is one of `KINDS`, e.g. `index.object_id(model_id, "imports", "Load Sales")`
+    def object_id(self, model_id, kind, name):
+        return self._lookup(SINGULAR.get(kind, kind),
+                            "select id from objects where model_id=$model_id and kind=$kind and (name=$name or id=$name)",
+                            {"model_id": model_id, "kind": kind, "name": name})
+
+    # Resolve workspace, model and (optionally) object names in one call:
+    # returns `(workspace_id, model_id)` or `(workspace_id, model_id, object_id)`
+    def resolve(self, workspace, model, kind=None, name=None):
+        workspace_id, model_id = self.model_id(model, workspace=workspace)
+        if kind is None:
+            return workspace_id, model_id
+        return workspace_id, model_id, self.object_id(model_id, kind, name)
+
+    def _lookup(self, what, query, values, row=False):
+        with self._lock:
+            rows = self.connection.execute(query + " limit 2", values).fetchall()
+        if not rows:
+            raise errors.MetadataLookupError(f'No {what} named "{values["name"]}" in the metadata index')
+        if len(rows) > 1:
+            raise errors.MetadataLookupError(f'More than one {what} named "{values["name"]}" in the metadata index')
+        return tuple(rows[0]) if row else rows[0][0]
+
+
+# ===  Index registry  ===
+# One index (and therefore one connection) per database file per process
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(database):
+    key = os.path.abspath(database)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = MetadataIndex(database)
+        return _indexes[key]
@@ -0,0 +1,397 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    In-process request metrics with Prometheus and JSON exporters
+# ===============================================================================
+
+
+import re
+import json
+import time
+import atexit
+import bisect
+import logging
+import threading
+import functools
+import http.server
+import urllib.parse
+import sinks
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+# Request latency buckets (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+# ===  Metric types  ===
+# Every metric keeps one value per combination of label values, updated under its own lock,
+# so recording is a dictionary update and never blocks on other metrics or on exporters.
+# Label values are passed positionally in the order of `labels`
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [(dict(zip(self.labels, key)), value) for key, value in values.items()]
+
+
+# A gauge is either set explicitly, or read from `function` when collected. `function`
+# returns a number, or `{(label values...): number}` for labelled gauges
+class Gauge(Counter):
+    type = "gauge"
+
+    def __init__(self, name, help, labels=(), function=None):
+        super().__init__(name, help, labels)
+        self.function = function
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def samples(self):
+        if self.function is None:
+            return super().samples()
+        try:
+            values = self.function()
+        except Exception as err:
+            logger.warning(f'{err} while collecting {self.name}')
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(dict(zip(self.labels, key)), value) for key, value in values.items() if value is not None]
+
+
+# Counts observations into cumulative `buckets` (upper bounds), plus their sum and count
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    # `(labels, {upper bound: cumulative count}, sum, count)` per label combination
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+
+        samples = []
+        for key, (counts, total, count) in values.items():
+            cumulative, running = {}, 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                running += bucket_count
+                cumulative[bound] = running
+            samples.append((dict(zip(self.labels, key)), cumulative, total, count))
+        return samples
+
+
+# ===  Registry  ===
+# Metrics are created once by name and shared; asking again returns the same metric
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=(), function=None):
+        gauge = self._get(Gauge, name, help, labels)
+        if function is not None:
+            gauge.function = function
+        return gauge
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def collect(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+
+REGISTRY = Registry()
+
+
+# ===  Exposition  ===
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = (f'{name}="{_escape(value)}"' for name, value in labels.items())
+    return "{" + ",".join(pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Prometheus text exposition format (version 0.0.4)
+def render_prometheus(registry=REGISTRY):
+    lines = []
+    for metric in registry.collect():
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        if metric.type == "histogram":
+            for labels, buckets, total, count in metric.samples():
+                for bound, cumulative in buckets.items():
+                    lines.append(f'{metric.name}_bucket{_format_labels({**labels, "le": _format_value(bound)})} {cumulative}')
+                lines.append(f'{metric.name}_sum{_format_labels(labels)} {_format_value(total)}')
+                lines.append(f'{metric.name}_count{_format_labels(labels)} {count}')
+        else:
+            for labels, value in metric.samples():
+                lines.append(f'{metric.name}{_format_labels(labels)} {_format_value(value)}')
+    return "\n".join(lines) + "\n"
+
+
+# Every metric as plain data, e.g. for `json.dumps`
+def snapshot(registry=REGISTRY):
+    metrics = {}
+    for metric in registry.collect():
+        if metric.type == "histogram":
+            samples = [{"labels": labels, "buckets": {_format_value(bound): cumulative for bound, cumulative in buckets.items()},
+                        "sum": total, "count": count}
+                       for labels, buckets, total, count in metric.samples()]
+        else:
+            samples = [{"labels": labels, "value": value} for labels, value in metric.samples()]
+        metrics[metric.name] = {"type": metric.type, "help": metric.help, "samples": samples}
+    return {"timestamp": time.time(), "metrics": metrics}
+
+
+# ===  Exporters  ===
+# An exporter is any object with `export(registry)`; `start()` and `stop()` are optional.
+# File exporters replace their file atomically (see `sinks.FileSink`), so a reader such as
+# the node_exporter textfile collector never sees a partial file
+class PrometheusFileExporter:
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, registry):
+        with sinks.FileSink(self.path) as sink:
+            sink.write(render_prometheus(registry).encode("utf-8"))
+
+
+class JsonFileExporter:
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, registry):
+        with sinks.FileSink(self.path) as sink:
+            sink.write(json.dumps(snapshot(registry), indent=2).encode("utf-8"))
+
+
+# Serves `GET /metrics` for Prometheus to scrape; the metrics are rendered per scrape
+class PrometheusHTTPExporter:
+    def __init__(self, port=9464, host="127.0.0.1", registry=REGISTRY):
+        self.port = port
+        self.host = host
+        self.registry = registry
+        self._server = None
+
+    def export(self, registry):
+        pass
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = render_prometheus(registry).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self._server = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="Metrics HTTP", daemon=True).start()
+        logger.info(f'Serving metrics on http://{self.host}:{self.port}/metrics')
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+# Calls `exporter.export(registry)` every `interval` seconds, and once more on `stop()`
+class ExportThread(threading.Thread):
+    def __init__(self, exporter, interval=15, registry=REGISTRY):
+        threading.Thread.__init__(self, name=f'Metrics {type(exporter).__name__}', daemon=True)
+        self.exporter = exporter
+        self.interval = interval
+        self.registry = registry
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.export()
+
+    def export(self):
+        try:
+            self.exporter.export(self.registry)
+        except Exception as err:
+            logger.error(f'{err} while exporting metrics with {type(self.exporter).__name__}')
+
+    def stop(self):
+        self._stopped.set()
+        self.export()
+
+
+EXPORTER_TYPES = {
+    "prometheusFile": lambda options: PrometheusFileExporter(options["path"]),
+    "json": lambda options: JsonFileExporter(options["path"]),
+    "http": lambda options: PrometheusHTTPExporter(port=options.get("port", 9464), host=options.get("host", "127.0.0.1")),
+}
+
+_lock = threading.Lock()
+_exporters = []
+_enabled = True
+
+
+# Start `exporter`: servers are started, others are exported every `interval` seconds
+def add_exporter(exporter, interval=15):
+    if hasattr(exporter, "start"):
+        exporter.start()
+        runner = exporter
+    else:
+        runner = ExportThread(exporter, interval=interval)
+        runner.start()
+    with _lock:
+        _exporters.append(runner)
+    return runner
+
+
+# Stop every exporter, writing a final export
+def shutdown():
+    with _lock:
+        runners = list(_exporters)
+        _exporters.clear()
+    for runner in runners:
+        runner.stop()
+
+
+# === Configure metrics ===
+# Applies the `metrics` block of `settings.json`: `enabled` turns request recording on or off and
+# `exporters` lists `{"type": "prometheusFile" | "json" | "http", ...}` entries with their
+# `path` or `port` and an optional `interval`. Exporters get a final export at exit
+def configure(settings=None):
+    global _enabled
+
+    metric_settings = (settings or {}).get("metrics", {})
+    shutdown()
+    _enabled = metric_settings.get("enabled", True)
+    if not _enabled:
+        return
+
+    for options in metric_settings.get("exporters", []):
+        factory = EXPORTER_TYPES.get(options.get("type"))
+        if factory is None:
+            logger.warning(f'Unknown metrics exporter type {options.get("type")!r}')
+            continue
+        add_exporter(factory(options), interval=options.get("interval", 15))
+
+
+atexit.register(shutdown)
+
+
+# ===  Request instrumentation  ===
+# Shared by the threaded transport and the asyncio client. `endpoint` labels are the host and
+# path with IDs replaced by `*` (as in the response cache TTL patterns), so the number of
+# series stays bounded however many workspaces, models, tasks and chunks are called
+_ID = re.compile(r'[0-9A-Fa-f]{8,}|\d+|[0-9A-Za-z]+(?:-[0-9A-Za-z]+){4}')
+
+REQUEST_LATENCY = REGISTRY.histogram("anaplan_request_duration_seconds", "Latency of HTTP requests, per attempt",
+                                     ("method", "endpoint"))
+REQUESTS = REGISTRY.counter("anaplan_requests_total", "HTTP request attempts by status code ('error' when no response)",
+                            ("method", "endpoint", "status"))
+BYTES_SENT = REGISTRY.counter("anaplan_request_bytes_total", "Request body bytes sent", ("method", "endpoint"))
+BYTES_RECEIVED = REGISTRY.counter("anaplan_response_bytes_total", "Response body bytes received", ("method", "endpoint"))
+RETRIES = REGISTRY.counter("anaplan_retries_total", "Request attempts retried", ("method", "endpoint"))
+IN_FLIGHT = REGISTRY.gauge("anaplan_requests_in_flight", "HTTP requests awaiting a response")
+
+
+# A segment is an ID when it follows a collection name (`.../models/{id}`), which keeps
+# version segments such as `/2/0` intact
+@functools.lru_cache(maxsize=4096)
+def endpoint_label(uri):
+    parts = urllib.parse.urlsplit(uri)
+    segments = parts.path.split("/")
+    for index in range(1, len(segments)):
+        if _ID.fullmatch(segments[index]) and any(char.isalpha() for char in segments[index - 1]):
+            segments[index] = "*"
+    return parts.netloc + "/".join(segments)
+
+
+def enabled():
+    return _enabled
+
+
+def observe_request(method, uri, status, seconds, sent=0, received=0):
+    if not _enabled:
+        return
+    endpoint = endpoint_label(uri.split("?", 1)[0])
+    REQUEST_LATENCY.observe(seconds, method, endpoint)
+    REQUESTS.inc(method, endpoint, str(status))
+    if sent:
+        BYTES_SENT.inc(method, endpoint, amount=sent)
+    if received:
+        BYTES_RECEIVED.inc(method, endpoint, amount=received)
+
+
+def observe_retry(method, uri):
+    if _enabled:
+        RETRIES.inc(method, endpoint_label(uri.split("?", 1)[0]))
@@ -0,0 +1,170 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:        17 Oct 2026
+# @author:        Quinlan Eddy
+# Description:    Runs a dependency graph of Anaplan actions concurrently
+# ===============================================================================
+
+
+import time
+import logging
+import collections
+import concurrent.futures
+import anaplan_ops
+import token_provider
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+# Action kinds and their path below the model
+KINDS = ("imports", "exports", "processes", "actions")
+
+
+# ===  Action  ===
+# One import, export, process or action to run once every action named in `depends_on`
+# has completed successfully
+class Action:
+    def __init__(self, name, workspace_id, model_id, kind, action_id, depends_on=()):
+        if kind not in KINDS:
+            raise ValueError(f'Unknown action kind "{kind}"; expected one of {", ".join(KINDS)}')
+        self.name = name
+        self.workspace_id = workspace_id
+        self.model_id = model_id
+        self.kind = kind
+        self.action_id = action_id
+        self.depends_on = tuple(depends_on)
+
+    # Build an action from names (or IDs) resolved through the local metadata index, so
+    # no metadata calls are made (see `metadata_index.MetadataIndex.resolve`)
+    @classmethod
+    def resolve(cls, index, name, workspace, model, kind, action, depends_on=()):
+        workspace_id, model_id, action_id = index.resolve(workspace, model, kind, action)
+        return cls(name, workspace_id, model_id, kind, action_id, depends_on=depends_on)
+
+    def uri(self, integration_uri):
+        return (f'{integration_uri.rstrip("/")}/workspaces/{self.workspace_id}/models/{self.model_id}'
+                f'/{self.kind}/{self.action_id}')
+
+
+# ===  Validate the graph  ===
+# Raises `ValueError` for duplicate names, unknown dependencies or cycles
+def validate(actions):
+    by_name = {}
+    for action in actions:
+        if action.name in by_name:
+            raise ValueError(f'Duplicate action name "{action.name}"')
+        by_name[action.name] = action
+
+    for action in actions:
+        for dependency in action.depends_on:
+            if dependency not in by_name:
+                raise ValueError(f'Action "{action.name}" depends on unknown action "{dependency}"')
+
+    # Depth-first search for a back edge
+    state = {}
+
+    def visit(name, path):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f'Dependency cycle: {" -> ".join(path + [name])}')
+        state[name] = "visiting"
+        for dependency in by_name[name].depends_on:
+            visit(dependency, path + [name])
+        state[name] = "done"
+
+    for name in by_name:
+        visit(name, [])
+    return by_name
+
+
+# ===  Run the graph  ===
+# Starts every action whose dependencies have completed, with at most `max_workers`
+# actions running at once and at most `per_model` on any one model (Anaplan queues tasks
+# on a model, so launching more only adds polls). Task status is polled with
+# `anaplan_ops.PollSchedule`. When an action fails, the actions that depend on it are
+# skipped and independent branches carry on.
+# Returns `{name: {"state", "task", "error", "elapsed", "polls"}}` where `state` is
+# "COMPLETE", "FAILED" or "SKIPPED"
+def run(actions, integration_uri="https://api.anaplan.com/2/0", provider=token_provider.default_provider,
+        max_workers=4, per_model=1, poll_settings=None):
+    by_name = validate(actions)
+    poll_settings = poll_settings or {}
+    results = {}
+
+    def run_action(action):
+        # Only submitted once its model has a free slot, so the schedule starts with the task
+        result = {"state": None, "task": None, "error": None, "elapsed": 0.0, "polls": 0}
+        schedule = anaplan_ops.PollSchedule(**poll_settings)
+        action_uri = action.uri(integration_uri)
+
+        start = time.perf_counter()
+        try:
+            task_id = anaplan_ops.run_action(action_uri, provider=provider)
+            result["task"] = anaplan_ops.wait_for_task(action_uri, task_id, provider=provider, schedule=schedule)
+            result["state"] = "COMPLETE"
+        except Exception as err:
+            result["state"] = "FAILED"
+            result["error"] = err
+            logger.error(f'{err} while running action "{action.name}"')
+        result["elapsed"] = time.perf_counter() - start
+        result["polls"] = schedule.polls
+
+        return action, result
+
+    def skip(name, reason):
+        results[name] = {"state": "SKIPPED", "task": None, "error": reason, "elapsed": 0.0, "polls": 0}
+        logger.warning(f'Skipping action "{name}": {reason}')
+
+    dependents = {name: [] for name in by_name}
+    waiting = {name: set(action.depends_on) for name, action in by_name.items()}
+    for name, action in by_name.items():
+        for dependency in action.depends_on:
+            dependents[dependency].append(name)
+
+    # Ready actions wait here, by model, rather than in the pool: a worker blocked on a busy
+    # model would hold up actions for idle ones
+    ready = collections.defaultdict(collections.deque)
+    running = collections.Counter()
+    for name, deps in waiting.items():
+        if not deps:
+            ready[by_name[name].model_id].append(name)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def start_ready():
+            started = set()
+            for model_id, queue in ready.items():
+                while queue and running[model_id] < per_model:
+                    running[model_id] += 1
+                    started.add(executor.submit(run_action, by_name[queue.popleft()]))
+            return started
+
+        pending = start_ready()
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                action, result = future.result()
+                results[action.name] = result
+                running[action.model_id] -= 1
+
+                # Skip everything downstream of a failure; queue what has become ready
+                blocked = [action.name] if result["state"] != "COMPLETE" else []
+                while blocked:
+                    for dependent in dependents[blocked.pop()]:
+                        if dependent not in results:
+                            skip(dependent, f'depends on failed action "{action.name}"')
+                            blocked.append(dependent)
+
+                for dependent in dependents[action.name]:
+                    waiting[dependent].discard(action.name)
+                    if not waiting[dependent] and dependent not in results:
+                        ready[by_name[dependent].model_id].append(dependent)
+
+            pending |= start_ready()
+
+    completed = sum(1 for result in results.values() if result["state"] == "COMPLETE")
+    logger.info(f'Ran {len(results)} actions: {completed} complete, {len(results) - completed} failed or skipped '
+                f'with {sum(result["polls"] for result in results.values())} status polls')
+    return results
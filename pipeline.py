@@ -0,0 +1,151 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:        17 Oct 2026
+# @author:        Quinlan Eddy
+# Description:    Streams an export from one model into an import of another
+# ===============================================================================
+
+
+import gzip
+import time
+import logging
+import threading
+import concurrent.futures
+import anaplan_ops
+import file_transfer
+import token_provider
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+
+# ===  Model endpoint  ===
+# One end of a pipe: the model and the export (source) or import data file (target), plus
+# the token provider of the client that may access it (see `anaplan_oauth.client_provider`)
+class Endpoint:
+    def __init__(self, workspace_id, model_id, provider=token_provider.default_provider,
+                 integration_uri="https://api.anaplan.com/2/0"):
+        self.workspace_id = workspace_id
+        self.model_id = model_id
+        self.provider = provider
+        self.integration_uri = integration_uri.rstrip("/")
+
+    def model_uri(self):
+        return f'{self.integration_uri}/workspaces/{self.workspace_id}/models/{self.model_id}'
+
+    def file_uri(self, file_id):
+        return file_transfer.file_uri(self.integration_uri, self.workspace_id, self.model_id, file_id)
+
+
+# ===  Line-aligned transform  ===
+# Export chunks split rows at arbitrary byte offsets. Wraps `transform(block) -> bytes`, which
+# must accept any run of complete lines, so it only ever sees whole rows; the partial last
+# line of each chunk is carried over to the next. The first block starts with the header row
+class _LineTransform:
+    def __init__(self, transform):
+        self.transform = transform
+        self.carry = b""
+
+    def feed(self, data):
+        data = self.carry + data
+        end = data.rfind(b"\n") + 1
+        self.carry = data[end:]
+        return self.transform(data[:end]) if end else b""
+
+    def close(self):
+        data, self.carry = self.carry, b""
+        return self.transform(data) if data else b""
+
+
+# ===  Pipe an export into an import  ===
+# Runs the export on `source`, then streams its chunks into the data file `file_id` of
+# `target` without touching disk: downloads, the optional `transform` and gzip, and uploads
+# overlap, with at most `max_buffered` chunks downloaded ahead and at most `max_buffered`
+# uploads in flight. When `import_id` is given the import is run once the file is complete.
+# Returns `(TransferResult, import task or None)`
+def pipe(source, export_id, target, file_id, import_id=None, transform=None, max_buffered=4,
+         download_workers=2, upload_workers=2, compress=True, chunk_retries=2):
+    start = time.perf_counter()
+
+    export_uri = f'{source.model_uri()}/exports/{export_id}'
+    task_id = anaplan_ops.run_action(export_uri, provider=source.provider)
+    anaplan_ops.wait_for_task(export_uri, task_id, provider=source.provider)
+
+    source_uri = source.file_uri(export_id)
+    target_uri = target.file_uri(file_id)
+    chunk_ids = file_transfer.list_chunks(source.provider, source_uri)
+    downloaded = file_transfer.TransferResult(export_id, 0, len(chunk_ids))
+    result = file_transfer.TransferResult(file_id, 0, 0)
+    lines = _LineTransform(transform) if transform is not None else None
+
+    file_transfer.begin_upload(target.provider, target_uri)
+    upload_slots = threading.BoundedSemaphore(max_buffered)
+    upload_failed = threading.Event()
+
+    def upload(chunk_id, data):
+        try:
+            if compress:
+                data = gzip.compress(data, compresslevel=6)
+            file_transfer.put_chunk(target.provider, target_uri, chunk_id, data, compressed=compress,
+                                    chunk_retries=chunk_retries, result=result)
+        except BaseException:
+            upload_failed.set()
+            raise
+        finally:
+            upload_slots.release()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=download_workers) as downloads, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=upload_workers) as uploads:
+        # Keep up to `max_buffered` downloads ahead of the chunk being passed on, in order
+        ahead = [downloads.submit(file_transfer.get_chunk, source.provider, source_uri, chunk_id,
+                                  chunk_retries, downloaded)
+                 for chunk_id in chunk_ids[:max_buffered]]
+        next_download = len(ahead)
+        uploaded = []
+        out_chunks = 0
+
+        def send(data):
+            nonlocal out_chunks
+            if not data:
+                return
+            upload_slots.acquire()
+            uploaded.append(uploads.submit(upload, out_chunks, data))
+            out_chunks += 1
+            result.size += len(data)
+
+        # On the first failed chunk, stop reading the export and drop the chunks not sent yet
+        try:
+            while ahead and not upload_failed.is_set():
+                data = ahead.pop(0).result()
+                downloaded.size += len(data)
+                if next_download < len(chunk_ids):
+                    ahead.append(downloads.submit(file_transfer.get_chunk, source.provider, source_uri,
+                                                  chunk_ids[next_download], chunk_retries, downloaded))
+                    next_download += 1
+                send(lines.feed(data) if lines is not None else data)
+
+            if lines is not None and not upload_failed.is_set():
+                send(lines.close())
+
+            for future in uploaded:
+                future.result()
+        except BaseException:
+            downloads.shutdown(cancel_futures=True)
+            uploads.shutdown(cancel_futures=True)
+            raise
+
+    file_transfer.complete_upload(target.provider, target_uri, file_id, out_chunks)
+    result.chunks = out_chunks
+    result.retries += downloaded.retries
+    result.elapsed = time.perf_counter() - start
+    logger.info(f'Piped {downloaded.size / file_transfer.MB:.1f} MB from export {export_id} into file {file_id} '
+                f'({result.size / file_transfer.MB:.1f} MB after transform) in {result.elapsed:.1f}s '
+                f'at {result.throughput:.1f} MB/s')
+
+    task = None
+    if import_id is not None:
+        import_uri = f'{target.model_uri()}/imports/{import_id}'
+        task_id = anaplan_ops.run_action(import_uri, provider=target.provider)
+        task = anaplan_ops.wait_for_task(import_uri, task_id, provider=target.provider)
+    return result, task
@@ -0,0 +1,125 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Client-side token bucket rate limits per Anaplan endpoint family
+# ===============================================================================
+
+
+import time
+import logging
+import threading
+import token_store
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+
+# ===  Token bucket  ===
+# Allows `rate` requests per second on average with bursts of up to `burst`.
+# Reservations may drive the balance negative, in which case the caller waits for the
+# returned delay; this keeps callers in arrival order without a separate queue
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, count=1):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= count
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self, count=1):
+        delay = self.reserve(count)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+# ===  Shared token bucket  ===
+# Same contract as `TokenBucket`, but the balance lives in the token database so every
+# process using that database draws from the same bucket
+class SharedTokenBucket:
+    def __init__(self, database, name, rate, burst):
+        self.store = token_store.get_store(database)
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+
+    def reserve(self, count=1):
+        return self.store.reserve_tokens(self.name, rate=self.rate, burst=self.burst, count=count)
+
+    def acquire(self, count=1):
+        delay = self.reserve(count)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+# ===  Limiter registry  ===
+# Maps URI prefixes (taken from the `uris` block of `settings.json`) to the bucket of their
+# endpoint family, as configured in the `rateLimits` block. URIs without a limit are not throttled
+_lock = threading.Lock()
+_buckets = []
+
+
+def configure(settings=None):
+    settings = settings or {}
+    limits = settings.get("rateLimits", {})
+    uris = settings.get("uris", {})
+    shared = limits.get("shared", False)
+    buckets = []
+    by_family = {}
+
+    for family, uri in uris.items():
+        # `authenticationCode` lives on the OAuth service host and shares its bucket
+        limit_family = "oauthService" if family == "authenticationCode" and family not in limits else family
+        limit = limits.get(limit_family)
+        if not limit:
+            continue
+
+        if limit_family not in by_family:
+            if shared:
+                by_family[limit_family] = SharedTokenBucket(settings["database"], name=limit_family,
+                                                            rate=limit["rate"], burst=limit["burst"])
+            else:
+                by_family[limit_family] = TokenBucket(rate=limit["rate"], burst=limit["burst"])
+        buckets.append((uri.rstrip("/"), by_family[limit_family]))
+
+    # Longest prefix first so the most specific family wins
+    buckets.sort(key=lambda item: len(item[0]), reverse=True)
+
+    with _lock:
+        _buckets[:] = buckets
+
+    if by_family:
+        logger.info(f'Rate limits configured for {len(by_family)} endpoint families ({"shared" if shared else "per process"})')
+
+
+def get_bucket(uri):
+    with _lock:
+        for prefix, bucket in _buckets:
+            if uri.startswith(prefix):
+                return bucket
+    return None
+
+
+# Reserve a request slot for `uri`; returns the seconds the caller must wait first
+def reserve(uri):
+    bucket = get_bucket(uri)
+    return bucket.reserve() if bucket is not None else 0.0
+
+
+# Block until a request to `uri` is allowed; returns the seconds waited
+def acquire(uri):
+    delay = reserve(uri)
+    if delay > 0:
+        time.sleep(delay)
+    return delay
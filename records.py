@@ -0,0 +1,106 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:        17 Oct 2026
+# @author:        Quinlan Eddy
+# Description:    Compact record types for Anaplan metadata objects
+# ===============================================================================
+
+
+# ===  Record base class  ===
+# Records use `__slots__` so tens of thousands of them fit in a fraction of the memory of
+# the equivalent dicts. `_fields` maps each slot to its key in the API payload; keys that
+# are not listed are dropped
+class Record:
+    __slots__ = ()
+    _fields = {}
+
+    def __init__(self, **values):
+        for slot in self.__slots__:
+            setattr(self, slot, values.get(slot))
+
+    @classmethod
+    def from_json(cls, item):
+        record = cls.__new__(cls)
+        for slot, key in cls._fields.items():
+            setattr(record, slot, item.get(key))
+        return record
+
+    def to_dict(self):
+        return {key: getattr(self, slot) for slot, key in self._fields.items()}
+
+    def __eq__(self, other):
+        return type(other) is type(self) and all(getattr(self, s) == getattr(other, s) for s in self.__slots__)
+
+    def __repr__(self):
+        values = ", ".join(f'{slot}={getattr(self, slot)!r}' for slot in self.__slots__)
+        return f'{type(self).__name__}({values})'
+
+
+class Workspace(Record):
+    __slots__ = ("id", "name", "active", "size_allowance", "current_size")
+    _fields = {"id": "id", "name": "name", "active": "active",
+               "size_allowance": "sizeAllowance", "current_size": "currentSize"}
+
+
+class Model(Record):
+    __slots__ = ("id", "name", "active_state", "workspace_id", "last_modified", "last_saved_serial")
+    _fields = {"id": "id", "name": "name", "active_state": "activeState",
+               "workspace_id": "currentWorkspaceId", "last_modified": "lastModified",
+               "last_saved_serial": "lastSavedSerialNumber"}
+
+
+class Module(Record):
+    __slots__ = ("id", "name")
+    _fields = {"id": "id", "name": "name"}
+
+
+class List(Record):
+    __slots__ = ("id", "name")
+    _fields = {"id": "id", "name": "name"}
+
+
+class LineItem(Record):
+    __slots__ = ("id", "name", "module_id", "module_name", "format", "formula")
+    _fields = {"id": "id", "name": "name", "module_id": "moduleId", "module_name": "moduleName",
+               "format": "format", "formula": "formula"}
+
+
+class ListItem(Record):
+    __slots__ = ("id", "name", "code", "parent")
+    _fields = {"id": "id", "name": "name", "code": "code", "parent": "parent"}
+
+
+# Imports, exports, processes and actions share the same shape in listings
+class Action(Record):
+    __slots__ = ("id", "name", "type")
+    _fields = {"id": "id", "name": "name", "type": "actionType"}
+
+
+class Import(Record):
+    __slots__ = ("id", "name", "type", "data_source_id")
+    _fields = {"id": "id", "name": "name", "type": "importType", "data_source_id": "importDataSourceId"}
+
+
+class Export(Record):
+    __slots__ = ("id", "name", "type", "format")
+    _fields = {"id": "id", "name": "name", "type": "exportType", "format": "exportFormat"}
+
+
+class Process(Record):
+    __slots__ = ("id", "name")
+    _fields = {"id": "id", "name": "name"}
+
+
+# Listing key in the API response for each record type
+LISTING_KEYS = {
+    Workspace: "workspaces",
+    Model: "models",
+    Module: "modules",
+    List: "lists",
+    LineItem: "items",
+    ListItem: "listItems",
+    Action: "actions",
+    Import: "imports",
+    Export: "exports",
+    Process: "processes",
+}
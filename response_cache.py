@@ -0,0 +1,309 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:        17 Oct 2026
+# @author:        Quinlan Eddy
+# Description:    TTL / LRU cache for read-only GET responses with revalidation
+# ===============================================================================
+
+
+import json
+import time
+import hashlib
+import fnmatch
+import logging
+import threading
+import functools
+import collections
+import jwt
+import requests
+import requests.utils
+import requests.structures
+import token_store
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+
+# === Cache defaults ===
+# Overridden by the `responseCache` block in `settings.json`
+DEFAULT_SETTINGS = {
+    "enabled": False,
+    "maxEntries": 256,             # Entries kept in memory
+    "maxBytes": 64 * 1024 * 1024,  # Total body size kept in memory
+    "maxEntryBytes": 8 * 1024 * 1024,  # Larger responses are never cached
+    "defaultTtl": None,            # TTL of endpoints not listed in `ttls`; `None` leaves them uncached
+    "ttls": {},                    # Per endpoint TTL, keyed by URI or by path below `uris.integrationApi` (`*` matches any ID)
+    "database": None,              # Optional SQLite file that keeps entries across runs
+    "maxDiskEntries": 4096
+}
+
+
+# ===  Cache entry  ===
+class Entry:
+    __slots__ = ("status_code", "headers", "content", "url", "etag", "last_modified", "expires_at")
+
+    def __init__(self, status_code, headers, content, url, expires_at):
+        self.status_code = status_code
+        self.headers = dict(headers)
+        self.content = content
+        self.url = url
+        self.etag = self.headers.get("ETag")
+        self.last_modified = self.headers.get("Last-Modified")
+        self.expires_at = expires_at
+
+    @property
+    def fresh(self):
+        return time.time() < self.expires_at
+
+    # Build a `requests.Response` so callers cannot tell a cached response from a live one
+    def to_response(self):
+        res = requests.Response()
+        res.status_code = self.status_code
+        res.headers = requests.structures.CaseInsensitiveDict(self.headers)
+        res._content = self.content
+        res._content_consumed = True
+        res.url = self.url
+        res.encoding = requests.utils.get_encoding_from_headers(res.headers)
+        res.from_cache = True
+        return res
+
+
+# ===  Cache key  ===
+# Responses are cached per user: the key holds the `sub` claim of the bearer token (or a
+# digest of the token itself when it is not a JWT), so users never see each other's data
+@functools.lru_cache(maxsize=64)
+def token_subject(token):
+    try:
+        subject = jwt.decode(token, options={"verify_signature": False}).get("sub")
+        if subject:
+            return subject
+    except jwt.exceptions.PyJWTError:
+        pass
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+# `uri` must include the query string: build it with `request_url` when `params` are passed
+def cache_key(uri, headers=None):
+    headers = {name.lower(): value for name, value in (headers or {}).items()}
+    authorization = headers.get("authorization", "")
+    subject = token_subject(authorization[7:]) if authorization.startswith("Bearer ") else ""
+    return f'{subject} {headers.get("accept", "")} {uri}'
+
+
+# The URL `requests` will fetch for `uri` and `params`
+def request_url(uri, params=None):
+    if not params:
+        return uri
+    return requests.Request("GET", uri, params=params).prepare().url
+
+
+# ===  On-disk tier  ===
+# Keeps entries across runs; the least recently used rows beyond `max_entries` are dropped
+class DiskCache(token_store.Database):
+    def __init__(self, database, max_entries=4096, **kwargs):
+        super().__init__(database, **kwargs)
+        self.max_entries = max_entries
+
+    def _migrate(self):
+        def migrate(connection):
+            connection.execute("""
+                create table if not exists responses (
+                    key text primary key,
+                    status_code integer not null,
+                    headers text not null,
+                    content blob not null,
+                    url text not null,
+                    expires_at real not null,
+                    accessed_at real not null
+                )""")
+            connection.execute("create index if not exists responses_accessed_at on responses (accessed_at)")
+
+        self.transaction(migrate)
+
+    def get(self, key):
+        with self._lock:
+            row = self.connection.execute("""
+                select status_code, headers, content, url, expires_at from responses where key=$key""",
+                {"key": key}).fetchone()
+        if row is None:
+            return None
+
+        self.transaction(lambda connection: connection.execute(
+            "update responses set accessed_at=$now where key=$key", {"key": key, "now": time.time()}))
+        return Entry(row[0], json.loads(row[1]), bytes(row[2]), row[3], row[4])
+
+    def put(self, key, entry):
+        def put(connection):
+            connection.execute("""
+                insert or replace into responses (key, status_code, headers, content, url, expires_at, accessed_at)
+                values ($key, $status_code, $headers, $content, $url, $expires_at, $now)""",
+                {"key": key, "status_code": entry.status_code, "headers": json.dumps(entry.headers),
+                 "content": entry.content, "url": entry.url, "expires_at": entry.expires_at, "now": time.time()})
+            connection.execute("""
+                delete from responses where key in (
+                    select key from responses order by accessed_at desc limit -1 offset $max)""",
+                {"max": self.max_entries})
+
+        self.transaction(put)
+
+
+# ===  Response cache  ===
+# In-memory LRU (bounded by entry count and total body size) in front of an optional
+# on-disk tier. A fresh entry is served without a request. A stale entry with an `ETag` or
+# `Last-Modified` validator is revalidated with a conditional request and served again on
+# `304 Not Modified`. Only `200` responses without `Cache-Control: no-store` are stored, and
+# only for endpoints with a TTL: those matching `ttls` (metadata listings), plus every other
+# endpoint when `default_ttl` is set. Task polls and chunk downloads are never cached by default
+class ResponseCache:
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, max_entry_bytes=8 * 1024 * 1024,
+                 default_ttl=None, ttls=None, database=None, max_disk_entries=4096):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.default_ttl = default_ttl
+        # Endpoint patterns (`*` matches any ID), most specific first
+        self.ttls = sorted((ttls or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self.disk = DiskCache(database, max_entries=max_disk_entries) if database else None
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    # TTL of the endpoint `uri` belongs to, or `None` when it is not cached. Patterns match
+    # the whole URI (without the query string), so a TTL for a listing never applies to the
+    # resources below it
+    def ttl(self, uri):
+        endpoint = uri.split("?", 1)[0].rstrip("/")
+        for pattern, ttl in self.ttls:
+            if fnmatch.fnmatchcase(endpoint, pattern):
+                return ttl
+        return self.default_ttl
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "revalidations": self.revalidations,
+                    "evictions": self.evictions, "entries": len(self._entries), "bytes": self._size}
+
+    def lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        if self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self._store(key, entry)
+        return entry
+
+    def store(self, key, entry):
+        self._store(key, entry)
+        if self.disk is not None:
+            self.disk.put(key, entry)
+
+    def _store(self, key, entry):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous.content)
+            self._entries[key] = entry
+            self._size += len(entry.content)
+
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.content)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    # Serve `GET uri` from the cache or through `send(method, uri, headers=..., **kwargs)`,
+    # which must return a `requests.Response`. Requests with a body are passed straight through
+    def get(self, send, uri, headers=None, **kwargs):
+        url = request_url(uri, kwargs.get("params"))
+        ttl = self.ttl(url)
+        if ttl is None or any(kwargs.get(name) is not None for name in ("data", "json", "files")):
+            return send("GET", uri, headers=headers, **kwargs)
+
+        key = cache_key(url, headers)
+        entry = self.lookup(key)
+
+        if entry is not None and entry.fresh:
+            with self._lock:
+                self.hits += 1
+            return entry.to_response()
+
+        # Revalidate a stale entry with a conditional request
+        request_headers = dict(headers or {})
+        if entry is not None:
+            if entry.etag:
+                request_headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                request_headers["If-Modified-Since"] = entry.last_modified
+
+        res = send("GET", uri, headers=request_headers, **kwargs)
+
+        if res.status_code == 304 and entry is not None:
+            res.close()
+            entry.expires_at = time.time() + ttl
+            self.store(key, entry)
+            with self._lock:
+                self.revalidations += 1
+            return entry.to_response()
+
+        with self._lock:
+            self.misses += 1
+
+        if self._cacheable(res, ttl):
+            entry = Entry(res.status_code, res.headers, res.content, res.url, time.time() + ttl)
+            self.store(key, entry)
+        return res
+
+    def _cacheable(self, res, ttl):
+        if res.status_code != 200 or "no-store" in res.headers.get("Cache-Control", ""):
+            return False
+        # Without a TTL an entry is only worth keeping if it can be revalidated
+        if ttl <= 0 and not (res.headers.get("ETag") or res.headers.get("Last-Modified")):
+            return False
+        # Large (or unsized streamed) bodies are passed through untouched
+        length = res.headers.get("Content-Length")
+        return length is not None and int(length) <= self.max_entry_bytes
+
+
+# ===  Shared cache  ===
+_lock = threading.Lock()
+_cache = None
+
+
+def configure(settings=None):
+    global _cache
+
+    settings = settings or {}
+    cache_settings = dict(DEFAULT_SETTINGS)
+    cache_settings.update(settings.get("responseCache", {}))
+
+    # Relative TTL keys are paths below the Integration API
+    integration_uri = settings.get("uris", {}).get("integrationApi", "").rstrip("/")
+    ttls = {(key if "://" in key else integration_uri + key): ttl for key, ttl in cache_settings["ttls"].items()}
+
+    cache = None
+    if cache_settings["enabled"]:
+        cache = ResponseCache(max_entries=cache_settings["maxEntries"], max_bytes=cache_settings["maxBytes"],
+                              max_entry_bytes=cache_settings["maxEntryBytes"], default_ttl=cache_settings["defaultTtl"],
+                              ttls=ttls, database=cache_settings["database"],
+                              max_disk_entries=cache_settings["maxDiskEntries"])
+        logger.info(f'Response cache enabled for up to {cache.max_entries} entries')
+
+    with _lock:
+        _cache = cache
+
+
+def get_cache():
+    with _lock:
+        return _cache
@@ -0,0 +1,172 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:        17 Oct 2026
+# @author:        Quinlan Eddy
+# Description:    Retry policy and per-host circuit breakers for Anaplan API calls
+# ===============================================================================
+
+
+import time
+import random
+import logging
+import threading
+import email.utils
+import requests
+import urllib3
+import errors
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+
+# ===  Retry policy  ===
+# Decides whether a failed call may be retried and how long to wait first.
+# Idempotent methods are retried on connection errors and on any status in `retry_statuses`.
+# Other methods (POST) are only retried when the server cannot have acted on the request:
+# the connection was never established, or the server answered `429` or `503`
+class RetryPolicy:
+    def __init__(self, max_attempts=4, backoff_base=0.5, backoff_max=30, max_retry_after=120,
+                 retry_statuses=(429, 500, 502, 503, 504)):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.retry_statuses = tuple(retry_statuses)
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(max_attempts=settings.get("maxAttempts", 4),
+                   backoff_base=settings.get("backoffBase", 0.5),
+                   backoff_max=settings.get("backoffMax", 30),
+                   max_retry_after=settings.get("maxRetryAfter", 120),
+                   retry_statuses=settings.get("retryStatuses", (429, 500, 502, 503, 504)))
+
+    @staticmethod
+    def is_idempotent(method, idempotent=None):
+        return idempotent if idempotent is not None else method.upper() in IDEMPOTENT_METHODS
+
+    def retry_on_status(self, method, status, idempotent=None):
+        if status not in self.retry_statuses:
+            return False
+        return self.is_idempotent(method, idempotent) or status in (429, 503)
+
+    def retry_on_error(self, method, error, idempotent=None):
+        if self.is_idempotent(method, idempotent):
+            return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+        return isinstance(error, requests.exceptions.ConnectTimeout) or never_connected(error)
+
+    # Seconds to wait before attempt `attempt + 1`. A server `Retry-After` wins over the
+    # exponential backoff (with full jitter)
+    def backoff(self, attempt, retry_after=None):
+        delay = parse_retry_after(retry_after)
+        if delay is not None:
+            return min(delay, self.max_retry_after)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+
+# A `requests.ConnectionError` caused by urllib3's `NewConnectionError` (connection refused,
+# name resolution failed) means the request was never sent
+def never_connected(error):
+    if not isinstance(error, requests.exceptions.ConnectionError) or not error.args:
+        return False
+    reason = getattr(error.args[0], "reason", error.args[0])
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+# ===  Retry-After header  ===
+# Accepts either delta-seconds or an HTTP date; returns seconds or `None`
+def parse_retry_after(value, now=None):
+    if value is None:
+        return None
+    value = str(value).strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at - (now if now is not None else time.time()))
+
+
+# ===  Circuit breaker  ===
+# After `failure_threshold` consecutive failures the circuit opens and calls to the host fail
+# fast with `CircuitOpenError` for `reset_timeout` seconds. Then a single trial call is let
+# through (half-open): success closes the circuit, failure opens it again
+class CircuitBreaker:
+    def __init__(self, host, failure_threshold=5, reset_timeout=30):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.time() - self.opened_at < self.reset_timeout:
+                return "open"
+            return "half-open"
+
+    def before_request(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            retry_at = self.opened_at + self.reset_timeout
+            if time.time() < retry_at or self._trial_in_flight:
+                raise errors.CircuitOpenError(self.host, retry_at)
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f'Circuit closed for {self.host}')
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._trial_in_flight:
+                    logger.warning(f'Circuit opened for {self.host} after {self.failures} consecutive failures')
+                self.opened_at = time.time()
+            self._trial_in_flight = False
+
+    # End a call whose outcome was never recorded (it failed before the host answered, for a
+    # reason that says nothing about the host), so a half-open circuit can admit a new trial
+    def release(self):
+        with self._lock:
+            self._trial_in_flight = False
+
+
+# ===  Circuit breaker registry  ===
+# One breaker per host, shared by every thread
+_breakers = {}
+_breakers_lock = threading.Lock()
+DEFAULT_BREAKER_SETTINGS = {"failureThreshold": 5, "resetTimeout": 30}
+_breaker_settings = dict(DEFAULT_BREAKER_SETTINGS)
+
+
+def configure_breakers(settings=None):
+    with _breakers_lock:
+        _breaker_settings.clear()
+        _breaker_settings.update(DEFAULT_BREAKER_SETTINGS)
+        _breaker_settings.update(settings or {})
+        _breakers.clear()
+
+
+def get_breaker(host):
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host,
+                                             failure_threshold=_breaker_settings["failureThreshold"],
+                                             reset_timeout=_breaker_settings["resetTimeout"])
+        return _breakers[host]
@@ -0,0 +1,142 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:        17 Oct 2026
+# @author:        Quinlan Eddy
+# Description:    Streaming sinks for API responses and downloads
+# ===============================================================================
+
+
+import os
+import gzip
+import stat
+import logging
+import tempfile
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+# Read once: `os.umask` can only be queried by setting it, which would race with other threads
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+# ===  Sink interface  ===
+# A sink receives a response body in chunks. `commit()` makes the data visible once every
+# chunk has been written; `abort()` discards it. Used as a context manager, a sink commits
+# on success and aborts if an exception escapes the block
+class Sink:
+    def write(self, chunk):
+        raise NotImplementedError
+
+    def commit(self):
+        pass
+
+    def abort(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+
+# ===  File sink  ===
+# Writes to a temporary file in the target directory and renames it over `path` on commit,
+# so readers only ever see the previous file or the complete new one. With `compress=True`
+# the data is gzipped on the way to disk. The temporary file is created on first use and
+# given the mode of the file it replaces (or, for a new file, the mode `open()` would give it)
+class FileSink(Sink):
+    def __init__(self, path, compress=False, compress_level=6):
+        self.path = path
+        self.compress = compress
+        self.compress_level = compress_level
+        self.bytes_written = 0
+        self.temp_path = None
+        self._raw = None
+        self._file = None
+
+    def __enter__(self):
+        self._open()
+        return self
+
+    def _open(self):
+        if self._raw is not None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, self.temp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(self.path)}.', suffix='.tmp', dir=directory)
+        self._raw = os.fdopen(fd, 'wb')
+
+        # `mkstemp` creates the file owner-only, and `os.replace` would keep that mode
+        try:
+            mode = stat.S_IMODE(os.stat(self.path).st_mode)
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(self.temp_path, mode)
+
+        self._file = gzip.GzipFile(fileobj=self._raw, mode='wb', compresslevel=self.compress_level) \
+            if self.compress else self._raw
+
+    def write(self, chunk):
+        self._open()
+        self._file.write(chunk)
+        self.bytes_written += len(chunk)
+
+    def commit(self):
+        self._open()
+        if self._raw.closed:
+            return
+        if self._file is not self._raw:
+            self._file.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+        os.replace(self.temp_path, self.path)
+        logger.info(f'Wrote {self.bytes_written} bytes to {self.path}')
+
+    def abort(self):
+        if self._raw is None or self._raw.closed:
+            return
+        if self._file is not self._raw:
+            self._file.close()
+        self._raw.close()
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+
+# ===  Memory sink  ===
+# Collects the chunks in memory; handy for small responses and tests
+class MemorySink(Sink):
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, chunk):
+        self.chunks.append(chunk)
+
+    def getvalue(self):
+        return b''.join(self.chunks)
+
+
+# ===  Stream a response into a sink  ===
+# `res` must have been requested with `stream=True`. The body is never held in memory as a
+# whole; the sink is committed only after the last chunk. Returns the number of bytes read
+def stream_response(res, sink, chunk_size=CHUNK_SIZE):
+    total = 0
+    try:
+        with sink:
+            for chunk in res.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    sink.write(chunk)
+                    total += len(chunk)
+    finally:
+        res.close()
+    return total
@@ -0,0 +1,184 @@
+"""
+test cases for anaplan_async
+"""
+
+import asyncio
+import time
+import types
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import pytest
+import anaplan_async
+import errors
+import sinks
+import token_provider
+import transport
+
+
+def make_provider():
+    state = types.SimpleNamespace(access_token="token-0", refresh_token="refresh", expires_at=time.time() + 2000)
+    calls = []
+
+    def refresh():
+        calls.append(1)
+        provider.set_tokens(access_token=f'token-{len(calls)}', expires_at=time.time() + 2000)
+
+    provider = token_provider.TokenProvider(state=state, refresh=refresh)
+    return provider, calls
+
+
+async def serve_workspaces(in_flight):
+    async def workspaces(request):
+        if request.headers['Authorization'] != 'Bearer token-1':
+            return web.json_response({"status": {"code": 401}}, status=401)
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        return web.json_response({"workspaces": [{"id": "w1", "name": "Workspace"}]})
+
+    app = web.Application()
+    app.router.add_get('/2/0/workspaces', workspaces)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+def test_concurrent_requests_share_one_refresh_and_respect_limit():
+    provider, calls = make_provider()
+    in_flight = {"now": 0, "max": 0}
+
+    async def run():
+        server = await serve_workspaces(in_flight)
+        try:
+            async with anaplan_async.AsyncAnaplanClient(provider=provider, integration_uri=str(server.make_url('/2/0')),
+                                                        max_concurrency=5) as client:
+                return await anaplan_async.get_workspaces(client, counter=20)
+        finally:
+            await server.close()
+
+    results = asyncio.run(run())
+
+    assert len(results) == 20
+    assert all(r == [{"id": "w1", "name": "Workspace"}] for r in results)
+    assert len(calls) == 1
+    assert in_flight["max"] <= 5
+
+
+def test_refresh_task_stops_immediately():
+    provider, calls = make_provider()
+
+    async def run():
+        stop = asyncio.Event()
+        task = asyncio.create_task(anaplan_async.refresh_task(provider=provider, stop=stop))
+        await asyncio.sleep(0.05)
+        stop.set()
+        await asyncio.wait_for(task, timeout=1)
+
+    asyncio.run(run())
+    assert calls == []
+
+
+def test_refresh_task_survives_a_failed_refresh():
+    calls = []
+
+    def refresh():
+        calls.append(1)
+        if len(calls) == 1:
+            raise errors.AnaplanConnectionError("connection reset")
+        provider.set_tokens(access_token="token-1", expires_at=time.time() + 2000)
+
+    state = types.SimpleNamespace(access_token="token-0", refresh_token="refresh", expires_at=time.time() - 1)
+    provider = token_provider.TokenProvider(state=state, refresh=refresh)
+
+    async def run():
+        stop = asyncio.Event()
+        task = asyncio.create_task(anaplan_async.refresh_task(provider=provider, stop=stop, min_delay=0.05))
+        await asyncio.sleep(0.3)
+        assert not task.done()
+        stop.set()
+        await asyncio.wait_for(task, timeout=1)
+
+    asyncio.run(run())
+    assert len(calls) == 2 and provider.current_token() == "token-1"
+
+
+def test_post_read_timeout_is_not_retried():
+    provider, _ = make_provider()
+    calls = []
+
+    async def slow_task(request):
+        calls.append(1)
+        await asyncio.sleep(0.5)
+        return web.json_response({"task": {"taskId": "t1"}})
+
+    async def run():
+        app = web.Application()
+        app.router.add_post('/2/0/tasks', slow_task)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            async with anaplan_async.AsyncAnaplanClient(provider=provider,
+                                                        integration_uri=str(server.make_url('/2/0'))) as client:
+                await client.request("POST", str(server.make_url('/2/0/tasks')), json={})
+        finally:
+            await server.close()
+
+    transport.configure({"transport": {"readTimeout": 0.1}})
+    try:
+        with pytest.raises(errors.AnaplanConnectionError):
+            asyncio.run(run())
+    finally:
+        transport.configure()
+
+    # The server may have started the task, so the POST must not be sent again
+    assert calls == [1]
+
+
+def test_download_is_retried_without_holding_a_slot_while_backing_off(tmp_path):
+    provider, _ = make_provider()
+    provider.set_tokens(access_token="token-1", expires_at=time.time() + 2000)
+    attempts = []
+    finished = []
+
+    async def export(request):
+        attempts.append(request.headers['Authorization'])
+        if len(attempts) == 1:
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        return web.Response(body=b"a,b\n1,2\n")
+
+    async def workspaces_list(request):
+        return web.json_response({"workspaces": []})
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/2/0/files/f1', export)
+        app.router.add_get('/2/0/workspaces', workspaces_list)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            async with anaplan_async.AsyncAnaplanClient(provider=provider, integration_uri=str(server.make_url('/2/0')),
+                                                        max_concurrency=1) as client:
+                async def download():
+                    await client.download(str(server.make_url('/2/0/files/f1')), sinks.FileSink(str(tmp_path / "f1.csv")))
+                    finished.append("download")
+
+                async def workspaces():
+                    await asyncio.sleep(0.05)
+                    await client.get_workspaces()
+                    finished.append("workspaces")
+
+                await asyncio.gather(download(), workspaces())
+        finally:
+            await server.close()
+
+    transport.configure({"retry": {"maxRetryAfter": 0.3}})
+    try:
+        asyncio.run(run())
+    finally:
+        transport.configure()
+
+    assert attempts == ["Bearer token-1"] * 2
+    assert (tmp_path / "f1.csv").read_bytes() == b"a,b\n1,2\n"
+    # The workspace list went through while the download was backing off
+    assert finished == ["workspaces", "download"]
@@ -0,0 +1,215 @@
+"""
+test cases for anaplan_oauth
+"""
+
+import json
+import time
+import types
+import threading
+import jwt
+import pytest
+import anaplan_oauth
+import errors
+import globals
+import token_provider
+import token_store
+import transport
+
+
+def test_token_expiry_prefers_expires_in():
+    before = time.time()
+    expires_at = anaplan_oauth.token_expiry({"access_token": "opaque", "expires_in": 2100})
+    assert before + 2100 <= expires_at <= time.time() + 2100
+
+
+def test_token_expiry_reads_jwt_exp_claim():
+    token = jwt.encode({"exp": 1900000000}, "a-signing-key-of-at-least-32-bytes", algorithm="HS256")
+    assert anaplan_oauth.token_expiry({"access_token": token}) == 1900000000
+
+
+def test_token_expiry_falls_back_to_token_ttl(monkeypatch):
+    monkeypatch.setattr(globals.Auth, "token_ttl", 600)
+    before = time.time()
+    expires_at = anaplan_oauth.token_expiry({"access_token": "opaque"})
+    assert before + 600 <= expires_at <= time.time() + 600
+
+
+@pytest.mark.parametrize(
+    'expires_in, fraction, jitter, min_delay, low, high',
+    [
+        # no jitter refreshes at exactly the requested fraction of the lifetime
+        (2000, 0.75, 0, 30, 1500, 1500),
+        # jitter only ever pulls the refresh forward
+        (2000, 0.75, 0.1, 30, 1350, 1500),
+        # short-lived tokens are held to the minimum delay
+        (20, 0.5, 0, 15, 15, 15),
+        # but never scheduled past expiry
+        (10, 0.5, 0, 30, 10, 10),
+        # already expired tokens are refreshed immediately
+        (-5, 0.75, 0.1, 30, 0, 0),
+    ])
+def test_next_refresh_delay(expires_in, fraction, jitter, min_delay, low, high):
+    now = 1000000.0
+    delay = anaplan_oauth.next_refresh_delay(now + expires_in, lifetime_fraction=fraction, jitter=jitter, min_delay=min_delay, now=now)
+    assert low <= delay <= high
+
+
+def test_refresh_clients_reports_each_client(tmp_path, monkeypatch):
+    database = str(tmp_path / "token.db3")
+    good = "0123456789abcdef0123456789abcdef"
+    bad = "fedcba9876543210fedcba9876543210"
+    for client_id in (good, bad):
+        token_store.get_store(database).write(
+            client_id=client_id, refresh_token=anaplan_oauth.encode_token(client_id, "refresh_token", f'refresh-{client_id}'))
+
+    def fake_post(uri, headers=None, json=None):
+        status = 200 if json["client_id"] == good else 400
+        body = {"access_token": "access", "refresh_token": "rotated", "expires_in": 2100}
+        return types.SimpleNamespace(status_code=status, url=uri, text="bad request", json=lambda: body)
+
+    monkeypatch.setattr(transport, "post", fake_post)
+    results = {r["client_id"]: r for r in anaplan_oauth.refresh_clients(
+        uri="https://us1a.app.anaplan.com/oauth/token", database=database, rotatable_token=True, max_workers=2)}
+
+    assert results[good]["error"] is None
+    assert results[good]["access_token"] == "access"
+    assert isinstance(results[bad]["error"], errors.AnaplanHTTPError)
+    assert results[bad]["error"].status == 400
+    assert all(r["latency"] >= 0 for r in results.values())
+
+    # Rotated token persisted for the successful client only
+    assert anaplan_oauth.read_token_db(database, client_id=good)["refresh_token"] == "rotated"
+    assert anaplan_oauth.read_token_db(database, client_id=bad)["refresh_token"] == f'refresh-{bad}'
+
+
+def test_coordinated_refresh_calls_token_endpoint_once(tmp_path):
+    database = str(tmp_path / "token.db3")
+    client_id = "0123456789abcdef0123456789abcdef"
+    anaplan_oauth.write_tokens(database, client_id=client_id, refresh_token="refresh-0")
+    calls = []
+
+    def request_tokens(refresh_token):
+        calls.append(refresh_token)
+        time.sleep(0.3)
+        return {"access_token": "access-1", "refresh_token": "refresh-1", "expires_in": 2100}
+
+    results = []
+
+    def worker():
+        results.append(anaplan_oauth.coordinated_refresh(
+            database, client_id=client_id, request_tokens=request_tokens, rotatable_token=True, poll_interval=0.05))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert calls == ["refresh-0"]
+    assert [r["access_token"] for r in results] == ["access-1"] * 4
+    assert anaplan_oauth.read_token_db(database, client_id=client_id)["refresh_token"] == "refresh-1"
+
+
+def test_lease_is_renewed_while_the_token_request_runs(tmp_path):
+    database = str(tmp_path / "token.db3")
+    client_id = "0123456789abcdef0123456789abcdef"
+    anaplan_oauth.write_tokens(database, client_id=client_id, refresh_token="refresh-0")
+    calls = []
+
+    # Takes several lease durations, as a request waiting on `Retry-After` would
+    def request_tokens(refresh_token):
+        calls.append(refresh_token)
+        time.sleep(0.8)
+        return {"access_token": "access-1", "refresh_token": "refresh-1", "expires_in": 2100}
+
+    def worker():
+        anaplan_oauth.coordinated_refresh(database, client_id=client_id, request_tokens=request_tokens,
+                                          rotatable_token=True, lease_duration=0.2, poll_interval=0.05)
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert calls == ["refresh-0"]
+
+
+@pytest.mark.parametrize('lifetime, reused', [(2000, True), (60, False)])
+def test_load_cached_tokens(tmp_path, monkeypatch, lifetime, reused):
+    database = str(tmp_path / "token.db3")
+    client_id = "0123456789abcdef0123456789abcdef"
+    anaplan_oauth.write_tokens(database, client_id=client_id, refresh_token="refresh",
+                               access_token="cached", expires_at=time.time() + lifetime)
+
+    state = types.SimpleNamespace(client_id=client_id, access_token=None, refresh_token="none", expires_at=0)
+    monkeypatch.setattr(globals, "Auth", state)
+    monkeypatch.setattr(token_provider.default_provider, "state", state)
+
+    assert anaplan_oauth.load_cached_tokens(database, min_lifetime=300) is reused
+    assert (state.access_token == "cached") is reused
+
+
+class FakeDeviceGrant:
+    # The token endpoint answers `responses` in order for each device code, then succeeds
+    def __init__(self, responses=()):
+        self.responses = list(responses)
+        self.polls = {}
+        self.lock = threading.Lock()
+
+    def post(self, uri, **kwargs):
+        request = kwargs["json"]
+        if uri.endswith("/device/code"):
+            body = {"device_code": f'device-{request["client_id"]}', "user_code": "ABCD-EFGH", "interval": 2,
+                    "expires_in": 900, "verification_uri_complete": f'https://example.com/activate?c={request["client_id"]}'}
+            return types.SimpleNamespace(status_code=200, url=uri, text=json.dumps(body), json=lambda: body)
+
+        with self.lock:
+            poll = self.polls[request["device_code"]] = self.polls.get(request["device_code"], 0) + 1
+        if poll <= len(self.responses):
+            error = self.responses[poll - 1]
+            return types.SimpleNamespace(status_code=400, url=uri, text=error, json=lambda: {"error": error})
+        body = {"access_token": f'access-{request["client_id"]}', "refresh_token": "refresh", "expires_in": 2100}
+        return types.SimpleNamespace(status_code=200, url=uri, text="", json=lambda: body)
+
+
+def test_device_polling_honours_interval_and_slow_down(monkeypatch):
+    server = FakeDeviceGrant(["authorization_pending", "slow_down", "authorization_pending"])
+    waits = []
+    monkeypatch.setattr(transport, "post", server.post)
+    monkeypatch.setattr(anaplan_oauth.time, "sleep", waits.append)
+
+    res = anaplan_oauth.poll_device_tokens("https://us1a.app.anaplan.com/oauth/token", "client", "device-client",
+                                           interval=2, expires_in=900)
+
+    assert res["access_token"] == "access-client"
+    assert waits == [2, 2, 7, 7]
+
+
+@pytest.mark.parametrize('responses, expires_in', [(["access_denied"], 900), (["expired_token"], 900), ([], -1)])
+def test_device_polling_stops_on_denial_or_expiry(monkeypatch, responses, expires_in):
+    monkeypatch.setattr(transport, "post", FakeDeviceGrant(responses).post)
+    monkeypatch.setattr(anaplan_oauth.time, "sleep", lambda seconds: None)
+
+    with pytest.raises(errors.DeviceAuthorizationError):
+        anaplan_oauth.poll_device_tokens("https://us1a.app.anaplan.com/oauth/token", "client", "device-client",
+                                         expires_in=expires_in)
+
+
+def test_register_devices_concurrently(tmp_path, monkeypatch):
+    database = str(tmp_path / "token.db3")
+    clients = [{"client_id": f'{i:032x}', "region": "us1a"} for i in range(5)]
+    server = FakeDeviceGrant(["authorization_pending"])
+    shown = []
+    monkeypatch.setattr(transport, "post", server.post)
+    monkeypatch.setattr(anaplan_oauth.time, "sleep", lambda seconds: None)
+
+    results = anaplan_oauth.register_devices("https://us1a.app.anaplan.com/oauth/device/code",
+                                             "https://us1a.app.anaplan.com/oauth/token", database, clients,
+                                             on_code=lambda client_id, device: shown.append(client_id))
+
+    assert all(result["error"] is None for result in results)
+    assert sorted(shown) == [client["client_id"] for client in clients]
+    for client in clients:
+        tokens = anaplan_oauth.read_token_db(database, client_id=client["client_id"], region="us1a")
+        assert tokens["access_token"] == f'access-{client["client_id"]}'
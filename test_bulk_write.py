@@ -0,0 +1,103 @@
+"""
+test cases for bulk_write
+"""
+
+import json
+import threading
+import types
+import pytest
+import bulk_write
+
+API = "https://api.anaplan.com/2/0"
+
+
+class FakeListServer:
+    # Rejects items named "bad", and bodies larger than `max_body` bytes with `413`;
+    # `respond` builds the responses (see the `make_response` fixture)
+    def __init__(self, respond, max_body=None, fail_requests=()):
+        self.respond = respond
+        self.max_body = max_body
+        self.fail_requests = set(fail_requests)
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def request(self, method, uri, **kwargs):
+        body = kwargs["json"]
+        items = body["items"]
+        with self.lock:
+            number = len(self.requests)
+            self.requests.append((method, uri, len(items)))
+        if number in self.fail_requests:
+            return self.respond(status_code=500, body={"status": "error"})
+        if self.max_body and len(json.dumps(body)) > self.max_body:
+            return self.respond(status_code=413)
+        failures = [{"requestIndex": i, "failureType": "Invalid", "failureMessageDetails": "bad name"}
+                    for i, item in enumerate(items) if item["name"] == "bad"]
+        return self.respond(body={"added": len(items) - len(failures), "ignored": 0, "failures": failures})
+
+
+@pytest.fixture
+def list_server(make_response):
+    return lambda **kwargs: FakeListServer(make_response, **kwargs)
+
+
+def items(count, bad=()):
+    for i in range(count):
+        yield {"name": "bad" if i in bad else f'item {i}', "code": f'C{i}'}
+
+
+def test_batches_respect_item_and_byte_limits():
+    by_items = list(bulk_write.batches(items(25), max_items=10))
+    assert [len(batch) for _, batch in by_items] == [10, 10, 5]
+    assert [offset for offset, _ in by_items] == [0, 10, 20]
+
+    for _, batch in bulk_write.batches(items(100), max_bytes=300):
+        assert len(json.dumps(batch, separators=(",", ":"))) <= 300
+
+
+def test_bulk_add_reports_rejected_records(list_server):
+    server = list_server()
+
+    report = bulk_write.add_list_items("w1", "m1", "101000000001", items(50, bad={7, 33}), integration_uri=API,
+                                       provider=server, max_items=10)
+
+    assert report.records == 50
+    assert report.written == 48
+    assert [batch.offset for batch in report.failed_batches] == [0, 30]
+    assert [failure[0] for batch in report.failed_batches for failure in batch.failures] == [7, 33]
+    assert server.requests[0][1] == f'{API}/workspaces/w1/models/m1/lists/101000000001/items?action=add'
+
+
+def test_failed_batch_can_be_retried_on_its_own(list_server):
+    report = bulk_write.add_list_items("w1", "m1", "l1", items(30), integration_uri=API,
+                                       provider=list_server(fail_requests={1}), max_items=10, max_workers=1)
+
+    assert report.written == 20
+    retry = list(report.failed_records())
+    assert [item["code"] for item in retry] == [f'C{i}' for i in range(10, 20)]
+
+    server = list_server()
+    assert bulk_write.add_list_items("w1", "m1", "l1", retry, integration_uri=API, provider=server).written == 10
+
+
+def test_payload_too_large_is_split(list_server):
+    server = list_server(max_body=400)
+
+    report = bulk_write.add_list_items("w1", "m1", "l1", items(40), integration_uri=API, provider=server,
+                                       max_items=40, max_workers=1)
+
+    assert report.written == 40
+    assert not report.failed_batches
+    assert any(count < 40 for _, _, count in server.requests)
+
+
+def test_failure_without_index_is_not_pinned_on_the_first_record(make_response):
+    failure = {"failureType": "Invalid", "failureMessageDetails": "duplicate code"}
+    provider = types.SimpleNamespace(request=lambda method, uri, **kwargs: make_response(
+        body={"added": 9, "ignored": 0, "failures": [failure]}))
+
+    report = bulk_write.add_list_items("w1", "m1", "l1", items(10), integration_uri=API, provider=provider)
+
+    assert report.failed_batches[0].failures == [(None, None, failure)]
+    assert list(report.failed_records()) == []
+    assert report.unattributed_failures() == [(0, failure)]
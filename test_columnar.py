@@ -0,0 +1,109 @@
+"""
+test cases for columnar
+"""
+
+import csv
+import io
+import math
+import types
+import pytest
+import anaplan_ops
+import columnar
+
+
+ROWS = [["Product", "Region", "Time", "Units", "Revenue", "Notes"]] + [
+    [f'SKU-{i % 7}', ["EMEA", "APAC", "Americas"][i % 3], "Jan 26", str(i), f'{i * 1.5}',
+     "multi\nline, \"quoted\"" if i % 10 == 0 else "ok"]
+    for i in range(250)]
+
+
+def export_bytes(rows=ROWS):
+    out = io.StringIO(newline="")
+    csv.writer(out).writerows(rows)
+    return out.getvalue().encode("utf-8")
+
+
+def byte_chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 5, 64, 1 << 20])
+def test_batches_match_csv_module_for_any_chunking(size):
+    batches = list(columnar.iter_batches(byte_chunks(export_bytes(), size), batch_size=100,
+                                         types={"Notes": "str"}, use_numpy=False))
+
+    assert [(batch.offset, len(batch)) for batch in batches] == [(0, 100), (100, 100), (200, 50)]
+    assert [list(batch["Product"]) for batch in batches] == [[row[0] for row in ROWS[1 + b:101 + b]]
+                                                            for b in (0, 100, 200)]
+    assert [units for batch in batches for units in batch["Units"]] == list(range(250))
+    assert batches[0]["Notes"][0] == "multi\nline, \"quoted\""
+
+
+def test_column_types_are_inferred_and_dimensions_encoded():
+    first, second = columnar.iter_batches([export_bytes()], batch_size=125, types={"Notes": "str"},
+                                          use_numpy=False)
+
+    assert first["Units"].typecode == "q"
+    assert first["Revenue"].typecode == "d"
+    assert first["Revenue"][3] == 4.5
+
+    # Dimensions share one dictionary across batches, so codes mean the same thing everywhere
+    region = first["Region"]
+    assert isinstance(region, columnar.DictColumn)
+    assert region.dictionary == ["EMEA", "APAC", "Americas"]
+    assert second["Region"].dictionary is region.dictionary
+    assert list(second["Region"].codes[:3]) == [2, 0, 1]
+    assert list(first["Time"].codes) == [0] * 125
+
+
+def test_blank_numbers_read_as_nan():
+    data = b"Item,Value\r\na,1\r\nb,\r\nc,2.5\r\n"
+
+    (batch,) = columnar.iter_batches([data], use_numpy=False)
+
+    assert batch["Value"][0] == 1 and math.isnan(batch["Value"][1])
+
+
+def test_inferred_types_widen_across_batches_and_keep_codes():
+    data = b"Code,Units,Price\r\n" + b"".join(f'00{i},{i},{i}\r\n'.encode() for i in range(1, 5)) + \
+        b"0099,,2.5\r\n101,7,free\r\n"
+
+    first, second = columnar.iter_batches([data], batch_size=4, use_numpy=False)
+
+    assert list(first["Code"]) == ["001", "002", "003", "004"]
+    assert first["Units"].typecode == "q" and first["Price"].typecode == "q"
+    # A blank turns the integer column into floats, text turns it into a dimension
+    assert second["Units"].typecode == "d" and math.isnan(second["Units"][0]) and second["Units"][1] == 7
+    assert list(second["Price"]) == ["2.5", "free"]
+    assert list(second["Code"]) == ["0099", "101"]
+
+
+def test_widening_warns_and_declared_types_keep_batches_alike(caplog):
+    data = b"Units\r\n1\r\n2\r\n2.5\r\n3\r\n"
+
+    with caplog.at_level("WARNING", logger="columnar"):
+        first, second = columnar.iter_batches([data], batch_size=2, use_numpy=False)
+    assert first["Units"].typecode == "q" and second["Units"].typecode == "d"
+    assert "widened from int to float" in caplog.text
+
+    first, second = columnar.iter_batches([data], batch_size=2, types={"Units": "float"}, use_numpy=False)
+    assert first["Units"].typecode == second["Units"].typecode == "d"
+
+
+def test_bad_values_and_truncated_quotes_raise():
+    with pytest.raises(ValueError):
+        list(columnar.iter_batches([b"Item,Value\na,1\nb,x\n"], types={"Value": "int"}))
+    with pytest.raises(ValueError):
+        list(columnar.iter_batches([b'Item,Value\na,"unterminated\n'], use_numpy=False))
+
+
+def test_export_batches_stream_chunks(fake_model):
+    chunks = byte_chunks(export_bytes(), 1000)
+    model = fake_model(chunks)
+
+    batches = anaplan_ops.iter_export_batches("https://api.anaplan.com/2/0/workspaces/w1/models/m1/files/116000000001",
+                                              provider=types.SimpleNamespace(get=model.get), batch_size=64,
+                                              types={"Notes": "str"}, use_numpy=False)
+
+    assert sum(len(batch) for batch in batches) == 250
+    assert [uri.rsplit("/", 1)[1] for _, uri, _ in model.calls] == ["chunks"] + [str(i) for i in range(len(chunks))]
@@ -0,0 +1,58 @@
+"""
+test cases for crawler
+"""
+
+import json
+import types
+import urllib.parse
+import pytest
+import crawler
+
+API = "https://api.anaplan.com/2/0"
+
+
+@pytest.fixture
+def fake_tenant(make_response):
+    requested = []
+
+    def get(uri, **kwargs):
+        requested.append(uri)
+        parts = urllib.parse.urlsplit(uri)
+        path = parts.path[len("/2/0"):]
+        query = dict(urllib.parse.parse_qsl(parts.query))
+
+        if path == "/workspaces":
+            # Two pages of one workspace each
+            offset = int(query.get("offset", 0))
+            workspace = {"id": f'w{offset + 1}', "name": f'Workspace {offset + 1}'}
+            paging = {"currentPageSize": 1, "offset": offset, "totalSize": 2}
+            return make_response({"meta": {"paging": paging}, "workspaces": [workspace]})
+        if path.endswith("/models"):
+            workspace_id = path.split("/")[2]
+            return make_response({"models": [{"id": f'{workspace_id}-m1', "name": "Model",
+                                              "currentWorkspaceId": workspace_id}]})
+        if path == "/workspaces/w2/models/w2-m1/imports":
+            return make_response({"status": {"code": 500}}, status_code=500, url=uri)
+
+        name = path.rsplit("/", 1)[1]
+        return make_response({name: [{"id": f'{name}-1', "name": name.title()}]})
+
+    return types.SimpleNamespace(get=get), requested
+
+
+def test_crawl_builds_inventory_and_follows_paging(fake_tenant):
+    provider, requested = fake_tenant
+
+    inventory = crawler.crawl(integration_uri=API, provider=provider, max_workers=4, page_size=1)
+
+    assert [w.id for w in inventory.workspaces] == ["w1", "w2"]
+    assert sorted(m.id for m in inventory.models) == ["w1-m1", "w2-m1"]
+    assert [i.name for i in inventory.objects["w1-m1"]["imports"]] == ["Imports"]
+    assert set(inventory.objects["w1-m1"]) == set(crawler.MODEL_OBJECTS)
+    assert f'{API}/workspaces?limit=1&offset=1' in requested
+
+    # The failed listing is reported but does not stop the crawl
+    assert [uri for uri, _ in inventory.errors] == [f'{API}/workspaces/w2/models/w2-m1/imports']
+    assert "imports" not in inventory.objects["w2-m1"]
+    assert "exports" in inventory.objects["w2-m1"]
+    json.dumps(inventory.to_dict())
@@ -0,0 +1,94 @@
+"""
+test cases for endpoints
+"""
+
+import types
+import pytest
+import endpoints
+import retry
+import transport
+
+US = "https://us1a.app.anaplan.com/oauth"
+EU = "https://eu1a.app.anaplan.com/oauth"
+AP = "https://ap1a.app.anaplan.com/oauth"
+
+
+class FakeProbe:
+    def __init__(self, latencies):
+        self.latencies = latencies
+
+    def __call__(self, uri, timeout):
+        return self.latencies[uri]
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers():
+    retry.configure_breakers({"failureThreshold": 1, "resetTimeout": 30})
+    yield
+    retry.configure_breakers()
+    endpoints.configure()
+
+
+def service(latencies, **settings):
+    return endpoints.ServiceEndpoints("oauthService", list(latencies), {"probeInterval": 0, **settings},
+                                      probe=FakeProbe(latencies))
+
+
+def test_primary_until_probed_then_fastest():
+    oauth = service({US: 0.2, EU: 0.05, AP: 0.1})
+    assert oauth.current() == US
+
+    oauth.probe()
+    assert oauth.current() == EU
+
+
+def test_small_differences_do_not_switch():
+    oauth = service({US: 0.1, EU: 0.09})
+    oauth.probe()
+    assert oauth.current() == US
+
+    # Much faster now: the moving average drops below the margin after a few probes
+    oauth.probe_function.latencies[EU] = 0.01
+    for _ in range(3):
+        oauth.probe()
+    assert oauth.current() == EU
+
+
+def test_failover_on_failed_probe_or_open_circuit():
+    oauth = service({US: 0.05, EU: 0.1, AP: 0.2})
+    oauth.probe()
+    assert oauth.current() == US
+
+    oauth.probe_function.latencies[US] = None
+    oauth.probe()
+    assert oauth.current() == EU
+
+    retry.get_breaker("eu1a.app.anaplan.com").record_failure()
+    assert oauth.current() == AP
+    assert oauth.status()["candidates"][EU]["healthy"] is False
+
+
+def test_configure_keeps_primary_uri_in_settings_and_routes_requests(monkeypatch, reset_transport):
+    settings = {"uris": {"oauthService": [US, EU], "integrationApi": "https://api.anaplan.com/2/0"},
+                "endpointSelection": {"probeInterval": 0}}
+    transport.configure(settings)
+    assert settings["uris"]["oauthService"] == [US, EU]
+    assert endpoints.primary_uris(settings)["oauthService"] == US
+
+    oauth = endpoints.get_service("oauthService")
+    oauth.probe_function = FakeProbe({US: 0.3, EU: 0.05})
+    oauth.probe()
+    assert endpoints.resolve(f'{US}/token') == f'{EU}/token'
+    assert endpoints.resolve("https://api.anaplan.com/2/0/workspaces") == "https://api.anaplan.com/2/0/workspaces"
+    assert endpoints.resolve(f'{US}extra/token') == f'{US}extra/token'
+
+    sent = []
+    session = types.SimpleNamespace(request=lambda method, uri, **kwargs: sent.append(uri) or
+                                    types.SimpleNamespace(status_code=200, headers={}))
+    monkeypatch.setattr(transport, "get_session", lambda: session)
+    transport.post(f'{US}/token', json={})
+    assert sent == [f'{EU}/token']
+
+    # The same settings can be applied again
+    transport.configure(settings)
+    assert endpoints.get_service("oauthService").candidates == [US, EU]
@@ -0,0 +1,176 @@
+"""
+test cases for file_transfer
+"""
+
+import gzip
+import os
+import time
+import types
+import pytest
+import errors
+import file_transfer
+
+API = "https://api.anaplan.com/2/0"
+FILE_URI = f'{API}/workspaces/w1/models/m1/files/113000000001'
+
+
+def write_file(tmp_path, size):
+    path = tmp_path / "import.csv"
+    path.write_bytes(os.urandom(size // 2).hex().encode("ascii")[:size])
+    return str(path)
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_upload_reassembles_to_the_original_file(tmp_path, compress, fake_model):
+    path = write_file(tmp_path, 10_000)
+    server = fake_model()
+
+    result = file_transfer.upload_file(path, "w1", "m1", "113000000001", integration_uri=API,
+                                       provider=types.SimpleNamespace(post=server.post, put=server.put),
+                                       chunk_size=3_000, max_workers=3, compress=compress, compress_workers=0)
+
+    data = b"".join(gzip.decompress(server.received[i]) if compress else server.received[i] for i in range(4))
+    assert data == open(path, "rb").read()
+    assert set(server.content_types.values()) == {"application/x-gzip" if compress else "application/octet-stream"}
+
+    assert server.calls[0] == ("POST", FILE_URI, {"chunkCount": -1})
+    assert server.calls[-1] == ("POST", f'{FILE_URI}/complete', {"id": "113000000001", "chunkCount": 4})
+    assert result.chunks == 4 and result.size == 10_000
+
+
+def test_compression_in_a_process_pool(tmp_path, fake_model):
+    path = write_file(tmp_path, 5_000)
+    server = fake_model()
+
+    file_transfer.upload_file(path, "w1", "m1", "113000000001", integration_uri=API,
+                              provider=types.SimpleNamespace(post=server.post, put=server.put),
+                              chunk_size=2_000, compress=True, compress_workers=2)
+
+    assert b"".join(gzip.decompress(server.received[i]) for i in range(3)) == open(path, "rb").read()
+
+
+def test_failed_chunk_is_retried(tmp_path, fake_model):
+    path = write_file(tmp_path, 4_000)
+    server = fake_model(fail_chunks={1})
+
+    result = file_transfer.upload_file(path, "w1", "m1", "113000000001", integration_uri=API,
+                                       provider=types.SimpleNamespace(post=server.post, put=server.put),
+                                       chunk_size=1_000, compress=False)
+
+    assert result.retries == 1
+    assert sorted(server.received) == [0, 1, 2, 3]
+
+
+def test_upload_fails_when_a_chunk_keeps_failing(tmp_path, fake_model, make_response):
+    path = write_file(tmp_path, 2_000)
+    server = fake_model()
+    server.put = lambda uri, **kwargs: make_response(status_code=500, url=uri)
+
+    with pytest.raises(errors.AnaplanHTTPError):
+        file_transfer.upload_file(path, "w1", "m1", "113000000001", integration_uri=API,
+                                  provider=types.SimpleNamespace(post=server.post, put=server.put),
+                                  chunk_size=1_000, compress=False, chunk_retries=1)
+
+    # The file is never marked complete
+    assert all(not uri.endswith("/complete") for _, uri, _ in server.calls)
+
+
+def test_upload_cancels_remaining_chunks_after_a_failure(tmp_path, fake_model, make_response):
+    path = write_file(tmp_path, 20_000)
+    server = fake_model()
+    sent = []
+
+    # The first chunk fails straight away; the others are slow
+    def put(uri, **kwargs):
+        sent.append(uri)
+        if not uri.endswith("/0"):
+            time.sleep(0.05)
+        return make_response(status_code=500 if uri.endswith("/0") else 204, url=uri)
+
+    with pytest.raises(errors.AnaplanHTTPError):
+        file_transfer.upload_file(path, "w1", "m1", "113000000001", integration_uri=API,
+                                  provider=types.SimpleNamespace(post=server.post, put=put),
+                                  chunk_size=1_000, max_workers=2, compress=False, chunk_retries=0)
+
+    # The chunks queued behind the failure are never sent
+    assert len(sent) < 5
+
+
+def download(server, output, **kwargs):
+    return file_transfer.download_file(str(output), "w1", "m1", "116000000001", integration_uri=API,
+                                       provider=types.SimpleNamespace(get=server.get), **kwargs)
+
+
+def test_download_writes_chunks_at_their_offsets(tmp_path, fake_model):
+    chunks = [b"a" * 100, b"b" * 100, b"c" * 100, b"d" * 42]
+    output = tmp_path / "export.csv"
+
+    result = download(fake_model(chunks), output, max_workers=3)
+
+    assert output.read_bytes() == b"".join(chunks)
+    assert result.size == 342
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["export.csv"]
+
+
+def test_download_resumes_after_a_failure(tmp_path, fake_model):
+    chunks = [b"a" * 100, b"b" * 100, b"c" * 100, b"d" * 42]
+    output = tmp_path / "export.csv"
+
+    with pytest.raises(errors.AnaplanHTTPError):
+        download(fake_model(chunks, fail_chunks={2}), output, max_workers=1, chunk_retries=0)
+    assert not output.exists()
+
+    server = fake_model(chunks)
+    download(server, output)
+
+    # The first chunk is fetched again to check it is the same run of the export
+    assert server.fetched == [0, 2]
+    assert output.read_bytes() == b"".join(chunks)
+
+
+def test_download_starts_over_for_a_different_run(tmp_path, fake_model):
+    output = tmp_path / "export.csv"
+
+    with pytest.raises(errors.AnaplanHTTPError):
+        download(fake_model([b"a" * 100, b"b" * 100, b"c" * 10], fail_chunks={2}), output,
+                 max_workers=1, chunk_retries=0)
+
+    # The export was run again in the meantime: nothing of the partial file is reused
+    chunks = [b"x" * 100, b"y" * 100, b"z" * 10]
+    server = fake_model(chunks)
+    download(server, output)
+
+    assert sorted(server.fetched) == [0, 1, 2]
+    assert output.read_bytes() == b"".join(chunks)
+
+
+def test_download_of_an_empty_file(tmp_path, fake_model):
+    output = tmp_path / "export.csv"
+
+    result = download(fake_model([]), output)
+
+    assert output.read_bytes() == b""
+    assert result.size == 0
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["export.csv"]
+
+
+def test_download_reassembles_uneven_chunks(tmp_path, fake_model):
+    chunks = [b"a" * 100, b"b" * 60, b"c" * 150, b"d" * 42]
+    output = tmp_path / "export.csv"
+
+    download(fake_model(chunks), output)
+
+    assert output.read_bytes() == b"".join(chunks)
+
+
+def test_export_and_download_runs_the_export_first(tmp_path, fake_model):
+    server = fake_model([b"x" * 10])
+    output = tmp_path / "export.csv"
+
+    file_transfer.export_and_download(str(output), "w1", "m1", "116000000001", integration_uri=API,
+                                      provider=types.SimpleNamespace(get=server.get, post=server.post))
+
+    export_uri = f'{API}/workspaces/w1/models/m1/exports/116000000001'
+    assert server.calls[:2] == [("POST", f'{export_uri}/tasks', {"localeName": "en_US"}),
+                                ("GET", f'{export_uri}/tasks/t1', None)]
+    assert output.read_bytes() == b"x" * 10
@@ -0,0 +1,84 @@
+"""
+test cases for json_stream
+"""
+
+import json
+import types
+import pytest
+import anaplan_ops
+import json_stream
+import records
+
+
+LISTING = {
+    "meta": {"paging": {"currentPageSize": 3, "offset": 0, "totalSize": 3}},
+    "status": {"code": 200, "message": "Success"},
+    "workspaces": [
+        {"id": "8a81b09d", "name": "Sales – EMEA", "active": True, "sizeAllowance": 1073741824, "currentSize": 12345},
+        {"id": "8a81b09e", "name": "Finance", "active": False, "sizeAllowance": 0, "currentSize": 0},
+        {"id": "8a81b09f", "name": "Ops", "active": True, "sizeAllowance": 98765, "currentSize": 7},
+    ],
+}
+
+
+def byte_chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 4096])
+def test_items_match_full_parse_for_any_chunking(size):
+    data = json.dumps(LISTING, ensure_ascii=False).encode("utf-8")
+    members = {}
+
+    items = list(json_stream.iter_items(byte_chunks(data, size), "workspaces", members=members))
+
+    assert items == LISTING["workspaces"]
+    assert members == {"meta": LISTING["meta"], "status": LISTING["status"]}
+
+
+def test_numbers_split_across_chunks():
+    chunks = ['{"items": [12', '34, 5', '6]}']
+    assert list(json_stream.iter_items(chunks, "items")) == [1234, 56]
+
+
+def test_numbers_split_at_decimal_point_or_exponent():
+    chunks = ['{"items": [1', '.5, 2e', '3, -', '4E', '+2]}']
+    assert list(json_stream.iter_items(chunks, "items")) == [1.5, 2e3, -4e2]
+
+
+def test_items_are_yielded_before_the_stream_ends():
+    parser = json_stream.ItemParser("models")
+
+    assert parser.feed(b'{"models": [{"id": "m1"}, {"id": ') == [{"id": "m1"}]
+    assert parser.feed(b'"m2"}]}') == [{"id": "m2"}]
+    assert parser.close() == []
+
+
+def test_empty_and_missing_listing():
+    assert list(json_stream.iter_items([b'{"workspaces": []}'], "workspaces")) == []
+    assert list(json_stream.iter_items([b'{"status": {"code": 200}}'], "workspaces")) == []
+
+
+def test_truncated_stream_raises():
+    with pytest.raises(ValueError):
+        list(json_stream.iter_items([b'{"workspaces": [{"id": "w1"}, {"id"'], "workspaces"))
+
+
+def test_records_from_json():
+    workspace = records.Workspace.from_json(LISTING["workspaces"][0])
+
+    assert workspace.id == "8a81b09d"
+    assert workspace.size_allowance == 1073741824
+    assert workspace.to_dict() == LISTING["workspaces"][0]
+    assert not hasattr(workspace, "__dict__")
+
+
+def test_iter_records_streams_response(make_response):
+    res = make_response(chunks=byte_chunks(json.dumps(LISTING).encode("utf-8"), 16))
+    provider = types.SimpleNamespace(get=lambda uri, **kwargs: res)
+
+    workspaces = list(anaplan_ops.iter_records("https://api.anaplan.com/2/0/workspaces", records.Workspace,
+                                               provider=provider))
+
+    assert [w.name for w in workspaces] == ["Sales – EMEA", "Finance", "Ops"]
+    assert res.closed
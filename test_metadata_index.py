@@ -0,0 +1,80 @@
+"""
+test cases for metadata_index
+"""
+
+import types
+import urllib.parse
+import pytest
+import errors
+import metadata_index
+
+API = "https://api.anaplan.com/2/0"
+
+
+def fake_tenant(make_response, tenant):
+    requested = []
+
+    def get(uri, **kwargs):
+        path = urllib.parse.urlsplit(uri).path[len("/2/0"):]
+        requested.append(path)
+        parts = path.strip("/").split("/")
+
+        if path == "/workspaces":
+            return make_response({"workspaces": [{"id": w, "name": w.upper()} for w in tenant]})
+        if parts[-1] == "models":
+            return make_response({"models": [{"id": m, "name": model["name"], "currentWorkspaceId": parts[1],
+                                              "lastSavedSerialNumber": model["serial"]}
+                                             for m, model in tenant[parts[1]].items()]})
+        kind = parts[-1]
+        model = tenant[parts[1]][parts[3]]
+        return make_response({kind: [{"id": f'{parts[3]}-{kind}-{i}', "name": name}
+                                     for i, name in enumerate(model.get(kind, []))]})
+
+    return types.SimpleNamespace(get=get), requested
+
+
+def test_sync_and_lookup(tmp_path, make_response):
+    tenant = {"w1": {"m1": {"name": "Sales", "serial": 1, "imports": ["Load Sales", "Load Costs"]}},
+              "w2": {"m2": {"name": "Sales", "serial": 7}, "m3": {"name": "Finance", "serial": 3}}}
+    provider, _ = fake_tenant(make_response, tenant)
+    index = metadata_index.MetadataIndex(str(tmp_path / "metadata.db3"))
+
+    assert index.sync(integration_uri=API, provider=provider)["synced"] == 3
+
+    assert index.workspace_id("W1") == "w1"
+    assert index.model_id("Finance") == ("w2", "m3")
+    assert index.model_id("Sales", workspace="W1") == ("w1", "m1")
+    assert index.resolve("W1", "Sales", "imports", "Load Costs") == ("w1", "m1", "m1-imports-1")
+    assert index.object_id("m1", "imports", "m1-imports-0") == "m1-imports-0"
+
+    # "Sales" exists in two workspaces
+    with pytest.raises(errors.MetadataLookupError):
+        index.model_id("Sales")
+    with pytest.raises(errors.MetadataLookupError, match='No export named "Missing"'):
+        index.object_id("m1", "exports", "Missing")
+    with pytest.raises(errors.MetadataLookupError, match='No process named "Missing"'):
+        index.object_id("m1", "processes", "Missing")
+    assert set(metadata_index.SINGULAR) == set(metadata_index.KINDS)
+
+
+def test_incremental_sync_only_lists_changed_models(tmp_path, make_response):
+    tenant = {"w1": {"m1": {"name": "Sales", "serial": 1, "imports": ["Load Sales"]},
+                     "m2": {"name": "Finance", "serial": 1}}}
+    provider, requested = fake_tenant(make_response, tenant)
+    index = metadata_index.MetadataIndex(str(tmp_path / "metadata.db3"))
+    index.sync(integration_uri=API, provider=provider)
+
+    # Only m1 was saved since the last sync; m2 is left untouched
+    tenant["w1"]["m1"] = {"name": "Sales", "serial": 2, "imports": ["Load Sales v2"]}
+    requested.clear()
+    result = index.sync(integration_uri=API, provider=provider)
+
+    assert (result["synced"], result["skipped"]) == (1, 1)
+    assert not any("/models/m2/" in path for path in requested)
+    assert index.object_id("m1", "imports", "Load Sales v2") == "m1-imports-0"
+
+    # A deleted model is dropped from the index
+    del tenant["w1"]["m2"]
+    index.sync(integration_uri=API, provider=provider)
+    with pytest.raises(errors.MetadataLookupError):
+        index.model_id("Finance")
@@ -0,0 +1,101 @@
+"""
+test cases for metrics
+"""
+
+import json
+import types
+import urllib.request
+import pytest
+import metrics
+import transport
+
+API = "https://api.anaplan.com/2/0"
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    yield
+    metrics.configure()
+
+
+def test_histogram_and_prometheus_text():
+    registry = metrics.Registry()
+    latency = registry.histogram("request_seconds", "Latency", ("endpoint",), buckets=(0.1, 1))
+    requests = registry.counter("requests_total", "Requests", ("endpoint", "status"))
+    registry.gauge("token_age_seconds", "Age", function=lambda: 42)
+
+    for seconds in (0.05, 0.1, 0.5, 3):
+        latency.observe(seconds, "models")
+    requests.inc("models", "200", amount=3)
+    requests.inc('say "hi"', "500")
+
+    text = metrics.render_prometheus(registry)
+
+    assert '# TYPE request_seconds histogram' in text
+    assert 'request_seconds_bucket{endpoint="models",le="0.1"} 2' in text
+    assert 'request_seconds_bucket{endpoint="models",le="1"} 3' in text
+    assert 'request_seconds_bucket{endpoint="models",le="+Inf"} 4' in text
+    assert 'request_seconds_count{endpoint="models"} 4' in text
+    assert 'requests_total{endpoint="models",status="200"} 3' in text
+    assert 'requests_total{endpoint="say \\"hi\\"",status="500"} 1' in text
+    assert 'token_age_seconds 42' in text
+
+    data = metrics.snapshot(registry)["metrics"]
+    assert data["request_seconds"]["samples"][0]["buckets"]["+Inf"] == 4
+    assert data["token_age_seconds"]["samples"] == [{"labels": {}, "value": 42}]
+
+
+def test_endpoint_labels_drop_ids():
+    uri = f'{API}/workspaces/8a81b09d5e8c6f27015ece3402487d33/models/75A40874E6B64FA3AE0A1DE2E4AB1E8D/files/113000000001/chunks/7'
+
+    assert metrics.endpoint_label(uri) == "api.anaplan.com/2/0/workspaces/*/models/*/files/*/chunks/*"
+    assert metrics.endpoint_label("https://us1a.app.anaplan.com/oauth/token") == "us1a.app.anaplan.com/oauth/token"
+
+
+def test_transport_records_status_bytes_and_retries(monkeypatch):
+    responses = [types.SimpleNamespace(status_code=503, headers={}, close=lambda: None),
+                 types.SimpleNamespace(status_code=200, headers={"Content-Length": "1234"},
+                                       request=types.SimpleNamespace(body=b'{"localeName": "en_US"}'))]
+    session = types.SimpleNamespace(request=lambda method, uri, **kwargs: responses.pop(0))
+    monkeypatch.setattr(transport, "get_session", lambda: session)
+    monkeypatch.setattr(transport.time, "sleep", lambda seconds: None)
+    endpoint = "api.anaplan.com/2/0/workspaces/*/models/*/exports/*/tasks"
+    before = {"retries": metrics.RETRIES.value("POST", endpoint),
+              "ok": metrics.REQUESTS.value("POST", endpoint, "200"),
+              "in": metrics.BYTES_RECEIVED.value("POST", endpoint)}
+
+    transport.request("POST", f'{API}/workspaces/8a81b09d5e8c6f27015ece3402487d33/models/75A40874E6B64FA3AE0A1DE2E4AB1E8D'
+                              f'/exports/116000000001/tasks', json={"localeName": "en_US"}, idempotent=True)
+
+    assert metrics.RETRIES.value("POST", endpoint) == before["retries"] + 1
+    assert metrics.REQUESTS.value("POST", endpoint, "200") == before["ok"] + 1
+    assert metrics.BYTES_RECEIVED.value("POST", endpoint) == before["in"] + 1234
+    assert metrics.BYTES_SENT.value("POST", endpoint) >= 23
+    assert metrics.IN_FLIGHT.value() == 0
+
+
+def test_file_exporters_and_http_endpoint(tmp_path):
+    registry = metrics.Registry()
+    registry.counter("jobs_total", "Jobs").inc()
+
+    metrics.PrometheusFileExporter(str(tmp_path / "anaplan.prom")).export(registry)
+    metrics.JsonFileExporter(str(tmp_path / "anaplan.json")).export(registry)
+    assert "jobs_total 1" in (tmp_path / "anaplan.prom").read_text()
+    assert json.loads((tmp_path / "anaplan.json").read_text())["metrics"]["jobs_total"]["samples"][0]["value"] == 1
+
+    server = metrics.PrometheusHTTPExporter(port=0, registry=registry)
+    server.start()
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{server.port}/metrics') as res:
+            assert "jobs_total 1" in res.read().decode("utf-8")
+    finally:
+        server.stop()
+
+
+def test_configure_starts_and_flushes_exporters(tmp_path):
+    path = tmp_path / "metrics.prom"
+
+    metrics.configure({"metrics": {"exporters": [{"type": "prometheusFile", "path": str(path), "interval": 3600}]}})
+    metrics.shutdown()
+
+    assert "anaplan_requests_in_flight" in path.read_text()
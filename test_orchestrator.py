@@ -0,0 +1,145 @@
+"""
+test cases for orchestrator
+"""
+
+import threading
+import time
+import types
+import pytest
+import anaplan_ops
+import orchestrator
+
+API = "https://api.anaplan.com/2/0"
+
+
+class FakeTaskServer:
+    # Every task completes after `polls` status polls; actions named in `failing` fail.
+    # `respond` builds the responses (see the `make_response` fixture)
+    def __init__(self, respond, polls=2, failing=()):
+        self.respond = respond
+        self.polls = polls
+        self.failing = set(failing)
+        self.started = []
+        self.status_polls = {}
+        self.running = {}
+        self.max_running = {}
+        self.lock = threading.Lock()
+
+    def post(self, uri, **kwargs):
+        action_id = uri.split("/")[-2]
+        model_id = uri.split("/")[-4]
+        with self.lock:
+            self.started.append(action_id)
+            self.running[model_id] = self.running.get(model_id, 0) + 1
+            self.max_running[model_id] = max(self.max_running.get(model_id, 0), self.running[model_id])
+        return self.respond({"task": {"taskId": f'task-{action_id}'}}, url=uri)
+
+    def get(self, uri, **kwargs):
+        action_id = uri.split("/")[-3]
+        model_id = uri.split("/")[-5]
+        with self.lock:
+            polls = self.status_polls[action_id] = self.status_polls.get(action_id, 0) + 1
+        if polls < self.polls:
+            task = {"taskId": f'task-{action_id}', "taskState": "IN_PROGRESS", "progress": 0.5}
+        else:
+            with self.lock:
+                self.running[model_id] -= 1
+            task = {"taskId": f'task-{action_id}', "taskState": "COMPLETE",
+                    "result": {"successful": action_id not in self.failing}}
+        return self.respond({"task": task}, url=uri)
+
+
+@pytest.fixture
+def task_server(make_response):
+    return lambda **kwargs: FakeTaskServer(make_response, **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def fast_polls(monkeypatch):
+    monkeypatch.setattr(anaplan_ops.time, "sleep", lambda seconds: None)
+
+
+def action(name, model="m1", depends_on=()):
+    return orchestrator.Action(name, "w1", model, "imports", name, depends_on=depends_on)
+
+
+def test_dependencies_run_in_order(task_server):
+    server = task_server()
+    actions = [action("load", model="m1"), action("calc", model="m2", depends_on=["load"]),
+               action("other", model="m3"), action("export", model="m2", depends_on=["calc", "other"])]
+
+    results = orchestrator.run(actions, integration_uri=API, provider=server, max_workers=4)
+
+    assert all(result["state"] == "COMPLETE" for result in results.values())
+    assert server.started.index("load") < server.started.index("calc") < server.started.index("export")
+    assert server.started.index("other") < server.started.index("export")
+    assert results["load"]["polls"] == 1
+
+
+def test_failure_skips_dependents_only(task_server):
+    server = task_server(failing={"load"})
+    actions = [action("load"), action("calc", depends_on=["load"]), action("export", depends_on=["calc"]),
+               action("independent", model="m2")]
+
+    results = orchestrator.run(actions, integration_uri=API, provider=server)
+
+    assert results["load"]["state"] == "FAILED"
+    assert results["calc"]["state"] == results["export"]["state"] == "SKIPPED"
+    assert results["independent"]["state"] == "COMPLETE"
+    assert "calc" not in server.started
+
+
+def test_one_task_per_model_at_a_time(task_server):
+    server = task_server(polls=3)
+    actions = [action(f'a{i}', model="m1") for i in range(4)] + [action(f'b{i}', model="m2") for i in range(4)]
+
+    orchestrator.run(actions, integration_uri=API, provider=server, max_workers=8)
+
+    assert server.max_running == {"m1": 1, "m2": 1}
+
+
+def test_idle_model_is_not_queued_behind_busy_one(task_server):
+    server = task_server()
+    b0_started = threading.Event()
+    a0_waited = []
+
+    def post(uri, **kwargs):
+        if "/b0/" in uri:
+            b0_started.set()
+        return server.post(uri, **kwargs)
+
+    def get(uri, **kwargs):
+        # a0 only completes once b0 has started (or after the timeout)
+        if "/a0/" in uri and not a0_waited:
+            a0_waited.append(b0_started.wait(timeout=2))
+        return server.get(uri, **kwargs)
+
+    actions = [action(f'a{i}', model="m1") for i in range(4)] + [action("b0", model="m2")]
+
+    results = orchestrator.run(actions, integration_uri=API, provider=types.SimpleNamespace(post=post, get=get),
+                               max_workers=4)
+
+    assert a0_waited == [True]
+    assert server.max_running == {"m1": 1, "m2": 1}
+    assert all(result["state"] == "COMPLETE" for result in results.values())
+
+
+def test_invalid_graphs_are_rejected():
+    with pytest.raises(ValueError):
+        orchestrator.validate([action("a", depends_on=["b"]), action("b", depends_on=["a"])])
+    with pytest.raises(ValueError):
+        orchestrator.validate([action("a", depends_on=["missing"])])
+
+
+def test_poll_schedule_backs_off_and_caps():
+    schedule = anaplan_ops.PollSchedule(initial=0.5, factor=2, max_interval=3, jitter=0)
+
+    assert [schedule.next_delay() for _ in range(5)] == [0.5, 1, 2, 3, 3]
+
+
+def test_poll_schedule_follows_progress():
+    schedule = anaplan_ops.PollSchedule(initial=0.5, max_interval=60, jitter=0)
+    schedule._started = time.monotonic() - 40
+
+    # 80% done after 40 seconds: about 10 seconds left, so wait about 5
+    assert schedule.next_delay({"progress": 0.8}) == pytest.approx(5, abs=0.1)
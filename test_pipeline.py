@@ -0,0 +1,51 @@
+"""
+test cases for pipeline
+"""
+
+import gzip
+import pipeline
+
+API = "https://api.anaplan.com/2/0"
+EXPORT = b"Code,Name\n" + b"".join(b"%d,item %d\n" % (i, i) for i in range(200))
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def posts(model):
+    return [(uri.split("/2/0")[1], json) for method, uri, json in model.calls if method == "POST"]
+
+
+def test_pipe_streams_export_into_import_with_line_aligned_transform(fake_model):
+    source = fake_model(split(EXPORT, 97))
+    target = fake_model()
+
+    result, task = pipeline.pipe(pipeline.Endpoint("w1", "source", provider=source, integration_uri=API), "116000000001",
+                                 pipeline.Endpoint("w2", "target", provider=target, integration_uri=API), "113000000001",
+                                 import_id="112000000001", transform=lambda block: block.upper(), max_buffered=2)
+
+    data = b"".join(gzip.decompress(target.received[i]) for i in range(len(target.received)))
+    assert data == EXPORT.upper()
+    assert result.chunks == len(target.received)
+    assert task["taskState"] == "COMPLETE"
+
+    # The source only runs the export; the target receives the file and runs the import
+    assert posts(source) == [("/workspaces/w1/models/source/exports/116000000001/tasks", {"localeName": "en_US"})]
+    assert [uri for uri, _ in posts(target)] == ["/workspaces/w2/models/target/files/113000000001",
+                                                "/workspaces/w2/models/target/files/113000000001/complete",
+                                                "/workspaces/w2/models/target/imports/112000000001/tasks"]
+
+
+def test_transform_only_sees_whole_lines():
+    blocks = []
+
+    def transform(block):
+        blocks.append(block)
+        return block
+
+    lines = pipeline._LineTransform(transform)
+    out = b"".join(lines.feed(chunk) for chunk in split(EXPORT, 13)) + lines.close()
+
+    assert out == EXPORT
+    assert all(block.endswith(b"\n") for block in blocks)
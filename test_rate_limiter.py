@@ -0,0 +1,46 @@
+"""
+test cases for rate_limiter
+"""
+
+import pytest
+import rate_limiter
+
+SETTINGS = {
+    "uris": {
+        "oauthService": "https://us1a.app.anaplan.com/oauth",
+        "integrationApi": "https://api.anaplan.com/2/0",
+        "authenticationCode": "https://us1a.app.anaplan.com/auth/authorize"
+    },
+    "rateLimits": {
+        "oauthService": {"rate": 5, "burst": 2},
+        "integrationApi": {"rate": 10, "burst": 3}
+    }
+}
+
+
+def test_bucket_allows_burst_then_spaces_requests():
+    bucket = rate_limiter.TokenBucket(rate=10, burst=3)
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def test_uris_map_to_their_endpoint_family(reset_transport):
+    rate_limiter.configure(SETTINGS)
+    integration = rate_limiter.get_bucket("https://api.anaplan.com/2/0/workspaces")
+    oauth = rate_limiter.get_bucket("https://us1a.app.anaplan.com/oauth/token")
+
+    assert integration.rate == 10
+    assert oauth.rate == 5
+    assert rate_limiter.get_bucket("https://us1a.app.anaplan.com/auth/authorize?client_id=x") is oauth
+    assert rate_limiter.get_bucket("https://example.com/") is None
+
+
+def test_shared_bucket_is_shared_between_limiters(tmp_path):
+    database = str(tmp_path / "token.db3")
+    first = rate_limiter.SharedTokenBucket(database, name="integrationApi", rate=10, burst=2)
+    second = rate_limiter.SharedTokenBucket(database, name="integrationApi", rate=10, burst=2)
+
+    assert first.reserve() == 0
+    assert second.reserve() == 0
+    assert first.reserve() == pytest.approx(0.1, abs=0.02)
@@ -0,0 +1,147 @@
+"""
+test cases for response_cache
+"""
+
+import jwt
+import requests
+import response_cache
+import transport
+
+URI = "https://api.anaplan.com/2/0/workspaces"
+
+
+def make_response(status_code=200, body=b'{"workspaces": []}', headers=None):
+    res = requests.Response()
+    res.status_code = status_code
+    res._content = body
+    res._content_consumed = True
+    res.url = URI
+    res.headers.update({"Content-Length": str(len(body)), **(headers or {})})
+    return res
+
+
+def bearer(subject):
+    token = jwt.encode({"sub": subject}, "k" * 32, algorithm="HS256")
+    return {"Authorization": f'Bearer {token}'}
+
+
+class FakeServer:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def send(self, method, uri, headers=None, **kwargs):
+        self.requests.append(dict(headers or {}))
+        return self.responses.pop(0)
+
+
+def test_fresh_entry_is_served_without_a_request():
+    cache = response_cache.ResponseCache(ttls={URI: 60})
+    server = FakeServer(make_response())
+
+    first = cache.get(server.send, URI, headers=bearer("user-1"))
+    second = cache.get(server.send, URI, headers=bearer("user-1"))
+
+    assert len(server.requests) == 1
+    assert second.json() == first.json() == {"workspaces": []}
+    assert second.from_cache
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_users_do_not_share_entries():
+    cache = response_cache.ResponseCache(ttls={URI: 60})
+    server = FakeServer(make_response(body=b'{"user": 1}'), make_response(body=b'{"user": 2}'))
+
+    cache.get(server.send, URI, headers=bearer("user-1"))
+    assert cache.get(server.send, URI, headers=bearer("user-2")).json() == {"user": 2}
+    assert len(server.requests) == 2
+
+
+def test_stale_entry_is_revalidated_with_etag():
+    cache = response_cache.ResponseCache(default_ttl=0)
+    server = FakeServer(make_response(headers={"ETag": '"v1"'}), make_response(status_code=304, body=b""))
+
+    cache.get(server.send, URI, headers=bearer("user-1"))
+    res = cache.get(server.send, URI, headers=bearer("user-1"))
+
+    assert server.requests[1]["If-None-Match"] == '"v1"'
+    assert res.status_code == 200 and res.json() == {"workspaces": []}
+    assert cache.stats()["revalidations"] == 1
+
+
+def test_uncacheable_responses_are_not_stored():
+    cache = response_cache.ResponseCache(ttls={URI: 60})
+    server = FakeServer(make_response(headers={"Cache-Control": "no-store"}), make_response(status_code=500),
+                        make_response())
+
+    cache.get(server.send, URI)
+    cache.get(server.send, URI)
+    cache.get(server.send, URI)
+    assert cache.stats()["entries"] == 1
+
+
+def test_query_parameters_are_part_of_the_key():
+    cache = response_cache.ResponseCache(ttls={URI: 60})
+    server = FakeServer(make_response(body=b'{"page": 1}'), make_response(body=b'{"page": 2}'))
+
+    cache.get(server.send, URI, headers=bearer("user-1"), params={"offset": 0})
+    res = cache.get(server.send, URI, headers=bearer("user-1"), params={"offset": 10})
+
+    assert res.json() == {"page": 2} and len(server.requests) == 2
+    assert cache.get(server.send, URI, headers=bearer("user-1"), params={"offset": 0}).from_cache
+
+
+def test_endpoints_without_a_ttl_are_not_cached():
+    cache = response_cache.ResponseCache(ttls={URI: 60})
+    task = f'{URI}/w1/models/m1/exports/e1/tasks/t1'
+    server = FakeServer(make_response(headers={"ETag": '"v1"'}), make_response(headers={"ETag": '"v2"'}))
+
+    cache.get(server.send, task)
+    cache.get(server.send, task)
+
+    assert "If-None-Match" not in server.requests[1]
+    assert cache.stats()["entries"] == 0
+
+
+def test_ttl_patterns():
+    cache = response_cache.ResponseCache(ttls={f'{URI}/*/models': 30})
+
+    assert cache.ttl(f'{URI}/w1/models') == 30
+    assert cache.ttl(f'{URI}/w1/models/m1') is None
+
+
+def test_lru_eviction():
+    cache = response_cache.ResponseCache(max_entries=2, default_ttl=60)
+    server = FakeServer(*(make_response() for _ in range(4)))
+
+    for uri in (f'{URI}/1', f'{URI}/2', f'{URI}/1', f'{URI}/3'):
+        cache.get(server.send, uri)
+
+    # `/1` was used more recently than `/2`, so `/2` was evicted
+    assert cache.stats()["evictions"] == 1
+    cache.get(server.send, f'{URI}/1')
+    assert len(server.requests) == 3
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    database = str(tmp_path / "cache.db3")
+    server = FakeServer(make_response())
+
+    response_cache.ResponseCache(default_ttl=60, database=database).get(server.send, URI)
+    res = response_cache.ResponseCache(default_ttl=60, database=database).get(server.send, URI)
+
+    assert res.from_cache and len(server.requests) == 1
+    res.close()
+
+
+def test_transport_uses_configured_cache():
+    transport.configure({"uris": {"integrationApi": "https://api.anaplan.com/2/0"},
+                         "responseCache": {"enabled": True, "ttls": {"/workspaces": 60}}})
+    try:
+        assert response_cache.get_cache().ttl(URI) == 60
+        assert response_cache.get_cache().ttl(f'{URI}?limit=10') == 60
+        assert response_cache.get_cache().ttl(f'{URI}/w1/models/m1/exports/e1/tasks/t1') is None
+        assert response_cache.get_cache().ttl("https://api.anaplan.com/2/0/users/me") is None
+    finally:
+        transport.configure()
+    assert response_cache.get_cache() is None
@@ -0,0 +1,124 @@
+"""
+test cases for retry
+"""
+
+import time
+import types
+import email.utils
+import pytest
+import requests
+import urllib3
+import errors
+import retry
+import transport
+
+
+@pytest.mark.parametrize(
+    'method, status, idempotent, expected',
+    [
+        ("GET", 503, None, True),
+        ("GET", 500, None, True),
+        ("GET", 404, None, False),
+        ("PUT", 502, None, True),
+        # a POST may have been acted on, so only retry when the server refused it
+        ("POST", 500, None, False),
+        ("POST", 429, None, True),
+        ("POST", 503, None, True),
+        ("POST", 500, True, True),
+    ])
+def test_retry_on_status(method, status, idempotent, expected):
+    assert retry.RetryPolicy().retry_on_status(method, status, idempotent) is expected
+
+
+def test_retry_on_error_respects_idempotency():
+    policy = retry.RetryPolicy()
+    assert policy.retry_on_error("GET", requests.exceptions.ReadTimeout())
+    assert not policy.retry_on_error("POST", requests.exceptions.ReadTimeout())
+    assert policy.retry_on_error("POST", requests.exceptions.ConnectTimeout())
+
+    # Connection refused: the POST never reached the server
+    refused = urllib3.exceptions.NewConnectionError(None, "Connection refused")
+    assert policy.retry_on_error("POST", requests.exceptions.ConnectionError(
+        urllib3.exceptions.MaxRetryError(None, "/2/0/workspaces", refused)))
+    assert not policy.retry_on_error("POST", requests.exceptions.ConnectionError("connection reset"))
+
+
+def test_parse_retry_after():
+    now = time.time()
+    assert retry.parse_retry_after("7") == 7
+    assert retry.parse_retry_after(email.utils.formatdate(now + 30, usegmt=True), now=now) == pytest.approx(30, abs=1)
+    assert retry.parse_retry_after("soon") is None
+    assert retry.parse_retry_after(None) is None
+
+
+def test_backoff_prefers_retry_after_and_caps_it():
+    policy = retry.RetryPolicy(backoff_base=1, backoff_max=4, max_retry_after=10)
+    assert policy.backoff(1, retry_after="3") == 3
+    assert policy.backoff(1, retry_after="600") == 10
+    assert all(0 <= policy.backoff(10) <= 4 for _ in range(20))
+
+
+def test_circuit_breaker_opens_and_half_opens():
+    breaker = retry.CircuitBreaker("api.anaplan.com", failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(errors.CircuitOpenError):
+        breaker.before_request()
+
+    time.sleep(0.06)
+    breaker.before_request()
+    # only one trial call is allowed while half-open
+    with pytest.raises(errors.CircuitOpenError):
+        breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_transport_retries_transient_status(monkeypatch, reset_transport):
+    transport.configure({"retry": {"backoffBase": 0}})
+    statuses = [503, 429, 200]
+
+    def fake_request(method, uri, **kwargs):
+        return types.SimpleNamespace(status_code=statuses.pop(0), headers={"Retry-After": "0"}, close=lambda: None)
+
+    monkeypatch.setattr(transport.get_session(), "request", fake_request)
+    assert transport.get("https://api.anaplan.com/2/0/workspaces").status_code == 200
+    assert statuses == []
+
+
+def test_transport_raises_typed_connection_error(monkeypatch, reset_transport):
+    transport.configure({"retry": {"backoffBase": 0, "maxAttempts": 2}})
+    calls = []
+
+    def fake_request(method, uri, **kwargs):
+        calls.append(method)
+        raise requests.exceptions.ConnectionError("connection reset")
+
+    monkeypatch.setattr(transport.get_session(), "request", fake_request)
+    with pytest.raises(errors.AnaplanConnectionError):
+        transport.get("https://api.anaplan.com/2/0/workspaces")
+    # a POST that may have reached the server is not repeated
+    with pytest.raises(errors.AnaplanConnectionError):
+        transport.post("https://api.anaplan.com/2/0/workspaces")
+    assert calls == ["GET", "GET", "POST"]
+
+
+def test_half_open_trial_released_when_request_never_completes(monkeypatch, reset_transport):
+    retry.configure_breakers({"failureThreshold": 1, "resetTimeout": 0.05})
+    breaker = retry.get_breaker("api.anaplan.com")
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    def fake_request(method, uri, **kwargs):
+        raise ValueError("not a connection problem")
+
+    monkeypatch.setattr(transport.get_session(), "request", fake_request)
+    with pytest.raises(ValueError):
+        transport.get("https://api.anaplan.com/2/0/workspaces")
+
+    # the abandoned trial does not hold the circuit half-open forever
+    breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == "closed"
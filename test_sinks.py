@@ -0,0 +1,89 @@
+"""
+test cases for sinks
+"""
+
+import gzip
+import os
+import stat
+import types
+import pytest
+import anaplan_ops
+import sinks
+
+
+def test_file_sink_replaces_target_atomically(tmp_path, make_response):
+    target = tmp_path / "workspaces.json"
+    target.write_bytes(b"old")
+
+    res = make_response(chunks=[b'{"workspaces":', b' []}'])
+    assert sinks.stream_response(res, sinks.FileSink(str(target))) == 18
+
+    assert target.read_bytes() == b'{"workspaces": []}'
+    assert res.closed
+    assert [p.name for p in tmp_path.iterdir()] == ["workspaces.json"]
+
+
+def test_failed_stream_keeps_previous_file(tmp_path, make_response):
+    target = tmp_path / "workspaces.json"
+    target.write_bytes(b"old")
+
+    res = make_response(chunks=[b"partial", ConnectionError("reset")])
+    with pytest.raises(ConnectionError):
+        sinks.stream_response(res, sinks.FileSink(str(target)))
+
+    assert target.read_bytes() == b"old"
+    assert [p.name for p in tmp_path.iterdir()] == ["workspaces.json"]
+
+
+def test_file_sink_compresses(tmp_path):
+    target = tmp_path / "export.csv.gz"
+
+    with sinks.FileSink(str(target), compress=True) as sink:
+        sink.write(b"a,b\n" * 1000)
+
+    assert gzip.decompress(target.read_bytes()) == b"a,b\n" * 1000
+
+
+def test_file_sink_keeps_usual_file_modes(tmp_path, monkeypatch):
+    monkeypatch.setattr(sinks, "_UMASK", 0o022)
+    created = tmp_path / "workspaces.json"
+    with sinks.FileSink(str(created)) as sink:
+        sink.write(b"{}")
+    assert stat.S_IMODE(os.stat(created).st_mode) == 0o644
+
+    # A replaced file keeps its mode
+    os.chmod(created, 0o640)
+    with sinks.FileSink(str(created)) as sink:
+        sink.write(b"[]")
+    assert stat.S_IMODE(os.stat(created).st_mode) == 0o640
+
+
+def test_file_sink_creates_nothing_until_used(tmp_path):
+    sink = sinks.FileSink(str(tmp_path / "workspaces.json"))
+    assert list(tmp_path.iterdir()) == []
+
+    sink.write(b"{}")
+    sink.commit()
+    assert [p.name for p in tmp_path.iterdir()] == ["workspaces.json"]
+
+
+def test_get_workspaces_streams_into_sink(monkeypatch, make_response):
+    requested = {}
+    written = []
+
+    def get(uri, **kwargs):
+        requested.update(kwargs, uri=uri)
+        return make_response(chunks=[b"{}"])
+
+    def sink_factory():
+        sink = sinks.MemorySink()
+        written.append(sink)
+        return sink
+
+    monkeypatch.setattr(anaplan_ops.time, "sleep", lambda seconds: None)
+    anaplan_ops.get_workspaces("test", counter=2, delay=0, provider=types.SimpleNamespace(get=get),
+                               sink_factory=sink_factory, integration_uri="https://eu1a.app.anaplan.com/2/0/")
+
+    assert requested["stream"] is True
+    assert requested["uri"] == "https://eu1a.app.anaplan.com/2/0/workspaces"
+    assert [sink.getvalue() for sink in written] == [b"{}", b"{}"]
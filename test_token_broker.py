@@ -0,0 +1,43 @@
+"""
+test cases for token_broker
+"""
+
+import os
+import stat
+import threading
+import time
+import types
+import pytest
+import token_broker
+import token_provider
+
+
+@pytest.fixture
+def broker(tmp_path):
+    state = types.SimpleNamespace(client_id="default", access_token="warm-token", refresh_token="refresh",
+                                  expires_at=time.time() + 2000)
+    provider = token_provider.TokenProvider(state=state)
+    broker = token_broker.TokenBroker(socket_path=str(tmp_path / "broker.sock"), uri="https://us1a.app.anaplan.com/oauth/token",
+                                      database=str(tmp_path / "token.db3"), rotatable_token=False, default_provider=provider)
+
+    thread = threading.Thread(target=broker.serve_forever, daemon=True)
+    thread.start()
+    assert broker.ready.wait(5)
+    yield broker
+    broker.shutdown()
+    thread.join(5)
+
+
+def test_client_receives_warm_token(broker):
+    response = token_broker.get_token(broker.socket_path)
+    assert response["access_token"] == "warm-token"
+    assert response["expires_at"] > time.time()
+
+
+def test_unknown_client_returns_error(broker):
+    with pytest.raises(RuntimeError, match="No tokens stored"):
+        token_broker.get_token(broker.socket_path, client_id="unknown")
+
+
+def test_socket_is_owner_only(broker):
+    assert stat.S_IMODE(os.stat(broker.socket_path).st_mode) == 0o600
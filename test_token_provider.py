@@ -0,0 +1,99 @@
+"""
+test cases for token_provider
+"""
+
+import threading
+import time
+import types
+import pytest
+import token_provider
+import transport
+
+
+def make_provider(delay=0):
+    state = types.SimpleNamespace(access_token="token-0", refresh_token="refresh", expires_at=0)
+    calls = []
+
+    def refresh():
+        calls.append(1)
+        time.sleep(delay)
+        provider.set_tokens(access_token=f'token-{len(calls)}', expires_at=time.time() + 2000)
+
+    provider = token_provider.TokenProvider(state=state, refresh=refresh)
+    return provider, calls
+
+
+def test_concurrent_refreshes_are_collapsed():
+    provider, calls = make_provider(delay=0.2)
+    results = []
+
+    def worker():
+        results.append(provider.refresh(stale_token="token-0"))
+
+    threads = [threading.Thread(target=worker) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == ["token-1"] * 10
+
+
+def test_stale_token_is_not_refreshed_twice():
+    provider, calls = make_provider()
+    assert provider.refresh(stale_token="token-0") == "token-1"
+    assert provider.refresh(stale_token="token-0") == "token-1"
+    assert len(calls) == 1
+
+
+def test_expired_token_is_refreshed_on_get():
+    provider, calls = make_provider()
+    provider.set_tokens(access_token="old", expires_at=time.time() - 1)
+    assert provider.get_token() == "token-1"
+    assert provider.get_token() == "token-1"
+    assert len(calls) == 1
+
+
+def test_refresh_error_is_shared_with_waiters():
+    started = threading.Event()
+
+    def refresh():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("token endpoint down")
+
+    state = types.SimpleNamespace(access_token="token-0", refresh_token="refresh", expires_at=0)
+    provider = token_provider.TokenProvider(state=state, refresh=refresh)
+    errors = []
+
+    def waiter():
+        started.wait()
+        try:
+            provider.refresh()
+        except ValueError as err:
+            errors.append(err)
+
+    t = threading.Thread(target=waiter)
+    t.start()
+    with pytest.raises(ValueError):
+        provider.refresh()
+    t.join()
+    assert len(errors) == 1
+
+
+def test_request_replays_once_on_401(monkeypatch):
+    provider, calls = make_provider()
+    sent = []
+
+    def fake_request(method, uri, headers=None, **kwargs):
+        sent.append(headers['Authorization'])
+        status = 401 if headers['Authorization'] == 'Bearer token-0' else 200
+        return types.SimpleNamespace(status_code=status, close=lambda: None)
+
+    monkeypatch.setattr(transport, "request", fake_request)
+    res = provider.get("https://api.anaplan.com/2/0/workspaces")
+
+    assert res.status_code == 200
+    assert sent == ['Bearer token-0', 'Bearer token-1']
+    assert len(calls) == 1
@@ -0,0 +1,92 @@
+"""
+test cases for token_store
+"""
+
+import apsw
+import token_store
+
+
+def test_write_and_read_upserts_one_row(tmp_path):
+    store = token_store.TokenStore(str(tmp_path / "token.db3"))
+    store.write(client_id="client", refresh_token="first")
+    store.write(client_id="client", refresh_token="second")
+
+    assert store.read("client")["refresh_token"] == "second"
+    assert store.read()["client_id"] == "client"
+    assert store.connection.execute("select count(*) from tokens").fetchone()[0] == 1
+    assert store.read("missing") is None
+
+
+def test_database_uses_wal(tmp_path):
+    store = token_store.TokenStore(str(tmp_path / "token.db3"))
+    assert store.connection.execute("pragma journal_mode").fetchone()[0] == "wal"
+
+
+def test_reader_sees_writes_from_another_connection(tmp_path):
+    database = str(tmp_path / "token.db3")
+    writer = token_store.TokenStore(database)
+    reader = token_store.TokenStore(database)
+
+    writer.write(client_id="client", refresh_token="first")
+    assert reader.read("client")["refresh_token"] == "first"
+    writer.write(client_id="client", refresh_token="second")
+    assert reader.read("client")["refresh_token"] == "second"
+
+
+def test_legacy_table_is_migrated(tmp_path):
+    database = str(tmp_path / "token.db3")
+    connection = apsw.Connection(database)
+    connection.execute("create table anaplan (client_id, refresh_token)")
+    connection.execute("insert into anaplan values('client', 'legacy')")
+    connection.close()
+
+    store = token_store.TokenStore(database)
+    assert store.read()["refresh_token"] == "legacy"
+    assert store.connection.execute(
+        "select count(*) from sqlite_master where name='anaplan'").fetchone()[0] == 0
+
+
+def test_get_store_returns_one_store_per_file(tmp_path):
+    database = str(tmp_path / "token.db3")
+    assert token_store.get_store(database) is token_store.get_store(database)
+
+
+def test_clients_are_keyed_by_region_and_user(tmp_path):
+    store = token_store.TokenStore(str(tmp_path / "token.db3"))
+    store.write(client_id="client", refresh_token="us", region="us1a", user_name="loader")
+    store.write(client_id="client", refresh_token="eu", region="eu1", user_name="loader")
+    store.write(client_id="other", refresh_token="other")
+
+    assert store.read("client", region="us1a", user_name="loader")["refresh_token"] == "us"
+    assert store.read("client", region="eu1", user_name="loader")["refresh_token"] == "eu"
+    assert store.read("client") is None
+    assert len(store.read_all()) == 3
+
+
+def test_version_1_table_is_migrated(tmp_path):
+    database = str(tmp_path / "token.db3")
+    connection = apsw.Connection(database)
+    connection.execute("create table tokens (client_id text primary key, refresh_token text not null, updated_at real not null)")
+    connection.execute("insert into tokens values('client', 'v1', 123.0)")
+    connection.execute("pragma user_version=1")
+    connection.close()
+
+    store = token_store.TokenStore(database)
+    assert store.read("client") == {"client_id": "client", "region": "", "user_name": "",
+                                    "refresh_token": "v1", "access_token": None,
+                                    "expires_at": 0, "updated_at": 123.0}
+
+
+def test_lease_is_exclusive_until_released_or_expired(tmp_path):
+    store = token_store.TokenStore(str(tmp_path / "token.db3"))
+
+    assert store.acquire_lease("client", holder="a", duration=30)
+    assert not store.acquire_lease("client", holder="b", duration=30)
+    # The holder may renew its own lease
+    assert store.acquire_lease("client", holder="a", duration=30)
+
+    store.release_lease("client", holder="a")
+    assert store.acquire_lease("client", holder="b", duration=-1)
+
+    # An expired lease (its holder died) can be taken over
+    assert store.acquire_lease("client", holder="a", duration=30)
@@ -0,0 +1,41 @@
+"""
+test cases for transport
+"""
+
+import threading
+import transport
+
+
+def test_configure_overrides_defaults(reset_transport):
+    transport.configure({"transport": {"poolMaxsize": 4, "readTimeout": 30}})
+
+    adapter = transport.get_adapter()
+    assert adapter._pool_maxsize == 4
+    assert transport.get_timeout() == (transport.DEFAULT_SETTINGS["connectTimeout"], 30)
+
+
+def test_threads_share_one_adapter(reset_transport):
+    transport.configure()
+    sessions = []
+
+    def worker():
+        sessions.append(transport.get_session())
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # Each thread has its own session but every session uses the shared pool
+    assert len({id(s) for s in sessions}) == 3
+    assert all(s.get_adapter("https://api.anaplan.com") is transport.get_adapter() for s in sessions)
+
+
+def test_reconfigure_remounts_session(reset_transport):
+    transport.configure()
+    session = transport.get_session()
+
+    transport.configure({"transport": {"poolMaxsize": 2}})
+    assert transport.get_session() is not session
+    assert transport.get_session().get_adapter("https://api.anaplan.com")._pool_maxsize == 2
@@ -0,0 +1,131 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:        17 Oct 2026
+# @author:        Quinlan Eddy
+# Description:    Local token broker serving warm access tokens over a Unix socket
+# ===============================================================================
+
+
+import os
+import sys
+import json
+import logging
+import socket
+import socketserver
+import threading
+import anaplan_oauth
+import token_provider
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+
+# ===  Broker request handler  ===
+# One JSON request per line: `{"client_id": "<optional>", "region": "", "user_name": ""}`.
+# One JSON response per line: `{"access_token": "...", "expires_at": 0.0}` or `{"error": "..."}`
+class _token_request_handler (socketserver.StreamRequestHandler):
+   def handle(self):
+      for line in self.rfile:
+         try:
+            request = json.loads(line or b"{}")
+            provider = self.server.broker.provider_for(
+               client_id=request.get("client_id"),
+               region=request.get("region", ""),
+               user_name=request.get("user_name", ""))
+            token = provider.get_token()
+            response = {"access_token": token, "expires_at": provider.expires_at}
+         except Exception as err:
+            logger.error(f'{err} in function "{sys._getframe().f_code.co_name}"')
+            response = {"error": str(err)}
+
+         self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+         self.wfile.flush()
+
+
+class _token_server (socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+   daemon_threads = True
+
+
+# ===  Token broker  ===
+# Keeps access tokens warm in memory and hands them to local processes. The client set up on
+# the command line is served by `default_provider` (kept fresh by `refresh_token_thread`);
+# any other client in the token database gets its own provider on first request
+class TokenBroker:
+    def __init__(self, socket_path, uri, database, rotatable_token, default_provider=token_provider.default_provider,
+                 lease_duration=30, wait_timeout=None):
+        self.socket_path = socket_path
+        self.uri = uri
+        self.database = database
+        self.rotatable_token = rotatable_token
+        self.default_provider = default_provider
+        self.lease_duration = lease_duration
+        self.wait_timeout = wait_timeout
+        self._providers = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self.ready = threading.Event()
+
+    # Return the provider for a client, creating it on first use
+    def provider_for(self, client_id=None, region="", user_name=""):
+        default_client = getattr(self.default_provider.state, "client_id", None)
+        if client_id is None or (client_id == default_client and not region and not user_name):
+            return self.default_provider
+
+        key = (client_id, region, user_name)
+        with self._lock:
+            if key not in self._providers:
+                self._providers[key] = self._create_provider(*key)
+            return self._providers[key]
+
+    def _create_provider(self, client_id, region, user_name):
+        return anaplan_oauth.client_provider(self.uri, self.database, client_id=client_id,
+                                             rotatable_token=self.rotatable_token, region=region, user_name=user_name,
+                                             lease_duration=self.lease_duration, wait_timeout=self.wait_timeout)
+
+    # Bind the socket (readable by the current user only) and serve until `shutdown()`
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        # The socket is created owner-only: a `chmod` after binding would leave a window in
+        # which other local users could connect and read tokens
+        umask = os.umask(0o177)
+        try:
+            self._server = _token_server(self.socket_path, _token_request_handler)
+        finally:
+            os.umask(umask)
+        self._server.broker = self
+        self.ready.set()
+
+        logger.info(f'Token broker listening on {self.socket_path}')
+        print(f'Token broker listening on {self.socket_path}')
+        try:
+            self._server.serve_forever()
+        finally:
+            self.ready.clear()
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+
+
+# ===  Broker client  ===
+# Request an access token from a running broker. Returns `{"access_token", "expires_at"}`
+def get_token(socket_path, client_id=None, region="", user_name="", timeout=5):
+    request = {"client_id": client_id, "region": region, "user_name": user_name}
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(socket_path)
+        connection.sendall(json.dumps(request).encode("utf-8") + b"\n")
+
+        with connection.makefile("rb") as response_file:
+            response = json.loads(response_file.readline())
+
+    if "error" in response:
+        raise RuntimeError(f'Token broker error: {response["error"]}')
+    return response
@@ -0,0 +1,159 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Thread-safe access token provider shared by all worker threads
+# ===============================================================================
+
+
+import logging
+import threading
+import time
+import globals
+import metrics
+import transport
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+TOKEN_REFRESHES = metrics.REGISTRY.counter("anaplan_token_refreshes_total", "Access token refreshes by outcome", ("result",))
+TOKEN_REFRESH_LATENCY = metrics.REGISTRY.histogram("anaplan_token_refresh_duration_seconds", "Latency of access token refreshes")
+
+
+# ===  Token provider  ===
+# Owns the access token for one OAuth client. Workers ask for the current token on every
+# request; concurrent refreshes are collapsed into a single in-flight call.
+# `state` is any object with `access_token`, `refresh_token` and `expires_at` attributes
+# (by default the `globals.Auth` dataclass) and is only ever written under the provider lock.
+# `refresh` is a callable that requests new tokens and stores them with `set_tokens()`.
+class TokenProvider:
+    def __init__(self, state=globals.Auth, refresh=None, expiry_skew=30):
+        self.state = state
+        self.refresh_function = refresh
+        self.expiry_skew = expiry_skew
+        self._lock = threading.RLock()
+        self._refreshed = threading.Condition(self._lock)
+        self._refreshing = False
+        self._last_error = None
+        self.refreshed_at = None
+
+    # Set the callable used to refresh tokens
+    def configure(self, refresh):
+        with self._lock:
+            self.refresh_function = refresh
+
+    # Store newly issued tokens
+    def set_tokens(self, access_token, expires_at, refresh_token=None):
+        with self._lock:
+            self.state.access_token = access_token
+            self.state.expires_at = expires_at
+            self.refreshed_at = time.time()
+            if refresh_token is not None:
+                self.state.refresh_token = refresh_token
+
+    @property
+    def expires_at(self):
+        with self._lock:
+            return self.state.expires_at
+
+    # Return the access token if it is present and not about to expire, otherwise `None`.
+    # Never blocks on a refresh, so it is safe to call from an event loop
+    def current_token(self):
+        with self._lock:
+            token = getattr(self.state, "access_token", None)
+            expires_at = self.state.expires_at
+
+        if not token or (expires_at and expires_at - self.expiry_skew <= time.time()):
+            return None
+        return token
+
+    # Return a current access token, refreshing first if it is missing or about to expire
+    def get_token(self):
+        token = self.current_token()
+        if token is None:
+            with self._lock:
+                stale_token = getattr(self.state, "access_token", None)
+            return self.refresh(stale_token=stale_token)
+        return token
+
+    # Refresh the access token. When `stale_token` is given and another thread has already
+    # replaced it, the newer token is returned without another call to the token endpoint.
+    # If a refresh is already in flight, wait for it and share its result.
+    def refresh(self, stale_token=None):
+        with self._lock:
+            current = getattr(self.state, "access_token", None)
+            if stale_token is not None and current and current != stale_token:
+                return current
+
+            if self._refreshing:
+                while self._refreshing:
+                    self._refreshed.wait()
+                if self._last_error is not None:
+                    raise self._last_error
+                return self.state.access_token
+
+            if self.refresh_function is None:
+                raise RuntimeError("Token provider has no refresh function configured")
+
+            self._refreshing = True
+            self._last_error = None
+
+        error = None
+        start = time.perf_counter()
+        try:
+            self.refresh_function()
+        except BaseException as err:
+            error = err
+            raise
+        finally:
+            TOKEN_REFRESH_LATENCY.observe(time.perf_counter() - start)
+            TOKEN_REFRESHES.inc("failure" if error is not None else "success")
+            with self._lock:
+                self._refreshing = False
+                self._last_error = error
+                self._refreshed.notify_all()
+
+        with self._lock:
+            return self.state.access_token
+
+    # Issue an authenticated request. On `401 Unauthorized` the token is refreshed once
+    # and the request replayed
+    def request(self, method, uri, headers=None, **kwargs):
+        token = self.get_token()
+        res = transport.request(method, uri, headers=self._auth_headers(headers, token), **kwargs)
+
+        if res.status_code == 401:
+            logger.info(f'Access token rejected by {uri}, refreshing and replaying the request')
+            res.close()
+            token = self.refresh(stale_token=token)
+            res = transport.request(method, uri, headers=self._auth_headers(headers, token), **kwargs)
+
+        return res
+
+    def get(self, uri, **kwargs):
+        return self.request("GET", uri, **kwargs)
+
+    def post(self, uri, **kwargs):
+        return self.request("POST", uri, **kwargs)
+
+    def put(self, uri, **kwargs):
+        return self.request("PUT", uri, **kwargs)
+
+    @staticmethod
+    def _auth_headers(headers, token):
+        auth_headers = dict(headers or {})
+        auth_headers['Authorization'] = 'Bearer ' + token
+        return auth_headers
+
+
+# Provider for the client configured on the command line
+default_provider = TokenProvider()
+
+
+# Seconds since the default provider last received tokens, and until its access token expires
+metrics.REGISTRY.gauge("anaplan_token_age_seconds", "Seconds since the access token was last issued",
+                       function=lambda: time.time() - default_provider.refreshed_at
+                       if default_provider.refreshed_at is not None else None)
+metrics.REGISTRY.gauge("anaplan_token_expires_in_seconds", "Seconds until the access token expires",
+                       function=lambda: default_provider.expires_at - time.time() if default_provider.expires_at else None)
@@ -0,0 +1,250 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:        17 Oct 2026
+# @author:        Quinlan Eddy
+# Description:    Persistent SQLite token store shared by all threads in a process
+# ===============================================================================
+
+
+import os
+import logging
+import threading
+import time
+import socket
+import apsw
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+# Schema version stored in `pragma user_version`
+SCHEMA_VERSION = 4
+
+_COLUMNS = "client_id, region, user_name, refresh_token, access_token, expires_at, updated_at"
+
+
+def _row_to_dict(row):
+    return dict(zip(("client_id", "region", "user_name", "refresh_token", "access_token", "expires_at", "updated_at"), row))
+
+
+# ===  SQLite database  ===
+# Holds one long-lived connection per process to a SQLite database. The database runs in
+# WAL mode so readers in other processes are never blocked by a writer, and writers wait
+# (up to `busy_timeout` milliseconds) instead of failing with `SQLITE_BUSY`.
+# Subclasses bring the schema up to date in `_migrate()`
+class Database:
+    def __init__(self, database, busy_timeout=5000):
+        self.database = database
+        self.busy_timeout = busy_timeout
+        self._lock = threading.RLock()
+        self._connection = None
+        self._pid = None
+
+    # Open (or re-open after a fork) the connection and bring the schema up to date
+    @property
+    def connection(self):
+        with self._lock:
+            if self._connection is None or self._pid != os.getpid():
+                connection = apsw.Connection(self.database)
+                connection.setbusytimeout(self.busy_timeout)
+                connection.execute("pragma journal_mode=wal")
+                connection.execute("pragma synchronous=normal")
+                self._connection = connection
+                self._pid = os.getpid()
+                self._migrate()
+            return self._connection
+
+    # Run `function(connection)` in a single write transaction. `begin immediate` takes the
+    # write lock up front so concurrent writers queue on the busy timeout rather than
+    # deadlocking on a read-to-write lock upgrade
+    def transaction(self, function):
+        with self._lock:
+            connection = self.connection
+            connection.execute("begin immediate")
+            try:
+                result = function(connection)
+            except BaseException:
+                connection.execute("rollback")
+                raise
+            connection.execute("commit")
+            return result
+
+    def _migrate(self):
+        pass
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+
+# ===  Token store  ===
+# Tokens are stored as passed in; encryption is the caller's responsibility.
+class TokenStore(Database):
+    def _migrate(self):
+        version = self._connection.execute("pragma user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+
+        def migrate(connection):
+            # Another process may have migrated while this one waited for the write lock
+            version = connection.execute("pragma user_version").fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                return
+
+            # Version 2: tokens keyed by client, region and user so one database can serve
+            # many tenants. Version 1 rows (keyed by client only) are copied across
+            if version < 2:
+                connection.execute("""
+                    create table if not exists tokens_v2 (
+                        client_id text not null,
+                        region text not null default '',
+                        user_name text not null default '',
+                        refresh_token text not null,
+                        updated_at real not null,
+                        primary key (client_id, region, user_name)
+                    )""")
+
+                previous = connection.execute(
+                    "select name from sqlite_master where type='table' and name in ('tokens', 'anaplan')").fetchall()
+                for (table,) in previous:
+                    updated_at = "updated_at" if table == "tokens" else "$now"
+                    connection.execute(f"""
+                        insert or replace into tokens_v2 (client_id, refresh_token, updated_at)
+                        select client_id, refresh_token, {updated_at} from {table} where client_id is not null""",
+                        {"now": time.time()})
+                    connection.execute(f"drop table {table}")
+                    logger.info(f'Migrated tokens from the `{table}` table')
+
+                connection.execute("alter table tokens_v2 rename to tokens")
+                connection.execute("create index if not exists tokens_updated_at on tokens (updated_at)")
+
+            # Version 3: persist the access token so other processes can reuse it, and
+            # add refresh leases so only one process refreshes a client at a time
+            if version < 3:
+                connection.execute("alter table tokens add column access_token text")
+                connection.execute("alter table tokens add column expires_at real not null default 0")
+                connection.execute("""
+                    create table if not exists refresh_leases (
+                        client_id text not null,
+                        region text not null default '',
+                        user_name text not null default '',
+                        holder text not null,
+                        expires_at real not null,
+                        primary key (client_id, region, user_name)
+                    )""")
+
+            # Version 4: token buckets for rate limits shared between processes
+            if version < 4:
+                connection.execute("""
+                    create table if not exists rate_buckets (
+                        name text primary key,
+                        tokens real not null,
+                        updated_at real not null
+                    )""")
+
+            connection.execute(f"pragma user_version={SCHEMA_VERSION}")
+
+        self.transaction(migrate)
+
+    # Return `{"client_id", "region", "user_name", "refresh_token", "access_token",
+    # "expires_at", "updated_at"}` for the given client, or the most recently updated client when no `client_id` is given.
+    # `None` if not found
+    def read(self, client_id=None, region="", user_name=""):
+        with self._lock:
+            if client_id is None:
+                row = self.connection.execute(
+                    f"select {_COLUMNS} from tokens order by updated_at desc limit 1").fetchone()
+            else:
+                row = self.connection.execute(
+                    f"select {_COLUMNS} from tokens where client_id=$client_id and region=$region and user_name=$user_name",
+                    {"client_id": client_id, "region": region, "user_name": user_name}).fetchone()
+
+        return None if row is None else _row_to_dict(row)
+
+    # Return every stored client, most recently updated first
+    def read_all(self):
+        with self._lock:
+            rows = self.connection.execute(
+                f"select {_COLUMNS} from tokens order by updated_at desc").fetchall()
+        return [_row_to_dict(row) for row in rows]
+
+    # Insert or update the token row for the given client atomically
+    def write(self, client_id, refresh_token, region="", user_name="", access_token=None, expires_at=0):
+        values = {"client_id": client_id, "region": region, "user_name": user_name,
+                  "refresh_token": refresh_token, "access_token": access_token,
+                  "expires_at": expires_at or 0, "now": time.time()}
+
+        self.transaction(lambda connection: connection.execute("""
+            insert into tokens (client_id, region, user_name, refresh_token, access_token, expires_at, updated_at)
+            values ($client_id, $region, $user_name, $refresh_token, $access_token, $expires_at, $now)
+            on conflict (client_id, region, user_name) do update set
+                refresh_token=excluded.refresh_token,
+                access_token=excluded.access_token,
+                expires_at=excluded.expires_at,
+                updated_at=excluded.updated_at""", values))
+
+    # Try to take the refresh lease for a client. Succeeds if nobody holds it, the
+    # current lease has expired (its holder died) or `holder` already holds it
+    def acquire_lease(self, client_id, holder, duration, region="", user_name=""):
+        values = {"client_id": client_id, "region": region, "user_name": user_name,
+                  "holder": holder, "now": time.time(), "expires_at": time.time() + duration}
+
+        def acquire(connection):
+            row = connection.execute("""
+                select holder, expires_at from refresh_leases
+                where client_id=$client_id and region=$region and user_name=$user_name""", values).fetchone()
+            if row is not None and row[0] != holder and row[1] > values["now"]:
+                return False
+
+            connection.execute("""
+                insert or replace into refresh_leases (client_id, region, user_name, holder, expires_at)
+                values ($client_id, $region, $user_name, $holder, $expires_at)""", values)
+            return True
+
+        return self.transaction(acquire)
+
+    # Release a lease held by `holder`
+    def release_lease(self, client_id, holder, region="", user_name=""):
+        self.transaction(lambda connection: connection.execute("""
+            delete from refresh_leases
+            where client_id=$client_id and region=$region and user_name=$user_name and holder=$holder""",
+            {"client_id": client_id, "region": region, "user_name": user_name, "holder": holder}))
+
+    # Reserve `count` tokens from the bucket `name` (refilled at `rate` per second up to
+    # `burst`). The balance may go negative; the returned delay is how long the caller must
+    # wait before using the reservation
+    def reserve_tokens(self, name, rate, burst, count=1):
+        def reserve(connection):
+            now = time.time()
+            row = connection.execute(
+                "select tokens, updated_at from rate_buckets where name=$name", {"name": name}).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            tokens -= count
+
+            connection.execute("""
+                insert or replace into rate_buckets (name, tokens, updated_at)
+                values ($name, $tokens, $now)""", {"name": name, "tokens": tokens, "now": now})
+            return max(0.0, -tokens / rate)
+
+        return self.transaction(reserve)
+
+# ===  Store registry  ===
+# One store (and therefore one connection) per database file per process
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(database):
+    key = os.path.abspath(database)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = TokenStore(database)
+        return _stores[key]
+
+
+# ===  Lease holder  ===
+# Identifies this process and thread when holding a refresh lease
+def lease_holder():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
@@ -0,0 +1,278 @@
+# ===============================================================================
+# Created:        17 Oct 2026
+# Updated:        17 Oct 2026
+# @author:        Quinlan Eddy
+# Description:    Shared, pooled HTTP transport for all Anaplan API calls
+# ===============================================================================
+
+
+import time
+import logging
+import threading
+import functools
+import urllib.parse
+import requests
+import requests.adapters
+import errors
+import endpoints
+import metrics
+import retry
+import rate_limiter
+import response_cache
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+
+# === Transport defaults ===
+# Overridden by the `transport` block in `settings.json`
+DEFAULT_SETTINGS = {
+    "poolConnections": 10,   # Number of per-host connection pools to cache
+    "poolMaxsize": 20,       # Maximum keep-alive connections kept per host
+    "poolBlock": False,      # Block (rather than open a throwaway connection) when a pool is exhausted
+    "connectTimeout": 5,     # Seconds to establish the TCP + TLS connection
+    "readTimeout": 60        # Seconds to wait for the server between bytes
+}
+
+_lock = threading.Lock()
+_settings = dict(DEFAULT_SETTINGS)
+_adapter = None
+_retry_policy = retry.RetryPolicy()
+_local = threading.local()
+
+
+# === Configure the transport ===
+# Apply the `uris` / `endpointSelection`, `transport`, `retry`, `circuitBreaker`, `rateLimits`
+# and `responseCache` settings and reset the shared connection pool
+def configure(settings=None):
+    global _adapter, _retry_policy
+
+    settings = settings or {}
+    transport_settings = settings.get("transport", {})
+
+    # The other settings read one URI per service from `uris`
+    endpoints.configure(settings)
+    settings = {**settings, "uris": endpoints.primary_uris(settings)}
+
+    with _lock:
+        _settings.clear()
+        _settings.update(DEFAULT_SETTINGS)
+        _settings.update(transport_settings)
+        _retry_policy = retry.RetryPolicy.from_settings(settings.get("retry", {}))
+        retry.configure_breakers(settings.get("circuitBreaker", {}))
+
+        # Drop the existing pool so the new sizes take effect
+        if _adapter is not None:
+            _adapter.close()
+        _adapter = None
+
+    rate_limiter.configure(settings)
+    response_cache.configure(settings)
+
+    # Each thread mounts the new adapter on its next request (see `get_session`)
+    logger.info(f'Transport configured with pool size {_settings["poolMaxsize"]} per host')
+
+
+# === Shared adapter ===
+# A single urllib3 pool manager is shared by every thread so that
+# keep-alive connections are reused across the refresh and worker threads
+def get_adapter():
+    global _adapter
+
+    with _lock:
+        if _adapter is None:
+            _adapter = requests.adapters.HTTPAdapter(
+                pool_connections=_settings["poolConnections"],
+                pool_maxsize=_settings["poolMaxsize"],
+                pool_block=_settings["poolBlock"])
+        return _adapter
+
+
+# === Per-thread session ===
+# `requests.Session` mutates cookies and other state per call, so each thread
+# gets its own session mounted on the shared (thread-safe) adapter
+def get_session():
+    adapter = get_adapter()
+    session = getattr(_local, "session", None)
+
+    if session is None or getattr(_local, "adapter", None) is not adapter:
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _local.session = session
+        _local.adapter = adapter
+
+    return session
+
+
+# === Current settings ===
+def get_settings():
+    with _lock:
+        return dict(_settings)
+
+
+# === Current retry policy ===
+def get_retry_policy():
+    with _lock:
+        return _retry_policy
+
+
+# === Default timeout ===
+def get_timeout():
+    with _lock:
+        return (_settings["connectTimeout"], _settings["readTimeout"])
+
+
+# === Longest request ===
+# Seconds one `request` call may take with every attempt running into the connect and read
+# timeouts and every retry waiting as long as the policy allows. The read timeout applies
+# between bytes, so this bounds a stalled request rather than a slowly trickling one
+def max_request_time():
+    policy = get_retry_policy()
+    connect_timeout, read_timeout = get_timeout()
+    return (policy.max_attempts * (connect_timeout + read_timeout) +
+            (policy.max_attempts - 1) * max(policy.max_retry_after, policy.backoff_max))
+
+
+# === Issue a request over the shared pool ===
+# Transient failures are retried according to the retry policy (see `retry.RetryPolicy`);
+# pass `idempotent=True` for a POST that is safe to repeat. Calls to a host whose circuit
+# is open fail fast with `errors.CircuitOpenError`, and every attempt first waits for the
+# client-side rate limit of its endpoint family (see `rate_limiter`). Connection failures
+# that survive the retries raise `errors.AnaplanConnectionError`; the final response is
+# returned whatever its status code (see `raise_for_status`). Request bodies must be
+# replayable (not streams). When the response cache is enabled, GET requests are served
+# from it where possible (see `response_cache.ResponseCache`). Requests to a service with
+# several candidate URIs go to the selected one (see `endpoints`)
+def request(method, uri, idempotent=None, **kwargs):
+    cache = response_cache.get_cache()
+    if cache is not None and method.upper() == "GET":
+        return cache.get(functools.partial(_send, idempotent=idempotent), uri, **kwargs)
+    return _send(method, uri, idempotent=idempotent, **kwargs)
+
+
+def _send(method, uri, idempotent=None, **kwargs):
+    kwargs.setdefault("timeout", get_timeout())
+    policy = get_retry_policy()
+    attempt = 0
+
+    while True:
+        attempt += 1
+
+        # Wait for the endpoint family's rate limit (retries count against it too)
+        rate_limiter.acquire(uri)
+
+        # Each attempt goes to the selected regional endpoint, so retries fail over
+        target = endpoints.resolve(uri)
+        breaker = retry.get_breaker(urllib.parse.urlsplit(target).netloc)
+        breaker.before_request()
+
+        start = time.perf_counter()
+        metrics.IN_FLIGHT.inc()
+        try:
+            res = get_session().request(method, target, **kwargs)
+        except requests.exceptions.RequestException as err:
+            metrics.observe_request(method, target, "error", time.perf_counter() - start)
+            breaker.record_failure()
+            if attempt < policy.max_attempts and policy.retry_on_error(method, err, idempotent):
+                metrics.observe_retry(method, target)
+                delay = policy.backoff(attempt)
+                logger.warning(f'{err} on {method} {uri}; retrying in {delay:.1f} seconds (attempt {attempt})')
+                time.sleep(delay)
+                continue
+            raise errors.AnaplanConnectionError(f'{err} on {method} {uri}') from err
+        except BaseException:
+            breaker.release()
+            raise
+        finally:
+            metrics.IN_FLIGHT.dec()
+
+        metrics.observe_request(method, target, res.status_code, time.perf_counter() - start,
+                                sent=_request_size(res), received=_response_size(res))
+
+        if res.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+        if attempt < policy.max_attempts and policy.retry_on_status(method, res.status_code, idempotent):
+            delay = policy.backoff(attempt, retry_after=res.headers.get("Retry-After"))
+            logger.warning(f'{res.status_code} on {method} {uri}; retrying in {delay:.1f} seconds (attempt {attempt})')
+            metrics.observe_retry(method, target)
+            res.close()
+            time.sleep(delay)
+            continue
+
+        return res
+
+
+# Body sizes for the metrics. A streamed response that is not read yet counts its
+# `Content-Length` (bytes on the wire), if the server sent one
+def _request_size(res):
+    body = getattr(getattr(res, "request", None), "body", None)
+    return len(body) if isinstance(body, (bytes, str)) else 0
+
+
+def _response_size(res):
+    length = (getattr(res, "headers", None) or {}).get("Content-Length")
+    if length is not None and length.isdigit():
+        return int(length)
+    content = getattr(res, "_content", None)
+    return len(content) if isinstance(content, bytes) else 0
+
+
+# === Pool utilization ===
+# Connections checked out of the shared pool, per host. urllib3 keeps up to `poolMaxsize`
+# slots per host in a queue; slots not in the queue are in use
+def pool_connections_in_use():
+    with _lock:
+        adapter = _adapter
+        maxsize = _settings["poolMaxsize"]
+    if adapter is None:
+        return {}
+
+    pools = adapter.poolmanager.pools
+    in_use = {}
+    for key in pools.keys():
+        pool = pools.get(key)
+        if pool is not None and pool.pool is not None:
+            in_use[(pool.host,)] = maxsize - pool.pool.qsize()
+    return in_use
+
+
+metrics.REGISTRY.gauge("anaplan_pool_connections_in_use", "Pooled connections checked out, per host", ("host",),
+                       function=pool_connections_in_use)
+metrics.REGISTRY.gauge("anaplan_pool_max_connections", "Keep-alive connections kept per host",
+                       function=lambda: get_settings()["poolMaxsize"])
+
+
+# === Check a response ===
+# Raise `errors.AnaplanHTTPError` for unfavorable status codes
+def raise_for_status(res):
+    if res.status_code >= 400:
+        raise errors.AnaplanHTTPError(status=res.status_code, uri=res.url, details=res.text)
+    return res
+
+
+def get(uri, **kwargs):
+    return request("GET", uri, **kwargs)
+
+
+def post(uri, **kwargs):
+    return request("POST", uri, **kwargs)
+
+
+def put(uri, **kwargs):
+    return request("PUT", uri, **kwargs)
+
+
+# === Close all pooled connections ===
+def close():
+    global _adapter
+
+    with _lock:
+        if _adapter is not None:
+            _adapter.close()
+        _adapter = None
+    _local.__dict__.clear()
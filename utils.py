@@ -1,6 +1,6 @@
 # ===============================================================================
 # Created:        3 Feb 2023
-# Updated:
+# Updated:        17 Oct 2026
 # @author:        Quinlan Eddy
 # Description:    Module for generic Python operations
 # ===============================================================================
@@ -63,5 +63,17 @@ def read_cli_arguments(arg_list: list[str] | None = None):
                         type=str, help='Authorization Code')
     parser.add_argument('--secret', action='store',
                         type=str, help='Client Secret')
+    parser.add_argument('--refresh_all', action='store_true',
+                        help='Refresh the tokens of every client in the token database')
+    parser.add_argument('--register_clients', action='store',
+                        type=str, help='Register every client in a JSON file of `{"client_id", "region", "user_name"}` objects')
+    parser.add_argument('--broker', action='store_true',
+                        help='Run as a token broker serving access tokens over a local Unix socket')
+    parser.add_argument('--crawl', action='store_true',
+                        help='Crawl the metadata of every workspace and model into `inventory.json`')
+    parser.add_argument('--sync_index', action='store_true',
+                        help='Update the local metadata index used to resolve names to IDs')
+    parser.add_argument('--full', action='store_true',
+                        help='With `--sync_index`, re-list every model instead of only the changed ones')
     args = parser.parse_args(arg_list)
     return args